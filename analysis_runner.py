@@ -0,0 +1,74 @@
+import time
+
+from instrumentation import add_count, add_time, phase, progress, timings_enabled
+
+
+def run_analyzers(store, analyzers):
+    """
+    Прогоняет несколько анализов за один перебор заказов
+
+    Каждый анализ - объект с атрибутом sort_keys (нужен ли ему порядок номеров
+    заказов, как groupby в pandas), методом add(номер заказа, позиция, коды основных
+    товаров, коды допродаж) и методом result(), возвращающим агрегаты. Товары заказа
+    разделяются на основные и допродажи один раз и передаются всем анализам.
+
+    Если хотя бы одному анализу нужен порядок номеров, заказы перебираются в нем,
+    а остальные анализы восстанавливают порядок первого появления по позициям.
+
+    С --progress или --timings перебор дополнительно выводит прогресс и замеряет
+    время группировки строк и подсчета; без них работает обычный цикл.
+
+    Args:
+        store (OrderStore): Загруженные заказы (или OrderStream)
+        analyzers (list): Анализы
+
+    Returns:
+        list: Агрегаты каждого анализа в том же порядке
+    """
+    sort_keys = any(analyzer.sort_keys for analyzer in analyzers)
+    adders = [analyzer.add for analyzer in analyzers]
+    orders = store.iter_orders(sort_keys, positions=True)
+
+    reporter = progress(store.num_orders)
+    if reporter is None and not timings_enabled():
+        for order_key, position, main_ids, upsell_ids in orders:
+            for add in adders:
+                add(order_key, position, main_ids, upsell_ids)
+    else:
+        _run_instrumented(orders, adders, reporter)
+
+    with phase('aggregate'):
+        return [analyzer.result() for analyzer in analyzers]
+
+
+def _run_instrumented(orders, adders, reporter):
+    """
+    Тот же перебор с прогрессом и раздельным временем группировки строк по заказам
+    (group) и подсчета анализов (aggregate)
+    """
+    clock = time.perf_counter
+    group_seconds = 0.0
+    aggregate_seconds = 0.0
+    count = 0
+    orders = iter(orders)
+
+    while True:
+        started = clock()
+        order = next(orders, None)
+        grouped = clock()
+        group_seconds += grouped - started
+        if order is None:
+            break
+
+        for add in adders:
+            add(*order)
+        aggregate_seconds += clock() - grouped
+        count += 1
+        if reporter is not None:
+            reporter.update()
+
+    if reporter is not None:
+        reporter.finish()
+    add_time('group', group_seconds)
+    add_time('aggregate', aggregate_seconds)
+    add_count('orders', count)
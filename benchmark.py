@@ -0,0 +1,228 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from generate_orders import generate_orders
+
+# Размеры файлов по умолчанию (строк); эталонный прогон для сравнения версий - --sizes 10k,1m,10m
+DEFAULT_SIZES = [10_000, 1_000_000]
+
+# Параметры синтетических заказов по умолчанию (как в generate_orders)
+DEFAULT_DATA = {'items_per_order': 3, 'upsell_rate': 0.3, 'packaging_rate': 0.1, 'catalog_size': 500}
+
+# Каталог со сгенерированными файлами (переиспользуются между запусками)
+DATA_DIR = 'bench_data'
+
+# Замеры: имя -> (анализ, параметры)
+CASES = {
+    'index': ('upsells', {}),
+    'category': ('category', {}),
+    'combo 2-2': ('combo', {'min_combo_size': 2, 'max_combo_size': 2}),
+    'combo 2-3': ('combo', {'min_combo_size': 2, 'max_combo_size': 3}),
+    'combo 3-': ('combo', {'min_combo_size': 3, 'max_combo_size': None}),
+    'combo 2-': ('combo', {'min_combo_size': 2, 'max_combo_size': None}),
+    'top': ('top', {'top_n': 10}),
+}
+
+
+def parse_size(text):
+    """Размер вида 10000, 10k или 1m"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def dataset(rows, seed=1, data=None):
+    """
+    Путь к синтетическому файлу заказов (создается при первом обращении)
+
+    Все параметры генератора входят в имя файла, поэтому файлы с разными
+    параметрами не подменяют друг друга.
+
+    Args:
+        rows (int): Количество строк
+        seed (int): Начальное значение генератора
+        data (dict): Параметры generate_orders (items_per_order, upsell_rate,
+            packaging_rate, catalog_size); по умолчанию DEFAULT_DATA
+    """
+    data = dict(DEFAULT_DATA, **(data or {}))
+    os.makedirs(DATA_DIR, exist_ok=True)
+    name = (f"orders_{rows}_items{data['items_per_order']}_upsell{data['upsell_rate']:g}"
+            f"_packaging{data['packaging_rate']:g}_catalog{data['catalog_size']}_seed{seed}.csv")
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        print(f"Генерирую {rows} строк в '{path}'...")
+        generate_orders(path + '.tmp', rows, seed=seed, **data)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def _measure(path, analysis, params, memory=False):
+    """
+    Один замер в отдельном процессе: разбор файла без кэша и анализ
+
+    Выполняется во временном каталоге (туда пишутся CSV отчеты), вывод анализа отбрасывается.
+    С memory = True анализ (без разбора файла) выполняется под tracemalloc, и в результат
+    добавляется пик памяти, выделенной самим анализом, - в основном его агрегатами.
+    Время анализа при этом больше обычного.
+    """
+    from category_analysis import analyze_category_upsells
+    from combo_analysis import analyze_combo_upsells
+    from index import analyze_upsells
+    from instrumentation import peak_memory_mb
+    from order_loader import load_orders
+    from top_upsells_by_category import analyze_top_upsells_by_category
+
+    analyses = {
+        'upsells': analyze_upsells,
+        'category': analyze_category_upsells,
+        'combo': analyze_combo_upsells,
+        'top': analyze_top_upsells_by_category,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='upsell-bench-') as directory:
+        os.chdir(directory)
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            store = load_orders(path, use_cache=False)
+            if memory:
+                tracemalloc.start()
+            loaded = time.perf_counter()
+            analyses[analysis](store=store, **params)
+            finished = time.perf_counter()
+            if memory:
+                analysis_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    result = {
+        'rows': store.num_rows,
+        'load_seconds': loaded - started,
+        'analysis_seconds': finished - loaded,
+        'peak_rss_mb': peak_memory_mb(),
+    }
+    if memory:
+        result['analysis_peak_mb'] = analysis_peak / (1024 * 1024)
+    return result
+
+
+def run_case(path, name, repeat=1, memory=False):
+    """
+    Замеряет один анализ, каждый повтор в новом процессе (чтобы пиковая память не копилась)
+
+    Returns:
+        dict: Лучшее время из повторов, строк в секунду и пиковая память
+            (с memory = True - и пик памяти анализа)
+    """
+    analysis, params = CASES[name]
+    # spawn: процесс стартует с чистой памятью, а не с копией текущего
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for _ in range(repeat):
+        with context.Pool(1) as pool:
+            results.append(pool.apply(_measure, (os.path.abspath(path), analysis, params, memory)))
+
+    best = min(results, key=lambda result: result['load_seconds'] + result['analysis_seconds'])
+    total = best['load_seconds'] + best['analysis_seconds']
+    return dict(best, case=name, rows_per_second=best['rows'] / total if total > 0 else 0.0,
+                peak_rss_mb=max(result['peak_rss_mb'] for result in results))
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, cases=tuple(CASES), repeat=1, seed=1, memory=False, data=None):
+    """
+    Прогоняет замеры для всех размеров и анализов и выводит таблицу
+
+    Args:
+        memory (bool): Замерять пик памяти, выделенной анализом (tracemalloc)
+        data (dict): Параметры синтетических заказов (см. dataset())
+
+    Returns:
+        list: Результаты замеров (с параметрами синтетических заказов)
+    """
+    data = dict(DEFAULT_DATA, **(data or {}))
+    results = []
+    for rows in sizes:
+        path = dataset(rows, seed, data)
+        print(f"\nФайл: {path}")
+        header = f"{'Анализ':<12}{'Строк':>12}{'Разбор, с':>12}{'Анализ, с':>12}{'Строк/с':>14}{'Пик RSS, МБ':>14}"
+        print(header + (f"{'Пик анализа, МБ':>18}" if memory else ""))
+        for name in cases:
+            result = dict(run_case(path, name, repeat, memory), **data)
+            results.append(result)
+            line = (f"{name:<12}{result['rows']:>12}{result['load_seconds']:>12.3f}{result['analysis_seconds']:>12.3f}"
+                    f"{result['rows_per_second']:>14,.0f}{result['peak_rss_mb']:>14.1f}")
+            print(line + (f"{result['analysis_peak_mb']:>18.1f}" if memory else ""))
+    return results
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    args = sys.argv[1:]
+    sizes = DEFAULT_SIZES
+    cases = list(CASES)
+    repeat = 1
+    output = None
+    memory = False
+    data = {}
+    data_options = {
+        '--items': ('items_per_order', int),
+        '--upsell-rate': ('upsell_rate', float),
+        '--packaging-rate': ('packaging_rate', float),
+        '--catalog-size': ('catalog_size', int),
+    }
+
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--sizes':
+                sizes = [parse_size(size) for size in args.pop(0).split(',')]
+            elif arg == '--cases':
+                cases = args.pop(0).split(',')
+            elif arg == '--repeat':
+                repeat = int(args.pop(0))
+            elif arg == '--json':
+                output = args.pop(0)
+            elif arg == '--memory':
+                memory = True
+            elif arg in data_options:
+                name, convert = data_options[arg]
+                data[name] = convert(args.pop(0))
+            else:
+                print(f"Ошибка: неизвестный аргумент '{arg}'")
+                sys.exit(1)
+    except (IndexError, ValueError):
+        print("Использование: python benchmark.py [--sizes 10k,1m,10m] [--cases index,combo 2-3,...] "
+              "[--repeat N] [--json ФАЙЛ] [--memory] [--items N] [--upsell-rate ДОЛЯ] "
+              "[--packaging-rate ДОЛЯ] [--catalog-size N]")
+        sys.exit(1)
+
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        print(f"Ошибка: неизвестные замеры {', '.join(unknown)}; доступны: {', '.join(CASES)}")
+        sys.exit(1)
+
+    if repeat < 1 or any(size < 1 for size in sizes):
+        print("Ошибка: размеры и количество повторов должны быть больше 0")
+        sys.exit(1)
+
+    if data.get('items_per_order', 1) < 1 or data.get('catalog_size', 1) < 1:
+        print("Ошибка: количество товаров в заказе и размер каталога должны быть больше 0")
+        sys.exit(1)
+
+    if not all(0 <= data.get(name, 0) <= 1 for name in ('upsell_rate', 'packaging_rate')):
+        print("Ошибка: доли допродаж и упаковки должны быть от 0 до 1")
+        sys.exit(1)
+
+    results = run_benchmarks(sizes, cases, repeat, memory=memory, data=data)
+
+    # Результаты в JSON для сравнения между версиями
+    if output:
+        with open(output, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в файл '{output}'")
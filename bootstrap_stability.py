@@ -0,0 +1,503 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+
+from instrumentation import phase
+from input_options import open_orders, pop_input_options, report_memory
+from report_writer import Percentages, write_table
+
+# Число бутстрэп-репликаций по умолчанию
+DEFAULT_REPLICATES = 200
+
+# Маска категорий основных товаров заказа хранится в uint64
+MAX_CATEGORIES = 64
+
+# Сколько порций репликаций приходится на один процесс (для равномерной загрузки)
+CHUNKS_PER_WORKER = 4
+
+# Разделы отчета: имя -> (название в отчете, показатель)
+SECTIONS = {
+    'category': ('Категории', 'доля допродаж (%)'),
+    'combo': ('Комбинации', 'заказов'),
+    'combo_share': ('Комбинации для категории допродажи', 'доля допродаж (%)'),
+    'product': ('Товары', 'допродаж'),
+}
+
+USAGE = ("Использование: python bootstrap_stability.py [--replicates N] [--workers N] [--seed N] "
+         "[--combo МИН [МАКС]] [--top N] [--min-support N]")
+
+# Кодирование заказов в процессе пула (передается один раз при запуске процесса)
+_encoding = None
+
+
+def encode_orders(store, min_combo_size=2, max_combo_size=None):
+    """
+    Кодирует заказы для быстрого пересчета агрегатов с весами заказов
+
+    Каждый заказ сводится к тройкам (заказ, ключ, количество): основные товары и
+    допродажи по категориям, пары "категория основного товара x категория допродажи",
+    допродажи по товарам и маска категорий основных товаров (для комбинаций).
+    Упаковка исключается, как в анализах. Пересчет с весами - взвешенные bincount
+    по этим тройкам без перебора заказов и разбора файла.
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_combo_size (int): Минимальный размер комбинации
+        max_combo_size (int): Максимальный размер комбинации (None - без ограничений)
+
+    Returns:
+        dict: Массивы кодирования и названия категорий, комбинаций и товаров
+
+    Raises:
+        ValueError: Категорий больше MAX_CATEGORIES
+    """
+    names = store.category_names
+    num_categories = len(names)
+    if num_categories > MAX_CATEGORIES:
+        raise ValueError(f"Маски категорий поддерживают не более {MAX_CATEGORIES} категорий, задано {num_categories}")
+
+    order_ids = np.asarray(store.order_ids, dtype=np.int64)
+    product_ids = np.asarray(store.product_ids, dtype=np.int64)
+    packaging = store.product_is_packaging[product_ids]
+    row_categories = store.product_categories.astype(np.int64)[product_ids]
+    main = ~store.is_upsell & ~packaging
+    upsell = store.is_upsell & ~packaging
+
+    main_orders, main_categories, main_counts = _triples(order_ids[main], row_categories[main], num_categories)
+    upsell_orders, upsell_categories, upsell_counts = _triples(order_ids[upsell], row_categories[upsell],
+                                                               num_categories)
+
+    # Пары категорий заказов с допродажами: основные товары x допродажи одного заказа
+    has_upsells = np.zeros(store.num_orders, dtype=bool)
+    has_upsells[upsell_orders] = True
+    cross = has_upsells[main_orders]
+    upsell_starts = np.searchsorted(upsell_orders, main_orders[cross])
+    upsell_ends = np.searchsorted(upsell_orders, main_orders[cross], side='right')
+    repeats = upsell_ends - upsell_starts
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    upsell_rows = np.repeat(upsell_starts, repeats) + offsets
+    main_rows = np.repeat(np.flatnonzero(cross), repeats)
+
+    # Маска категорий основных товаров каждого заказа
+    masks = np.zeros(store.num_orders, dtype=np.uint64)
+    np.bitwise_or.at(masks, main_orders, np.left_shift(np.uint64(1), main_categories.astype(np.uint64)))
+    unique_masks, mask_index = np.unique(masks, return_inverse=True)
+
+    # Комбинации нужного размера, содержащиеся в каждой маске (ключ - названия по алфавиту)
+    combo_index = {}
+    pair_combos = []
+    pair_masks = []
+    for mask_code, mask in enumerate(unique_masks.tolist()):
+        categories = sorted(names[code] for code in range(num_categories) if mask >> code & 1)
+        largest = min(max_combo_size or len(categories), len(categories))
+        for combo_size in range(min_combo_size, largest + 1):
+            for combo in combinations(categories, combo_size):
+                pair_combos.append(combo_index.setdefault(combo, len(combo_index)))
+                pair_masks.append(mask_code)
+    pair_combos = np.array(pair_combos, dtype=np.int64)
+    pair_order = np.argsort(pair_combos, kind='stable')
+    combo_starts = pair_order
+    if len(pair_order):
+        combo_starts = np.flatnonzero(np.r_[True, np.diff(pair_combos[pair_order]) != 0])
+
+    # Допродажи по товарам в заказах с основными товарами; варианты с одним названием объединяются
+    product_keys = {}
+    product_uids = np.fromiter((product_keys.setdefault(name, len(product_keys)) for name in store.product_names),
+                               dtype=np.int64, count=len(store.product_names))
+    product_categories = np.zeros(len(product_keys), dtype=np.int64)
+    product_categories[product_uids] = store.product_categories
+    has_main = np.zeros(store.num_orders, dtype=bool)
+    has_main[main_orders] = True
+    counted = upsell & has_main[order_ids]
+    product_orders, products, product_counts = _triples(order_ids[counted], product_uids[product_ids[counted]],
+                                                        len(product_keys))
+
+    return {
+        'num_orders': store.num_orders,
+        'category_names': names,
+        'combos': list(combo_index),
+        'product_names': list(product_keys),
+        'product_categories': product_categories,
+        'main': (main_orders, main_categories, main_counts),
+        'pairs': (main_orders[main_rows], main_categories[main_rows] * num_categories + upsell_categories[upsell_rows],
+                  main_counts[main_rows] * upsell_counts[upsell_rows]),
+        'mask_index': mask_index,
+        'mask_upsells': (upsell_orders, upsell_categories, upsell_counts),
+        'combo_masks': np.asarray(pair_masks, dtype=np.int64)[pair_order],
+        'combo_starts': combo_starts,
+        'products': (product_orders, products, product_counts),
+    }
+
+
+def _triples(orders, keys, num_keys):
+    """Строки (заказ, ключ) -> тройки (заказ, ключ, количество), упорядоченные по заказу"""
+    codes, counts = np.unique(orders * num_keys + keys, return_counts=True)
+    return codes // num_keys, codes % num_keys, counts
+
+
+def recount(encoding, weights):
+    """
+    Агрегаты анализов при весах заказов (число копий заказа в выборке)
+
+    С единичными весами результат совпадает с подсчетом по всем заказам.
+
+    Returns:
+        dict: 'sales' (продажи по категориям), 'pairs' (допродажи по парам категорий,
+            матрица), 'combo_orders', 'combo_upsells' (заказы и допродажи по категориям
+            для каждой комбинации) и 'products' (допродажи каждого товара)
+    """
+    num_categories = len(encoding['category_names'])
+
+    def weighted(triples, num_keys):
+        orders, keys, counts = triples
+        return np.bincount(keys, weights=weights[orders] * counts, minlength=num_keys)
+
+    mask_index = encoding['mask_index']
+    num_masks = int(mask_index.max()) + 1 if len(mask_index) else 0
+    mask_orders = np.bincount(mask_index, weights=weights, minlength=num_masks)
+    upsell_orders, upsell_categories, upsell_counts = encoding['mask_upsells']
+    mask_upsells = np.bincount(mask_index[upsell_orders] * num_categories + upsell_categories,
+                               weights=weights[upsell_orders] * upsell_counts,
+                               minlength=num_masks * num_categories).reshape(num_masks, num_categories)
+
+    # Комбинация получает заказы и допродажи всех масок, в которые она входит
+    combo_masks, starts = encoding['combo_masks'], encoding['combo_starts']
+    if len(starts):
+        combo_orders = np.add.reduceat(mask_orders[combo_masks], starts)
+        combo_upsells = np.add.reduceat(mask_upsells[combo_masks], starts, axis=0)
+    else:
+        combo_orders = np.zeros(0)
+        combo_upsells = np.zeros((0, num_categories))
+
+    return {
+        'sales': weighted(encoding['main'], num_categories),
+        'pairs': weighted(encoding['pairs'], num_categories * num_categories).reshape(num_categories,
+                                                                                      num_categories),
+        'combo_orders': combo_orders,
+        'combo_upsells': combo_upsells,
+        'products': weighted(encoding['products'], len(encoding['product_names'])),
+    }
+
+
+def section_values(name, counts):
+    """Показатель раздела для всех возможных элементов (плоский массив)"""
+    if name == 'category':
+        return _shares(counts['pairs'], counts['sales']).ravel()
+    if name == 'combo':
+        return counts['combo_orders']
+    if name == 'combo_share':
+        return _shares(counts['combo_upsells'], counts['combo_orders']).ravel()
+    return counts['products']
+
+
+def _shares(counts, totals):
+    """Доли строк матрицы в процентах (при нулевом знаменателе - 0)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = counts / totals[:, None] * 100
+    return np.where(totals[:, None] > 0, shares, 0.0)
+
+
+def group_ranks(values, groups):
+    """
+    Ранги значений внутри групп по убыванию (равные значения получают одинаковый ранг)
+
+    Ранг - 1 плюс число элементов группы со строго большим значением.
+    """
+    order = np.lexsort((-values, groups))
+    sorted_values = values[order]
+    sorted_groups = groups[order]
+    positions = np.arange(len(values))
+    group_start = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    value_start = group_start | np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = (np.maximum.accumulate(np.where(value_start, positions, 0))
+                    - np.maximum.accumulate(np.where(group_start, positions, 0)) + 1)
+    return ranks
+
+
+def define_sections(encoding, counts, top_n=10, min_support=1):
+    """
+    Элементы разделов по агрегатам всех заказов
+
+    Ранжируются элементы, встречавшиеся в заказах (в выборке с повторами других не
+    бывает): пары категорий - внутри основной категории, комбинации - по числу
+    заказов, комбинации для допродаж - внутри категории допродажи, товары - внутри
+    категории. Отслеживаются все элементы, кроме товаров: у них - топ-top_n каждой категории.
+
+    Returns:
+        dict: Имя раздела -> (элементы в плоском массиве показателя, группа каждого
+            элемента, номера отслеживаемых элементов среди элементов)
+    """
+    num_categories = len(encoding['category_names'])
+    supported = counts['combo_orders'] >= min_support
+
+    category = np.flatnonzero(counts['pairs'].ravel() > 0)
+    combo = np.flatnonzero(supported)
+    combo_share = np.flatnonzero((counts['combo_upsells'] > 0) & supported[:, None])
+    product = np.flatnonzero(counts['products'] > 0)
+    product_groups = encoding['product_categories'][product]
+
+    # Топ товаров категории: по убыванию допродаж, при равенстве - в порядке появления
+    order = np.lexsort((-counts['products'][product], product_groups))
+    place = np.arange(len(order)) - np.searchsorted(product_groups[order], product_groups[order])
+    tracked_products = np.sort(order[place < top_n])
+
+    return {
+        'category': (category, category // num_categories, np.arange(len(category))),
+        'combo': (combo, np.zeros(len(combo), dtype=np.int64), np.arange(len(combo))),
+        'combo_share': (combo_share, combo_share % num_categories, np.arange(len(combo_share))),
+        'product': (product, product_groups, tracked_products),
+    }
+
+
+def _init_worker(encoding):
+    """Сохраняет кодирование заказов в процессе пула"""
+    global _encoding
+    _encoding = encoding
+
+
+def run_replicates(seeds, encoding=None, sections=None):
+    """
+    Пересчитывает агрегаты для порции бутстрэп-репликаций
+
+    Каждая репликация - выборка num_orders заказов с повторами: вес заказа - сколько
+    раз он попал в выборку. Генератор каждой репликации задается своим seed, поэтому
+    результат не зависит от числа процессов.
+
+    Args:
+        seeds (list): numpy.random.SeedSequence каждой репликации
+        encoding (dict): Кодирование заказов (по умолчанию - переданное процессу пула)
+        sections (dict): Результат define_sections()
+
+    Returns:
+        dict: Имя раздела -> (показатели, ранги) отслеживаемых элементов, массивы
+            репликации x элементы
+    """
+    encoding = encoding if encoding is not None else _encoding
+    num_orders = encoding['num_orders']
+    results = {name: ([], []) for name in sections}
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        weights = np.bincount(rng.integers(0, num_orders, num_orders), minlength=num_orders).astype(np.float64)
+        counts = recount(encoding, weights)
+        for name, (items, groups, tracked) in sections.items():
+            values = section_values(name, counts)[items]
+            results[name][0].append(values[tracked])
+            results[name][1].append(group_ranks(values, groups)[tracked])
+    return {name: (np.array(values).reshape(len(seeds), -1), np.array(ranks).reshape(len(seeds), -1))
+            for name, (values, ranks) in results.items()}
+
+
+def bootstrap(encoding, sections, replicates=DEFAULT_REPLICATES, workers=None, seed=0):
+    """
+    Выполняет бутстрэп-репликации в пуле процессов
+
+    Кодирование заказов передается каждому процессу один раз при запуске, а задачи -
+    только порции seed репликаций.
+
+    Returns:
+        dict: Имя раздела -> (показатели, ранги) по всем репликациям
+    """
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    workers = max(1, min(workers or os.cpu_count() or 1, replicates))
+    if workers == 1:
+        return run_replicates(seeds, encoding, sections)
+
+    chunk = -(-replicates // (workers * CHUNKS_PER_WORKER))
+    chunks = [seeds[start:start + chunk] for start in range(0, replicates, chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(encoding,)) as pool:
+        parts = list(pool.map(run_replicates, chunks, [None] * len(chunks), [sections] * len(chunks)))
+    return {name: (np.concatenate([part[name][0] for part in parts]),
+                   np.concatenate([part[name][1] for part in parts]))
+            for name in sections}
+
+
+def _labels(name, encoding, items):
+    """Группа и название каждого элемента раздела"""
+    categories = encoding['category_names']
+    num_categories = len(categories)
+    combos = [" + ".join(combo) for combo in encoding['combos']]
+    if name == 'category':
+        return ([categories[item // num_categories] for item in items.tolist()],
+                [categories[item % num_categories] for item in items.tolist()])
+    if name == 'combo':
+        return ['все'] * len(items), [combos[item] for item in items.tolist()]
+    if name == 'combo_share':
+        return ([categories[item % num_categories] for item in items.tolist()],
+                [combos[item // num_categories] for item in items.tolist()])
+    products = encoding['product_names']
+    return ([categories[code] for code in encoding['product_categories'][items].tolist()],
+            [products[item] for item in items.tolist()])
+
+
+def stability_table(encoding, counts, sections, results, top_n=10):
+    """
+    Колонки отчета об устойчивости для report_writer.write_table()
+
+    Для каждого отслеживаемого элемента: ранг и показатель по всем заказам, медиана
+    и 95% интервал ранга по репликациям, доля репликаций с тем же рангом и в топ-top_n,
+    95% интервал показателя. Строки идут по разделам, внутри - по группе и рангу.
+
+    Returns:
+        tuple: (заголовки, колонки, строки по разделам) - строки раздела: список
+            (группа, элемент, ранг, медиана ранга, границы ранга, доля в топ-top_n)
+    """
+    headers = ['Раздел', 'Показатель', 'Группа', 'Элемент', 'Ранг', 'Ранг (медиана)', 'Ранг (2.5%)',
+               'Ранг (97.5%)', 'Тот же ранг (%)', f'В топ-{top_n} (%)', 'Значение', 'Значение (2.5%)',
+               'Значение (97.5%)']
+    columns = [[] for _ in headers]
+    rows = {}
+    replicates = 0
+    for name, (items, groups, tracked) in sections.items():
+        values, ranks = results[name]
+        replicates = len(values)
+        full_values = section_values(name, counts)[items]
+        full_ranks = group_ranks(full_values, groups)[tracked]
+        full_values = full_values[tracked]
+        group_names, element_names = _labels(name, encoding, items[tracked])
+
+        rank_bounds = np.quantile(ranks, [0.5, 0.025, 0.975], axis=0, method='inverted_cdf').astype(np.int64)
+        value_bounds = np.quantile(values, [0.025, 0.975], axis=0)
+        same = (ranks == full_ranks[None, :]).sum(axis=0)
+        in_top = (ranks <= top_n).sum(axis=0)
+
+        order = sorted(range(len(tracked)), key=lambda i: (group_names[i], full_ranks[i], element_names[i]))
+        title, measure = SECTIONS[name]
+        section_columns = [[title] * len(order), [measure] * len(order), [group_names[i] for i in order],
+                           [element_names[i] for i in order], full_ranks[order], rank_bounds[0][order],
+                           rank_bounds[1][order], rank_bounds[2][order], same[order], in_top[order],
+                           np.round(full_values[order], 2), np.round(value_bounds[0][order], 2),
+                           np.round(value_bounds[1][order], 2)]
+        for column, part in zip(columns, section_columns):
+            column.extend(part.tolist() if isinstance(part, np.ndarray) else part)
+        rows[name] = [(group_names[i], element_names[i], int(full_ranks[i]), int(rank_bounds[0][i]),
+                       int(rank_bounds[1][i]), int(rank_bounds[2][i]), int(in_top[i])) for i in order]
+
+    # Доли репликаций - в процентах, как доли в остальных отчетах
+    columns[8] = Percentages(columns[8], replicates)
+    columns[9] = Percentages(columns[9], replicates)
+    return headers, columns, rows
+
+
+def write_stability_report(encoding, counts, sections, results, top_n=10):
+    """Выводит итоги в консоль и сохраняет 'bootstrap_stability.csv'"""
+    headers, columns, rows = stability_table(encoding, counts, sections, results, top_n)
+    write_table('bootstrap_stability.csv', headers, columns)
+    replicates = len(results['combo'][1])
+
+    def interval(row):
+        return f"{row[4]}" if row[4] == row[5] else f"{row[4]}-{row[5]}"
+
+    print(f"\nТоп-10 комбинаций по числу заказов (ранг, 95% интервал ранга по репликациям):")
+    for row in sorted(rows['combo'], key=lambda row: row[2])[:10]:
+        print(f"  {row[2]}. {row[1]}: ранг {interval(row)}, в топ-{top_n} в "
+              f"{round(row[6] / replicates * 100, 1)}% репликаций")
+
+    print(f"\nЛучшая комбинация для каждой категории допродажи (по доле допродаж):")
+    for row in rows['combo_share']:
+        if row[2] == 1:
+            print(f"  - {row[0]}: {row[1]} (ранг {interval(row)})")
+
+    print(f"\nРанг не меняется в 95% интервале по репликациям:")
+    for name, section in SECTIONS.items():
+        stable = sum(1 for row in rows[name] if row[4] == row[5])
+        print(f"  - {section[0]}: у {stable} из {len(rows[name])} элементов")
+
+    print(f"\nРезультаты сохранены в файл 'bootstrap_stability.csv'")
+
+
+def analyze_stability(store, replicates=DEFAULT_REPLICATES, workers=None, seed=0, min_combo_size=2,
+                      max_combo_size=None, top_n=10, min_support=1):
+    """
+    Оценивает устойчивость рангов в отчетах бутстрэпом заказов
+
+    Заказы кодируются один раз (encode_orders()), и каждая репликация - взвешенный
+    пересчет агрегатов по кодированию, без перебора заказов и разбора файла.
+    Репликации распределяются между процессами.
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        replicates (int): Число репликаций (по умолчанию DEFAULT_REPLICATES)
+        workers (int): Число процессов (по умолчанию по числу ядер)
+        seed (int): Начальное значение генератора (одинаковый seed - одинаковый результат)
+        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
+        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+        top_n (int): Сколько товаров каждой категории отслеживать (по умолчанию 10)
+        min_support (int): Минимальное число заказов с комбинацией (по умолчанию 1 - все)
+    """
+    print("Кодирую заказы для бутстрэпа...")
+    with phase('group'):
+        encoding = encode_orders(store, min_combo_size, max_combo_size)
+        counts = recount(encoding, np.ones(store.num_orders))
+        sections = define_sections(encoding, counts, top_n, min_support)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, replicates))
+    print(f"Выполняю {replicates} репликаций по {store.num_orders} заказов в {workers} процессах...")
+    started = time.perf_counter()
+    with phase('aggregate'):
+        results = bootstrap(encoding, sections, replicates, workers, seed)
+    print(f"Репликации выполнены за {time.perf_counter() - started:.1f} с")
+
+    with phase('write'):
+        write_stability_report(encoding, counts, sections, results, top_n)
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    replicates = DEFAULT_REPLICATES
+    workers = None
+    seed = 0
+    min_size = 2
+    max_size = None
+    top_n = 10
+    min_support = 1
+
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--replicates':
+                replicates = int(args.pop(0))
+            elif arg == '--workers':
+                workers = int(args.pop(0))
+            elif arg == '--seed':
+                seed = int(args.pop(0))
+            elif arg == '--combo':
+                min_size = int(args.pop(0))
+                if args and not args[0].startswith('--'):
+                    max_size = int(args.pop(0))
+            elif arg == '--top':
+                top_n = int(args.pop(0))
+            elif arg == '--min-support':
+                min_support = int(args.pop(0))
+            else:
+                print(f"Ошибка: неизвестный аргумент '{arg}'")
+                sys.exit(1)
+    except (IndexError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    if replicates < 2 or (workers is not None and workers < 1) or top_n < 1 or min_support < 1 or seed < 0:
+        print("Ошибка: --replicates должно быть не меньше 2, --workers, --top и --min-support - больше 0, "
+              "--seed - не меньше 0")
+        sys.exit(1)
+
+    if min_size < 2 or (max_size and max_size < min_size):
+        print("Ошибка: комбинации - от 2 категорий, максимальный размер не меньше минимального")
+        sys.exit(1)
+
+    # Кодирование строится векторно по всей таблице строк
+    if options['stream'] or options['incremental']:
+        print("Ошибка: --stream и --incremental не поддерживаются в бутстрэпе")
+        sys.exit(1)
+
+    try:
+        analyze_stability(open_orders(options), replicates, workers, seed, min_size, max_size, top_n, min_support)
+    except ValueError as error:
+        print(f"Ошибка: {error}")
+        sys.exit(1)
+    report_memory(options)
@@ -1,128 +1,213 @@
-import pandas as pd
-from collections import defaultdict
-import csv
+import sys
 
-def get_product_category(product_name):
-    """Определяет категорию товара по его названию"""
-    if 'Кольє' in product_name:
-        return 'Колье'
-    elif 'Сережки' in product_name:
-        return 'Серьги'
-    elif 'Браслет' in product_name:
-        return 'Браслет'
-    elif 'Каблучка' in product_name:
-        return 'Кольцо'
-    elif 'Кафф' in product_name:
-        return 'Кафф'
-    elif 'Анклет' in product_name:
-        return 'Анклет'
-    elif 'Чокер' in product_name:
-        return 'Чокер'
-    else:
-        return 'Другое'
+from analysis_runner import run_analyzers
+from counters import CountMatrix, IdCounter
+from incremental import update_incremental
+from instrumentation import phase
+from input_options import default_options, open_orders, pop_input_options, report_memory
+from order_loader import load_orders
+from report_writer import Percentages, count_matrix, write_table
+from rollups import pop_rollup_options, rollup_stats
+from significance import SIGNIFICANCE_LEVEL, significance_columns
 
-def analyze_category_upsells():
-    # Читаем CSV файл
-    df = pd.read_csv('products.csv')
-    
-    # Группируем по номеру заказа
-    orders = df.groupby('№ заказа')
-    
-    # Словарь для хранения статистики по категориям
-    category_stats = defaultdict(lambda: defaultdict(int))
+class CategoryCounter:
+    """
+    Подсчет продаж и допродаж по категориям по одному заказу за раз
+
+    Заказы передаются в порядке номеров (sort_keys = True), как при groupby в pandas.
+    Категории считаются по кодам в плотных массивах (counters.CountMatrix), названия
+    подставляются только в result().
+    """
     
-    # Словарь для подсчета общего количества проданных товаров по категориям
-    main_category_counts = defaultdict(int)
+    sort_keys = True
     
-    print("Анализирую заказы по категориям...")
+    def __init__(self, store):
+        self.packaging = store.product_is_packaging.tolist()
+        self.categories = store.product_categories.tolist()
+        self.category_names = store.category_names
+        num_categories = len(self.category_names)
+        
+        # Матрица "основная категория x категория допродажи"
+        self.category_stats = CountMatrix(num_categories, num_categories)
+        
+        # Общее количество проданных товаров по категориям
+        self.main_category_counts = IdCounter(num_categories)
     
-    # Сначала подсчитываем общее количество проданных товаров по категориям
-    for order_id, order_data in orders:
-        main_products = order_data[order_data['Допродажа'].isna() | (order_data['Допродажа'] == '')]
+    def add(self, order_id, position, main_products, upsell_products):
+        """Учитывает один заказ"""
+        packaging = self.packaging
+        categories = self.categories
+        main_counts, main_order = self.main_category_counts.counts, self.main_category_counts.order
         
-        for _, main_product in main_products.iterrows():
-            main_product_name = main_product['Товары']
-            
+        # Подсчитываем общее количество проданных товаров по категориям
+        for main_product in main_products:
             # Пропускаем коробки и упаковки
-            if 'Коробка' in main_product_name or 'Пакет' in main_product_name:
+            if packaging[main_product]:
                 continue
-                
-            main_category = get_product_category(main_product_name)
-            main_category_counts[main_category] += 1
-    
-    # Теперь анализируем допродажи
-    for order_id, order_data in orders:
-        # Разделяем товары на основные и допродажи
-        main_products = order_data[order_data['Допродажа'].isna() | (order_data['Допродажа'] == '')]
-        upsell_products = order_data[order_data['Допродажа'] == 'Допродажа']
+            
+            main_category = categories[main_product]
+            if not main_counts[main_category]:
+                main_order.append(main_category)
+            main_counts[main_category] += 1
         
         # Если в заказе есть допродажи
-        if not upsell_products.empty:
-            for _, main_product in main_products.iterrows():
-                main_product_name = main_product['Товары']
-                
+        if upsell_products:
+            cells, cell_order = self.category_stats.counts, self.category_stats.order
+            num_categories = self.category_stats.num_columns
+            
+            # Категории допродаж, исключая коробки и пакеты
+            upsell_categories = [categories[product] for product in upsell_products if not packaging[product]]
+            
+            for main_product in main_products:
                 # Пропускаем коробки и упаковки
-                if 'Коробка' in main_product_name or 'Пакет' in main_product_name:
+                if packaging[main_product]:
                     continue
                 
-                main_category = get_product_category(main_product_name)
+                row = categories[main_product] * num_categories
                 
                 # Подсчитываем допродажи по категориям
-                for _, upsell_product in upsell_products.iterrows():
-                    upsell_name = upsell_product['Товары']
-                    
-                    # Пропускаем коробки и пакеты в допродажах
-                    if 'Коробка' in upsell_name or 'Пакет' in upsell_name:
-                        continue
-                        
-                    upsell_category = get_product_category(upsell_name)
-                    category_stats[main_category][upsell_category] += 1
+                for upsell_category in upsell_categories:
+                    cell = row + upsell_category
+                    if not cells[cell]:
+                        cell_order.append(cell)
+                    cells[cell] += 1
+    
+    def result(self):
+        """Агрегаты в виде count_category_upsells()"""
+        names = self.category_names
+        return {
+            'main_category_counts': {names[code]: count for code, count in self.main_category_counts.items()},
+            'category_stats': self.category_stats.as_dict(names, names),
+        }
+
+def count_category_upsells(store):
+    """
+    Подсчитывает агрегаты анализа по категориям
+    
+    Args:
+        store (OrderStore): Загруженные заказы
+    
+    Returns:
+        dict: Продажи основных товаров по категориям и допродажи по парам категорий
+    """
+    return run_analyzers(store, [CategoryCounter(store)])[0]
+
+def merge_category_stats(old, new):
+    """Объединяет агрегаты двух частей файла (новая часть идет после старой)"""
+    main_category_counts = dict(old['main_category_counts'])
+    for category, count in new['main_category_counts'].items():
+        main_category_counts[category] = main_category_counts.get(category, 0) + count
+    
+    category_stats = {category: dict(stats) for category, stats in old['category_stats'].items()}
+    for main_category, stats in new['category_stats'].items():
+        merged = category_stats.setdefault(main_category, {})
+        for category, count in stats.items():
+            merged[category] = merged.get(category, 0) + count
+    
+    return {'main_category_counts': main_category_counts, 'category_stats': category_stats}
+
+def write_category_report(stats, significance=False):
+    """
+    Выводит итоги в консоль и сохраняет 'category_analysis.csv'
+    
+    С significance = True для каждой пары категорий в CSV добавляются 95% доверительный
+    интервал доли допродаж, лифт относительно доли по всем основным категориям и
+    p-значение с флагом значимости (significance.significance_columns()).
+    """
+    main_category_counts = stats['main_category_counts']
+    category_stats = stats['category_stats']
+    
+    # Получаем все уникальные категории
+    all_categories = set()
+    for main_stats in category_stats.values():
+        all_categories.update(main_stats.keys())
+    all_categories = sorted(list(all_categories))
+    
+    # Матрица "основная категория x категория допродажи" и продажи основных категорий
+    main_categories = sorted(category_stats)
+    sales = [main_category_counts.get(main_category, 0) for main_category in main_categories]
+    counts = count_matrix(category_stats, main_categories, all_categories)
     
     # Создаем результирующий CSV
-    with open('category_analysis.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        
-        # Получаем все уникальные категории
-        all_categories = set()
-        for main_stats in category_stats.values():
-            all_categories.update(main_stats.keys())
-        all_categories = sorted(list(all_categories))
-        
-        # Записываем заголовки
-        headers = ['Основная категория', 'Количество продаж'] + [f'{cat} (кол-во)' for cat in all_categories] + [f'{cat} (%)' for cat in all_categories]
-        writer.writerow(headers)
-        
-        # Записываем данные по каждой основной категории
-        for main_category, upsell_stats in sorted(category_stats.items()):
-            row = [main_category, main_category_counts[main_category]]
-            
-            # Добавляем количество допродаж
-            for category in all_categories:
-                row.append(upsell_stats[category])
-            
-            # Добавляем проценты
-            total_main_sales = main_category_counts[main_category]
-            for category in all_categories:
-                if total_main_sales > 0:
-                    percentage = round((upsell_stats[category] / total_main_sales) * 100, 1)
-                else:
-                    percentage = 0
-                row.append(f"{percentage}%")
-            
-            writer.writerow(row)
-            
-            # Выводим в консоль
-            print(f"\nОсновная категория: {main_category} (продано: {total_main_sales})")
-            for category, count in sorted(upsell_stats.items(), key=lambda x: x[1], reverse=True):
-                if count > 0:
-                    percentage = round((count / total_main_sales) * 100, 1) if total_main_sales > 0 else 0
-                    print(f"  - {category}: {count} допродаж ({percentage}%)")
+    headers = ['Основная категория', 'Количество продаж'] + [f'{cat} (кол-во)' for cat in all_categories] + [f'{cat} (%)' for cat in all_categories]
+    table = ([main_categories, sales] + [counts[:, i] for i in range(len(all_categories))]
+             + [Percentages(counts[:, i], sales) for i in range(len(all_categories))])
+    if significance:
+        significance_headers, significance_table, significant, tested = significance_columns(counts, sales,
+                                                                                            all_categories)
+        headers += significance_headers
+        table += significance_table
+    write_table('category_analysis.csv', headers, table)
+    
+    # Выводим в консоль
+    for main_category, total_main_sales in zip(main_categories, sales):
+        print(f"\nОсновная категория: {main_category} (продано: {total_main_sales})")
+        for category, count in sorted(category_stats[main_category].items(), key=lambda x: x[1], reverse=True):
+            if count > 0:
+                percentage = round((count / total_main_sales) * 100, 1) if total_main_sales > 0 else 0
+                print(f"  - {category}: {count} допродаж ({percentage}%)")
     
     print(f"\nОбщая статистика по основным категориям:")
     for category, count in sorted(main_category_counts.items(), key=lambda x: x[1], reverse=True):
         print(f"  - {category}: {count} товаров продано")
     
+    if significance:
+        print(f"\nЗначимо отличаются от доли по всем категориям (p < {SIGNIFICANCE_LEVEL}): "
+              f"{significant} из {tested} пар категорий")
+    
     print(f"\nРезультаты сохранены в файл 'category_analysis.csv'")
 
+def analyze_category_upsells(store=None, incremental=False, filters=None, options=None, significance=False):
+    """
+    Анализирует допродажи на уровне категорий товаров
+
+    Args:
+        store (OrderStore): Загруженные заказы (по умолчанию читается 'products.csv')
+        incremental (bool): Обработать только строки, дописанные в 'products.csv'
+            с прошлого запуска, и объединить их с сохраненными агрегатами
+        filters (dict): Отбор по периоду и сегментам (pop_rollup_options()); агрегаты
+            складываются из сохраненных дневных агрегатов без перебора заказов
+        options (dict): Параметры чтения заказов (файл для инкрементального режима
+            и построения дневных агрегатов)
+        significance (bool): Добавить в отчет доверительные интервалы, лифт и значимость
+    """
+    print("Анализирую заказы по категориям...")
+    
+    if filters is not None:
+        stats = rollup_stats('category_analysis', count_category_upsells, filters, options)
+    elif incremental:
+        stats = update_incremental('category_analysis', count_category_upsells, merge_category_stats,
+                                   path=(options or default_options())['path'], ordered_by_key=True)
+    else:
+        # Читаем CSV файл
+        if store is None:
+            store = load_orders()
+        stats = count_category_upsells(store)
+    
+    with phase('write'):
+        write_category_report(stats, significance)
+
 if __name__ == "__main__":
-    analyze_category_upsells()
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    filters, args = pop_rollup_options(args)
+    significance = '--significance' in args
+    if significance:
+        args.remove('--significance')
+    
+    # Дневные агрегаты строятся по всему файлу в памяти
+    if filters is not None and (options['stream'] or options['incremental']):
+        print("Ошибка: --from, --to и --segment нельзя использовать вместе с --stream и --incremental")
+        sys.exit(1)
+    
+    if filters is not None:
+        try:
+            analyze_category_upsells(filters=filters, options=options, significance=significance)
+        except ValueError as error:
+            print(f"Ошибка: {error}")
+            sys.exit(1)
+    elif options['incremental']:
+        analyze_category_upsells(incremental=True, options=options, significance=significance)
+    else:
+        analyze_category_upsells(store=open_orders(options), significance=significance)
+    report_memory(options)
@@ -1,139 +1,321 @@
-import csv
+import heapq
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
 
-def get_product_category(product_name):
-    """Определяет категорию товара по его названию"""
-    if 'Кольє' in product_name:
-        return 'Колье'
-    elif 'Сережки' in product_name:
-        return 'Серьги'
-    elif 'Браслет' in product_name:
-        return 'Браслет'
-    elif 'Каблучка' in product_name:
-        return 'Кольцо'
-    elif 'Кафф' in product_name:
-        return 'Кафф'
-    elif 'Анклет' in product_name:
-        return 'Анклет'
-    elif 'Чокер' in product_name:
-        return 'Чокер'
-    else:
-        return 'Другое'
+from analysis_runner import run_analyzers
+from combo_bitmask import count_combos_bitmask
+from counters import CountMatrix, FirstSeen, IdCounter
+from incremental import update_incremental
+from instrumentation import phase
+from input_options import default_options, open_orders, pop_input_options, report_memory
+from order_loader import group_rows, load_orders
+from report_writer import Percentages, count_matrix, write_table
+from rollups import pop_rollup_options, rollup_stats
+from significance import SIGNIFICANCE_LEVEL, significance_columns
 
-def analyze_combo_upsells(min_combo_size=2, max_combo_size=None):
+class ComboCounter:
     """
-    Анализирует комбинации категорий товаров
-    
-    Args:
-        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
-        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+    Подсчет комбинаций категорий основных товаров и допродаж к ним по одному заказу за раз
+
+    Комбинация получает целочисленный код (строку) при первом появлении, а счетчики
+    хранятся в массивах: число заказов по коду комбинации (counters.IdCounter) и
+    матрица "комбинация x категория допродажи" (counters.CountMatrix). Заказы можно
+    передавать в любом порядке: для комбинаций и ячеек запоминается (позиция заказа,
+    порядковый номер) первого появления (counters.FirstSeen), и result() восстанавливает
+    порядок ключей, как при переборе в порядке появления в файле.
     """
-    # Читаем CSV файл
-    orders = {}
-    with open('products.csv', 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            order_id = row['№ заказа']
-            if order_id not in orders:
-                orders[order_id] = []
-            orders[order_id].append(row)
     
-    # Словарь для хранения статистики по комбинациям категорий
-    combo_stats = defaultdict(lambda: defaultdict(int))
+    sort_keys = False
     
-    # Словарь для подсчета общего количества комбинаций
-    combo_counts = defaultdict(int)
+    def __init__(self, packaging, categories, min_combo_size=2, max_combo_size=None):
+        """
+        Args:
+            packaging (list): Признак упаковки для каждого кода товара
+            categories (list): Категория для каждого кода товара
+            min_combo_size (int): Минимальный размер комбинации
+            max_combo_size (int): Максимальный размер комбинации (None - без ограничений)
+        """
+        self.packaging = packaging
+        self.categories = categories
+        self.min_combo_size = min_combo_size
+        self.max_combo_size = max_combo_size
+        
+        # Колонки матрицы - категории; код колонки для каждого кода товара
+        self.category_names = list(dict.fromkeys(categories))
+        column_of = {category: column for column, category in enumerate(self.category_names)}
+        self.columns = [column_of[category] for category in categories]
+        
+        # Код комбинации -> комбинация и обратно
+        self.combos = []
+        self.combo_rows = {}
+        
+        # Количество заказов с каждой комбинацией и допродажи к ней по категориям
+        self.combo_counts = IdCounter()
+        self.combo_stats = CountMatrix(len(self.category_names))
+        
+        # Первое появление комбинаций, комбинаций с допродажами и пар (комбинация, категория)
+        self.first_seen = {'counts': FirstSeen(), 'stats': FirstSeen(), 'cells': FirstSeen()}
+        self._last_position = -1
+        self._in_order = True
     
-    print("Анализирую заказы с комбинациями категорий...")
-    print(f"Загружено {len(orders)} заказов")
+    def _add_combo(self, combo):
+        """Присваивает код новой комбинации"""
+        row = self.combo_rows[combo] = len(self.combos)
+        self.combos.append(combo)
+        self.combo_counts.grow(row + 1)
+        self.combo_stats.add_row()
+        self.first_seen['counts'].grow(row + 1)
+        self.first_seen['stats'].grow(row + 1)
+        self.first_seen['cells'].grow(self.combo_stats.size)
+        return row
     
-    # Сначала подсчитываем все комбинации основных товаров
-    for order_id, order_data in orders.items():
-        main_products = []
-        upsells = []
+    def add(self, order_id, position, main_products, upsells):
+        """Учитывает один заказ"""
+        packaging = self.packaging
+        categories = self.categories
+        combo_rows = self.combo_rows
+        counts, counts_order = self.combo_counts.counts, self.combo_counts.order
+        counts_seen, stats_seen, cells_seen = self.first_seen['counts'], self.first_seen['stats'], self.first_seen['cells']
+        
+        if position < self._last_position:
+            self._in_order = False
+        self._last_position = position
         
-        for item in order_data:
-            doprodazha = item.get('Допродажа', '')
-            if doprodazha == 'Допродажа':
-                upsells.append(item)
-            else:
-                main_products.append(item)
+        # Пока заказы идут по порядку, первое появление ключа не может стать раньше,
+        # и его достаточно запомнить один раз, когда ключ встретился впервые
+        in_order = self._in_order
         
         # Получаем категории основных товаров в заказе
         main_categories = []
         for main_product in main_products:
-            main_product_name = main_product['Товары']
-            
             # Пропускаем коробки и упаковки
-            if 'Коробка' in main_product_name or 'Пакет' in main_product_name:
+            if packaging[main_product]:
                 continue
                 
-            category = get_product_category(main_product_name)
-            main_categories.append(category)
+            main_categories.append(categories[main_product])
         
-        # Создаем комбинации заданного размера
-        unique_categories = list(set(main_categories))
-        if len(unique_categories) >= min_combo_size:
-            # Генерируем комбинации разных размеров
-            from itertools import combinations
+        # Создаем комбинации заданного размера (в детерминированном порядке категорий)
+        unique_categories = sorted(set(main_categories))
+        if len(unique_categories) >= self.min_combo_size:
+            # Категории допродаж заказа (коды колонок), исключая коробки и пакеты
+            upsell_columns = [self.columns[product] for product in upsells if not packaging[product]]
+            num_columns = self.combo_stats.num_columns
             
             # Определяем максимальный размер комбинации
-            actual_max_size = max_combo_size if max_combo_size else len(unique_categories)
+            actual_max_size = self.max_combo_size if self.max_combo_size else len(unique_categories)
             actual_max_size = min(actual_max_size, len(unique_categories))
             
-            for combo_size in range(min_combo_size, actual_max_size + 1):
-                for combo_tuple in combinations(unique_categories, combo_size):
-                    combo = tuple(sorted(combo_tuple))
-                    combo_counts[combo] += 1
+            for combo_size in range(self.min_combo_size, actual_max_size + 1):
+                for combo in combinations(unique_categories, combo_size):
+                    row = combo_rows.get(combo)
+                    if row is None:
+                        row = self._add_combo(combo)
+                        counts_seen.see(row, position)
+                    elif not in_order:
+                        counts_seen.see(row, position)
+                    if not counts[row]:
+                        counts_order.append(row)
+                    counts[row] += 1
                     
                     # Если есть допродажи, подсчитываем их
-                    if upsells:
-                        for upsell_product in upsells:
-                            upsell_name = upsell_product['Товары']
-                            
-                            # Пропускаем коробки и пакеты в допродажах
-                            if 'Коробка' in upsell_name or 'Пакет' in upsell_name:
-                                continue
-                                
-                            upsell_category = get_product_category(upsell_name)
-                            combo_stats[combo][upsell_category] += 1
+                    if upsell_columns:
+                        if not in_order or stats_seen.positions[row] < 0:
+                            stats_seen.see(row, position)
+                        stats, stats_order = self.combo_stats.counts, self.combo_stats.order
+                        for column in upsell_columns:
+                            cell = row * num_columns + column
+                            if not stats[cell]:
+                                stats_order.append(cell)
+                                cells_seen.see(cell, position)
+                            elif not in_order:
+                                cells_seen.see(cell, position)
+                            stats[cell] += 1
     
-    # Создаем результирующий CSV
-    with open('combo_analysis.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        
-        # Получаем все уникальные категории допродаж
-        all_upsell_categories = set()
-        for combo_data in combo_stats.values():
-            all_upsell_categories.update(combo_data.keys())
-        all_upsell_categories = sorted(list(all_upsell_categories))
+    def shard(self):
+        """Счетчики в виде для _merge_combo_shards() (без списков по товарам)"""
+        return self.combos, self.category_names, self.combo_counts, self.combo_stats, self.first_seen
+    
+    def result(self):
+        """Агрегаты в виде count_combo_upsells() (без общего числа заказов)"""
+        # Заказы шли не по порядку появления: восстанавливаем порядок ключей
+        if not self._in_order:
+            combo_counts, combo_stats = _merge_combo_shards([self.shard()])
+        else:
+            combo_counts = {self.combos[row]: count for row, count in self.combo_counts.items()}
+            combo_stats = self.combo_stats.as_dict(self.combos, self.category_names)
         
-        # Записываем заголовки
-        headers = ['Комбинация категорий', 'Количество заказов'] + [f'{cat} (кол-во)' for cat in all_upsell_categories] + [f'{cat} (%)' for cat in all_upsell_categories]
-        writer.writerow(headers)
+        return {'combo_counts': combo_counts, 'combo_stats': combo_stats}
+
+def _count_combos(orders, packaging, categories, min_combo_size, max_combo_size):
+    """
+    Подсчитывает комбинации категорий основных товаров и допродажи к ним
+    
+    Args:
+        orders: Заказы (позиция заказа, коды основных товаров, коды допродаж) по возрастанию позиции
+        packaging (list): Признак упаковки для каждого кода товара
+        categories (list): Категория для каждого кода товара
+        min_combo_size (int): Минимальный размер комбинации
+        max_combo_size (int): Максимальный размер комбинации (None - без ограничений)
+    
+    Returns:
+        tuple: Счетчики ComboCounter.shard(): комбинации, категории, счетчики заказов
+            и допродаж и первое появление ключей (позиция заказа, порядковый номер)
+    """
+    counter = ComboCounter(packaging, categories, min_combo_size, max_combo_size)
+    for position, main_products, upsells in orders:
+        counter.add(None, position, main_products, upsells)
+    return counter.shard()
+
+def _count_combo_shard(shard):
+    """Подсчитывает комбинации для одной части заказов (выполняется в отдельном процессе)"""
+    order_ids, product_ids, is_upsell, packaging, categories, min_combo_size, max_combo_size = shard
+    
+    # Код заказа совпадает с его позицией в порядке появления в файле
+    orders = group_rows(order_ids, product_ids, is_upsell)
+    
+    # Счетчики на массивах сериализуются как есть
+    return _count_combos(orders, packaging, categories, min_combo_size, max_combo_size)
+
+def _merge_combo_shards(results):
+    """
+    Объединяет частичные подсчеты в порядке первого появления ключей во всем файле,
+    чтобы результат совпадал с однопроцессным подсчетом
+
+    Коды комбинаций в частях присваивались независимо, поэтому объединение идет
+    по самим комбинациям.
+    """
+    counts = {}
+    stats = {}
+    first_seen = {'counts': {}, 'stats': {}, 'cells': {}}
+    
+    for combos, category_names, shard_counts, shard_stats, shard_seen in results:
+        for row, count in shard_counts.items():
+            counts[combos[row]] = counts.get(combos[row], 0) + count
+        for combo, upsell_stats in shard_stats.as_dict(combos, category_names).items():
+            merged = stats.setdefault(combo, {})
+            for category, count in upsell_stats.items():
+                merged[category] = merged.get(category, 0) + count
         
-        # Записываем данные по каждой комбинации
-        for combo, upsell_stats in sorted(combo_stats.items(), key=lambda x: combo_counts[x[0]], reverse=True):
-            combo_str = " + ".join(combo)  # Используем join для комбинаций любого размера
-            combo_count = combo_counts[combo]
-            
-            row = [combo_str, combo_count]
-            
-            # Добавляем количество допродаж
-            for category in all_upsell_categories:
-                row.append(upsell_stats[category])
-            
-            # Добавляем проценты
-            for category in all_upsell_categories:
-                if combo_count > 0:
-                    percentage = round((upsell_stats[category] / combo_count) * 100, 1)
+        num_columns = shard_stats.num_columns
+        for kind, seen in shard_seen.items():
+            merged_seen = first_seen[kind]
+            for code in seen.order():
+                if kind == 'cells':
+                    row, column = divmod(code, num_columns)
+                    key = (combos[row], category_names[column])
                 else:
-                    percentage = 0
-                row.append(f"{percentage}%")
-            
-            writer.writerow(row)
-            
+                    key = combos[code]
+                position = seen.get(code)
+                if key not in merged_seen or position < merged_seen[key]:
+                    merged_seen[key] = position
+    
+    combo_counts = {combo: counts[combo] for combo in sorted(counts, key=first_seen['counts'].get)}
+    
+    combo_stats = {}
+    for combo in sorted(stats, key=first_seen['stats'].get):
+        combo_stats[combo] = {
+            category: stats[combo][category]
+            for category in sorted(stats[combo], key=lambda category: first_seen['cells'][combo, category])
+        }
+    
+    return combo_counts, combo_stats
+
+# Движки подсчета: перебор комбинаций в каждом заказе или битовые маски категорий
+ENGINES = ('loop', 'bitmask')
+
+def count_combo_upsells(store, min_combo_size=2, max_combo_size=None, workers=1, engine='loop'):
+    """
+    Подсчитывает агрегаты анализа комбинаций категорий
+    
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
+        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+        workers (int): Количество процессов для подсчета (по умолчанию 1)
+        engine (str): Движок подсчета: 'loop' (по умолчанию) или 'bitmask'
+    
+    Returns:
+        dict: Всего заказов, число заказов с каждой комбинацией и допродажи к ней по категориям
+    """
+    packaging = store.product_is_packaging.tolist()
+    categories = [store.category_names[code] for code in store.product_categories]
+    
+    if engine == 'bitmask':
+        with phase('aggregate'):
+            combo_counts, combo_stats = count_combos_bitmask(store, min_combo_size, max_combo_size)
+    elif workers > 1:
+        # Заказы делятся между процессами по хэшу номера, частичные счетчики затем суммируются
+        shards = [
+            (order_ids, product_ids, is_upsell, packaging, categories, min_combo_size, max_combo_size)
+            for order_ids, product_ids, is_upsell in store.partition(workers)
+        ]
+        with phase('aggregate'), ProcessPoolExecutor(max_workers=workers) as executor:
+            combo_counts, combo_stats = _merge_combo_shards(executor.map(_count_combo_shard, shards))
+    else:
+        counter = ComboCounter(packaging, categories, min_combo_size, max_combo_size)
+        return {'total_orders': store.num_orders, **run_analyzers(store, [counter])[0]}
+    
+    return {
+        'total_orders': store.num_orders,
+        'combo_counts': dict(combo_counts),
+        'combo_stats': {combo: dict(stats) for combo, stats in combo_stats.items()},
+    }
+
+def merge_combo_stats(old, new):
+    """Объединяет агрегаты двух частей файла (новая часть идет после старой)"""
+    combo_counts = dict(old['combo_counts'])
+    for combo, count in new['combo_counts'].items():
+        combo_counts[combo] = combo_counts.get(combo, 0) + count
+    
+    combo_stats = {combo: dict(stats) for combo, stats in old['combo_stats'].items()}
+    for combo, stats in new['combo_stats'].items():
+        merged = combo_stats.setdefault(combo, {})
+        for category, count in stats.items():
+            merged[category] = merged.get(category, 0) + count
+    
+    return {
+        'total_orders': old['total_orders'] + new['total_orders'],
+        'combo_counts': combo_counts,
+        'combo_stats': combo_stats,
+    }
+
+def write_combo_report(stats, significance=False):
+    """
+    Выводит итоги в консоль и сохраняет 'combo_analysis.csv'
+    
+    С significance = True для каждой пары (комбинация, категория допродажи) в CSV добавляются
+    95% доверительный интервал доли, лифт относительно доли по всем комбинациям отчета
+    и p-значение с флагом значимости (significance.significance_columns()).
+    """
+    combo_counts = stats['combo_counts']
+    combo_stats = stats['combo_stats']
+    
+    print(f"Загружено {stats['total_orders']} заказов")
+    
+    # Получаем все уникальные категории допродаж
+    all_upsell_categories = set()
+    for combo_data in combo_stats.values():
+        all_upsell_categories.update(combo_data.keys())
+    all_upsell_categories = sorted(list(all_upsell_categories))
+    
+    # Комбинации сортируются один раз: по ним же строятся CSV и топ в консоли
+    combos = sorted(combo_stats, key=combo_counts.__getitem__, reverse=True)
+    orders = [combo_counts[combo] for combo in combos]
+    counts = count_matrix(combo_stats, combos, all_upsell_categories)
+    
+    # Создаем результирующий CSV
+    headers = ['Комбинация категорий', 'Количество заказов'] + [f'{cat} (кол-во)' for cat in all_upsell_categories] + [f'{cat} (%)' for cat in all_upsell_categories]
+    table = ([[" + ".join(combo) for combo in combos], orders]
+             + [counts[:, i] for i in range(len(all_upsell_categories))]
+             + [Percentages(counts[:, i], orders) for i in range(len(all_upsell_categories))])
+    if significance:
+        significance_headers, significance_table, significant, tested = significance_columns(counts, orders,
+                                                                                            all_upsell_categories)
+        headers += significance_headers
+        table += significance_table
+    write_table('combo_analysis.csv', headers, table)
     
     print(f"\nНайдено {len(combo_counts)} уникальных комбинаций категорий")
     print(f"Из них {len(combo_stats)} комбинаций имеют допродажи")
@@ -149,12 +331,9 @@ def analyze_combo_upsells(min_combo_size=2, max_combo_size=None):
     
     # Выводим топ-10 комбинаций с допродажами
     print(f"\nТоп комбинации с допродажами:")
-    combo_items = list(combo_stats.items())
-    combo_items.sort(key=lambda x: combo_counts[x[0]], reverse=True)
-    
-    for i, (combo, upsell_stats) in enumerate(combo_items[:10]):
+    for i, (combo, combo_count) in enumerate(zip(combos[:10], orders)):
         combo_str = " + ".join(combo)  # Универсальный join для любого размера комбинации
-        combo_count = combo_counts[combo]
+        upsell_stats = combo_stats[combo]
         print(f"\n{i+1}. {combo_str} (заказов: {combo_count})")
         
         for category, count in sorted(upsell_stats.items(), key=lambda x: x[1], reverse=True):
@@ -163,28 +342,166 @@ def analyze_combo_upsells(min_combo_size=2, max_combo_size=None):
                 print(f"   - {category}: {count} допродаж ({percentage}%)")
     
     print(f"\nОбщая статистика по комбинациям (топ-10):")
-    top_combos = sorted(combo_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_combos = heapq.nlargest(10, combo_counts.items(), key=lambda x: x[1])
     for combo, count in top_combos:
         combo_str = " + ".join(combo)  # Универсальный join
         print(f"  - {combo_str}: {count} заказов")
     
+    if significance:
+        print(f"\nЗначимо отличаются от доли по всем комбинациям (p < {SIGNIFICANCE_LEVEL}): "
+              f"{significant} из {tested} пар (комбинация, категория допродажи)")
+    
     print(f"\nРезультаты сохранены в файл 'combo_analysis.csv'")
 
+def filter_combo_sizes(stats, min_combo_size=2, max_combo_size=None):
+    """
+    Оставляет в агрегатах только комбинации заданных размеров
+
+    Комбинации каждого размера считаются независимо, поэтому результат совпадает
+    с подсчетом только этих размеров.
+    """
+    def selected(combo):
+        return len(combo) >= min_combo_size and (not max_combo_size or len(combo) <= max_combo_size)
+    
+    return {
+        'total_orders': stats['total_orders'],
+        'combo_counts': {combo: count for combo, count in stats['combo_counts'].items() if selected(combo)},
+        'combo_stats': {combo: upsells for combo, upsells in stats['combo_stats'].items() if selected(combo)},
+    }
+
+def filter_min_support(stats, min_support):
+    """
+    Отбрасывает комбинации, встретившиеся меньше чем в min_support заказах
+    
+    Доли по редким комбинациям - в основном шум, поэтому они убираются из агрегатов
+    до построения отчета.
+    """
+    return {
+        'total_orders': stats['total_orders'],
+        'combo_counts': {combo: count for combo, count in stats['combo_counts'].items() if count >= min_support},
+        'combo_stats': {combo: upsells for combo, upsells in stats['combo_stats'].items()
+                        if stats['combo_counts'][combo] >= min_support},
+    }
+
+def analyze_combo_upsells(min_combo_size=2, max_combo_size=None, store=None, workers=1, engine='loop',
+                          incremental=False, filters=None, options=None, min_support=1, significance=False):
+    """
+    Анализирует комбинации категорий товаров
+    
+    Args:
+        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
+        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+        store (OrderStore): Загруженные заказы (по умолчанию читается 'products.csv')
+        workers (int): Количество процессов для подсчета (по умолчанию 1)
+        engine (str): Движок подсчета: 'loop' (по умолчанию) или 'bitmask'
+        incremental (bool): Обработать только строки, дописанные в 'products.csv'
+            с прошлого запуска, и объединить их с сохраненными агрегатами
+        filters (dict): Отбор по периоду и сегментам (pop_rollup_options()); агрегаты
+            складываются из сохраненных дневных агрегатов без перебора заказов
+        options (dict): Параметры чтения заказов (файл для инкрементального режима
+            и построения дневных агрегатов)
+        min_support (int): Минимальное число заказов с комбинацией (по умолчанию 1 - все)
+        significance (bool): Добавить в отчет доверительные интервалы, лифт и значимость
+    """
+    print("Анализирую заказы с комбинациями категорий...")
+    
+    def count(store):
+        return count_combo_upsells(store, min_combo_size, max_combo_size, workers, engine)
+    
+    if filters is not None:
+        # Дневные агрегаты хранят комбинации всех размеров, нужные выбираются при запросе
+        stats = rollup_stats('combo_analysis', count_combo_upsells, filters, options)
+        stats = filter_combo_sizes(stats, min_combo_size, max_combo_size)
+    elif incremental:
+        params = {'min_combo_size': min_combo_size, 'max_combo_size': max_combo_size}
+        stats = update_incremental('combo_analysis', count, merge_combo_stats, params,
+                                   path=(options or default_options())['path'])
+    else:
+        # Читаем CSV файл
+        if store is None:
+            store = load_orders()
+        stats = count(store)
+    
+    if min_support > 1:
+        found = len(stats['combo_counts'])
+        stats = filter_min_support(stats, min_support)
+        print(f"Отброшено {found - len(stats['combo_counts'])} комбинаций, встретившихся меньше чем "
+              f"в {min_support} заказах")
+    
+    with phase('write'):
+        write_combo_report(stats, significance)
+
 if __name__ == "__main__":
     # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    filters, args = pop_rollup_options(args)
     min_size = 2
     max_size = None
+    workers = 1
+    engine = 'loop'
+    min_support = 1
+    significance = '--significance' in args
+    if significance:
+        args.remove('--significance')
+    
+    if '--engine' in args:
+        index = args.index('--engine')
+        if index + 1 >= len(args) or args[index + 1] not in ENGINES:
+            print(f"Ошибка: допустимый аргумент --engine {{{'|'.join(ENGINES)}}}")
+            sys.exit(1)
+        engine = args[index + 1]
+        del args[index:index + 2]
+    
+    if '--workers' in args:
+        index = args.index('--workers')
+        try:
+            workers = int(args[index + 1])
+        except (IndexError, ValueError):
+            print("Ошибка: после --workers должно идти число (количество процессов)")
+            sys.exit(1)
+        if workers < 1:
+            print("Ошибка: количество процессов должно быть больше 0")
+            sys.exit(1)
+        del args[index:index + 2]
     
-    if len(sys.argv) > 1:
+    if '--min-support' in args:
+        index = args.index('--min-support')
         try:
-            min_size = int(sys.argv[1])
+            min_support = int(args[index + 1])
+        except (IndexError, ValueError):
+            print("Ошибка: после --min-support должно идти число (минимум заказов с комбинацией)")
+            sys.exit(1)
+        if min_support < 1:
+            print("Ошибка: минимум заказов с комбинацией должен быть больше 0")
+            sys.exit(1)
+        del args[index:index + 2]
+    
+    # Части заказов передаются процессам из таблицы строк в памяти
+    if workers > 1 and options['stream']:
+        print("Ошибка: --workers нельзя использовать вместе с --stream")
+        sys.exit(1)
+    
+    # Битовым маскам нужна вся таблица строк в памяти, а процессы им не нужны
+    if engine == 'bitmask' and (options['stream'] or workers > 1):
+        print("Ошибка: --engine bitmask нельзя использовать вместе с --stream или --workers")
+        sys.exit(1)
+    
+    # Дневные агрегаты строятся по всему файлу в памяти одним процессом
+    if filters is not None and (options['stream'] or options['incremental'] or workers > 1 or engine != 'loop'):
+        print("Ошибка: --from, --to и --segment нельзя использовать вместе с --stream, --incremental, "
+              "--workers и --engine")
+        sys.exit(1)
+    
+    if len(args) > 0:
+        try:
+            min_size = int(args[0])
         except ValueError:
             print("Ошибка: первый аргумент должен быть числом (минимальный размер комбинации)")
             sys.exit(1)
     
-    if len(sys.argv) > 2:
+    if len(args) > 1:
         try:
-            max_size = int(sys.argv[2])
+            max_size = int(args[1])
         except ValueError:
             print("Ошибка: второй аргумент должен быть числом (максимальный размер комбинации)")
             sys.exit(1)
@@ -204,4 +521,17 @@ if __name__ == "__main__":
     else:
         print(f"Анализируются комбинации от {min_size} категорий и выше")
     
-    analyze_combo_upsells(min_size, max_size)
+    if filters is not None:
+        try:
+            analyze_combo_upsells(min_size, max_size, filters=filters, options=options, min_support=min_support,
+                                  significance=significance)
+        except ValueError as error:
+            print(f"Ошибка: {error}")
+            sys.exit(1)
+    elif options['incremental']:
+        analyze_combo_upsells(min_size, max_size, workers=workers, engine=engine, incremental=True,
+                              options=options, min_support=min_support, significance=significance)
+    else:
+        analyze_combo_upsells(min_size, max_size, store=open_orders(options), workers=workers,
+                              engine=engine, min_support=min_support, significance=significance)
+    report_memory(options)
@@ -0,0 +1,219 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# До какого числа категорий суммы по надмножествам считаются по плотным массивам размера 2^K
+DENSE_MAX_CATEGORIES = 16
+
+# Маска хранится в uint64
+MAX_CATEGORIES = 64
+
+# "Бесконечная" позиция для масок, которые не встречались
+_NEVER = np.iinfo(np.int64).max
+
+
+def _superset_sum(values):
+    """Для каждой маски S суммирует значения всех масок, содержащих S (преобразование дзета)"""
+    size = values.shape[0]
+    bit = 1
+    while bit < size:
+        blocks = values.reshape(size // (2 * bit), 2, bit, *values.shape[1:])
+        blocks[:, 0] += blocks[:, 1]
+        bit *= 2
+    return values
+
+
+def _superset_min(values):
+    """Для каждой маски S берет минимум значений всех масок, содержащих S"""
+    size = values.shape[0]
+    bit = 1
+    while bit < size:
+        blocks = values.reshape(size // (2 * bit), 2, bit, *values.shape[1:])
+        np.minimum(blocks[:, 0], blocks[:, 1], out=blocks[:, 0])
+        bit *= 2
+    return values
+
+
+def _popcount(masks):
+    """Количество единичных битов в каждой маске"""
+    counts = np.zeros(len(masks), dtype=np.int64)
+    masks = masks.copy()
+    while masks.any():
+        counts += (masks & np.uint64(1)).astype(np.int64)
+        masks >>= np.uint64(1)
+    return counts
+
+
+def _order_masks(store):
+    """
+    Кодирует заказы битовыми масками категорий основных товаров
+
+    Returns:
+        tuple: (маска каждого заказа, допродажи без упаковки (заказ, категория),
+            первые появления категорий допродаж в заказах (заказ, категория, порядковый номер))
+    """
+    product_categories = store.product_categories.astype(np.int64)
+    packaging = store.product_is_packaging[store.product_ids]
+    row_categories = product_categories[store.product_ids]
+
+    # Маска заказа: объединение битов категорий основных товаров (без коробок и пакетов)
+    main = ~store.is_upsell & ~packaging
+    masks = np.zeros(store.num_orders, dtype=np.uint64)
+    np.bitwise_or.at(masks, store.order_ids[main], np.left_shift(np.uint64(1), row_categories[main].astype(np.uint64)))
+
+    # Допродажи без упаковки
+    real_upsell = store.is_upsell & ~packaging
+    upsells = pd.DataFrame({
+        'order': store.order_ids[real_upsell].astype(np.int64),
+        'category': row_categories[real_upsell],
+    })
+
+    # Первое появление каждой категории допродажи в заказе и ее порядковый номер среди них
+    first_upsells = upsells.drop_duplicates(['order', 'category']).copy()
+    first_upsells['rank'] = first_upsells.groupby('order').cumcount()
+
+    return masks, upsells, first_upsells
+
+
+def count_combos_bitmask(store, min_combo_size=2, max_combo_size=None):
+    """
+    Подсчитывает комбинации категорий через битовые маски
+
+    Каждый заказ кодируется маской категорий основных товаров, заказы и допродажи
+    считаются один раз на уникальную маску, а счетчики всех комбинаций получаются
+    суммированием по надмножествам. Стоимость линейна по числу строк и не зависит
+    от размеров комбинаций.
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_combo_size (int): Минимальный размер комбинации
+        max_combo_size (int): Максимальный размер комбинации (None - без ограничений)
+
+    Returns:
+        tuple: (combo_counts, combo_stats) в том же виде и порядке ключей,
+            что и при переборе заказов
+    """
+    num_categories = len(store.category_names)
+    if num_categories > MAX_CATEGORIES:
+        raise ValueError(f"Битовые маски поддерживают не более {MAX_CATEGORIES} категорий, задано {num_categories}")
+
+    masks, upsells, first_upsells = _order_masks(store)
+
+    # Уникальные маски; коды заказов идут в порядке появления, поэтому позиция = код заказа
+    unique_masks, mask_index = np.unique(masks, return_inverse=True)
+    positions = np.arange(store.num_orders, dtype=np.int64)
+
+    order_counts = np.bincount(mask_index, minlength=len(unique_masks)).astype(np.int64)
+    first_order = np.full(len(unique_masks), _NEVER, dtype=np.int64)
+    np.minimum.at(first_order, mask_index, positions)
+
+    upsell_masks = mask_index[upsells['order'].to_numpy()]
+    upsell_counts = np.zeros((len(unique_masks), num_categories), dtype=np.int64)
+    np.add.at(upsell_counts, (upsell_masks, upsells['category'].to_numpy()), 1)
+
+    # Первый заказ с допродажами и первое появление каждой категории допродажи
+    first_upsell_order = np.full(len(unique_masks), _NEVER, dtype=np.int64)
+    np.minimum.at(first_upsell_order, upsell_masks, upsells['order'].to_numpy())
+
+    first_orders = first_upsells['order'].to_numpy()
+    first_cell = np.full((len(unique_masks), num_categories), _NEVER, dtype=np.int64)
+    np.minimum.at(first_cell, (mask_index[first_orders], first_upsells['category'].to_numpy()),
+                  first_orders * num_categories + first_upsells['rank'].to_numpy())
+
+    if num_categories <= DENSE_MAX_CATEGORIES:
+        combos = _accumulate_dense(num_categories, unique_masks, order_counts, first_order,
+                                   upsell_counts, first_upsell_order, first_cell)
+    else:
+        combos = _accumulate_sparse(unique_masks, order_counts, first_order,
+                                    upsell_counts, first_upsell_order, first_cell, min_combo_size, max_combo_size)
+
+    combo_masks, counts, firsts, stats, first_upsells, first_cells = combos
+
+    # Оставляем комбинации нужного размера, которые встречались хотя бы в одном заказе
+    sizes = _popcount(combo_masks)
+    keep = (counts > 0) & (sizes >= min_combo_size)
+    if max_combo_size:
+        keep &= sizes <= max_combo_size
+
+    names = store.category_names
+    sorted_codes = sorted(range(num_categories), key=lambda code: names[code])
+    rows = np.flatnonzero(keep).tolist()
+    combo_keys = {
+        row: tuple(names[code] for code in sorted_codes if int(combo_masks[row]) >> code & 1)
+        for row in rows
+    }
+
+    # Порядок ключей как при переборе: по первому заказу, внутри заказа - по размеру и названиям
+    combo_counts = {}
+    for row in sorted(rows, key=lambda row: (firsts[row], sizes[row], combo_keys[row])):
+        combo_counts[combo_keys[row]] = int(counts[row])
+
+    combo_stats = {}
+    rows = [row for row in rows if stats[row].any()]
+    for row in sorted(rows, key=lambda row: (first_upsells[row], sizes[row], combo_keys[row])):
+        codes = np.flatnonzero(stats[row]).tolist()
+        upsell_stats = combo_stats[combo_keys[row]] = {}
+        for code in sorted(codes, key=lambda code: first_cells[row, code]):
+            upsell_stats[names[code]] = int(stats[row, code])
+
+    return combo_counts, combo_stats
+
+
+def _accumulate_dense(num_categories, unique_masks, order_counts, first_order,
+                      upsell_counts, first_upsell_order, first_cell):
+    """Суммы по надмножествам на плотных массивах по всем 2^K маскам"""
+    size = 1 << num_categories
+    index = unique_masks.astype(np.int64)
+
+    counts = np.zeros(size, dtype=np.int64)
+    counts[index] = order_counts
+    firsts = np.full(size, _NEVER, dtype=np.int64)
+    firsts[index] = first_order
+    stats = np.zeros((size, num_categories), dtype=np.int64)
+    stats[index] = upsell_counts
+    first_upsells = np.full(size, _NEVER, dtype=np.int64)
+    first_upsells[index] = first_upsell_order
+    first_cells = np.full((size, num_categories), _NEVER, dtype=np.int64)
+    first_cells[index] = first_cell
+
+    _superset_sum(counts)
+    _superset_sum(stats)
+    _superset_min(firsts)
+    _superset_min(first_upsells)
+    _superset_min(first_cells)
+
+    combo_masks = np.arange(size, dtype=np.uint64)
+    return combo_masks, counts, firsts, stats, first_upsells, first_cells
+
+
+def _accumulate_sparse(unique_masks, order_counts, first_order, upsell_counts,
+                       first_upsell_order, first_cell, min_combo_size, max_combo_size):
+    """Для больших таксономий: перебор подмножеств нужного размера только у встречавшихся масок"""
+    accumulated = {}
+    for i, mask in enumerate(unique_masks.tolist()):
+        bits = [code for code in range(mask.bit_length()) if mask >> code & 1]
+        largest = min(max_combo_size or len(bits), len(bits))
+        for combo_size in range(min_combo_size, largest + 1):
+            for combo_bits in combinations(bits, combo_size):
+                combo_mask = sum(1 << code for code in combo_bits)
+                entry = accumulated.get(combo_mask)
+                if entry is None:
+                    accumulated[combo_mask] = [order_counts[i], first_order[i], upsell_counts[i].copy(),
+                                               first_upsell_order[i], first_cell[i].copy()]
+                    continue
+                entry[0] += order_counts[i]
+                entry[1] = min(entry[1], first_order[i])
+                entry[2] += upsell_counts[i]
+                entry[3] = min(entry[3], first_upsell_order[i])
+                np.minimum(entry[4], first_cell[i], out=entry[4])
+
+    combo_masks = np.array(list(accumulated), dtype=np.uint64)
+    entries = list(accumulated.values())
+    num_categories = upsell_counts.shape[1]
+    counts = np.array([entry[0] for entry in entries], dtype=np.int64)
+    firsts = np.array([entry[1] for entry in entries], dtype=np.int64)
+    stats = np.array([entry[2] for entry in entries], dtype=np.int64).reshape(-1, num_categories)
+    first_upsells = np.array([entry[3] for entry in entries], dtype=np.int64)
+    first_cells = np.array([entry[4] for entry in entries], dtype=np.int64).reshape(-1, num_categories)
+    return combo_masks, counts, firsts, stats, first_upsells, first_cells
@@ -0,0 +1,270 @@
+from array import array
+
+import numpy as np
+
+# С какого размера буфера новых пар UniquePairs проверяет их на повтор (пар)
+COMPACT_MIN = 1 << 16
+
+
+def _zeros(size):
+    """array('q') из size нулей"""
+    return array('q', bytes(8 * size))
+
+
+class IdCounter:
+    """
+    Счетчики по целочисленным кодам (товаров, категорий, комбинаций)
+
+    Счетчики хранятся в одном массиве array('q') (8 байт на код) вместо словаря,
+    коды - в порядке первого появления: при равных счетчиках отчеты выводят ключи
+    в том же порядке, что и словари. Объект сериализуется pickle и объединяется
+    с другим счетчиком (merge()).
+
+    В циклах подсчета массивы counts и order используются напрямую, без вызова методов.
+    """
+
+    def __init__(self, size=0):
+        """
+        Args:
+            size (int): Количество кодов (можно увеличить через grow())
+        """
+        self.counts = _zeros(size)      # код -> счетчик
+        self.order = array('q')         # коды с ненулевым счетчиком в порядке первого появления
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def size(self):
+        return len(self.counts)
+
+    def grow(self, size):
+        """Увеличивает число кодов до size"""
+        if size > len(self.counts):
+            self.counts.extend(_zeros(size - len(self.counts)))
+
+    def add(self, code, count=1):
+        """Увеличивает счетчик кода"""
+        if not self.counts[code]:
+            self.order.append(code)
+        self.counts[code] += count
+
+    def items(self):
+        """Пары (код, счетчик) в порядке первого появления"""
+        counts = self.counts
+        return [(code, counts[code]) for code in self.order]
+
+    def values(self):
+        """Счетчики всех кодов (копия в виде массива NumPy int64)"""
+        return np.array(self.counts, dtype=np.int64)
+
+    def merge(self, other, codes=None):
+        """
+        Добавляет счетчики другого объекта (его коды, новые для этого, идут после своих)
+
+        Args:
+            other (IdCounter): Счетчики, например, другой части заказов
+            codes (sequence): Код other -> код этого счетчика, если коды присваивались
+                независимо (по умолчанию коды общие)
+        """
+        for code, count in other.items():
+            self.add(code if codes is None else codes[code], count)
+
+
+class CountMatrix(IdCounter):
+    """
+    Плотная матрица счетчиков "строка x колонка" (например, категория x категория допродажи)
+
+    Ячейка (строка, колонка) - код строка * num_columns + колонка в IdCounter, поэтому
+    матрица занимает 8 байт на ячейку и без словарей видна как 2-D массив NumPy
+    (matrix()). Строки можно добавлять по мере появления ключей (add_row()).
+    """
+
+    def __init__(self, num_columns, num_rows=0):
+        """
+        Args:
+            num_columns (int): Количество колонок
+            num_rows (int): Начальное количество строк
+        """
+        super().__init__(num_rows * num_columns)
+        self.num_columns = num_columns
+
+    @property
+    def num_rows(self):
+        return len(self.counts) // self.num_columns if self.num_columns else 0
+
+    def add_row(self):
+        """Добавляет строку из нулей и возвращает ее номер"""
+        row = self.num_rows
+        self.counts.extend(_zeros(self.num_columns))
+        return row
+
+    def matrix(self):
+        """Матрица счетчиков num_rows x num_columns (копия в виде массива NumPy int64)"""
+        return self.values().reshape(self.num_rows, self.num_columns)
+
+    def as_dict(self, row_keys, column_keys):
+        """
+        Ненулевые счетчики в виде вложенных словарей {строка: {колонка: счетчик}}
+
+        Строки идут в порядке появления их первой ячейки, ячейки строки - в порядке
+        появления, как при подсчете во вложенных словарях.
+
+        Args:
+            row_keys (sequence): Номер строки -> ключ (например, название категории)
+            column_keys (sequence): Номер колонки -> ключ
+        """
+        num_columns = self.num_columns
+        result = {}
+        for cell, count in self.items():
+            row, column = divmod(cell, num_columns)
+            result.setdefault(row_keys[row], {})[column_keys[column]] = count
+        return result
+
+    def merge(self, other, rows=None):
+        """
+        Добавляет счетчики другой матрицы с теми же колонками
+
+        Args:
+            other (CountMatrix): Счетчики другой части заказов
+            rows (sequence): Строка other -> строка этой матрицы (по умолчанию строки общие)
+        """
+        num_columns = self.num_columns
+        for cell, count in other.items():
+            if rows is not None:
+                row, column = divmod(cell, num_columns)
+                cell = rows[row] * num_columns + column
+            self.add(cell, count)
+
+
+class FirstSeen:
+    """
+    Первое появление кодов: (позиция заказа, порядковый номер) в двух массивах array('q')
+
+    Позволяет восстановить порядок ключей, как при переборе заказов по порядку, когда
+    заказы приходят в другом порядке. Позиция -1 - код еще не встречался; count -
+    сколько порядковых номеров уже выдано (у каждого кода свой, номера не повторяются).
+    """
+
+    def __init__(self, size=0):
+        self.positions = array('q', [-1]) * size
+        self.sequence = _zeros(size)
+        self.count = 0
+
+    def grow(self, size):
+        """Увеличивает число кодов до size"""
+        if size > len(self.positions):
+            self.positions.extend(array('q', [-1]) * (size - len(self.positions)))
+            self.sequence.extend(_zeros(size - len(self.sequence)))
+
+    def see(self, code, position):
+        """
+        Учитывает появление кода в заказе с позицией position
+
+        Запоминается самая ранняя позиция; порядковый номер новый при каждом обновлении
+        позиции (различает коды, появившиеся в одном заказе, в порядке их появления в нем).
+        """
+        positions = self.positions
+        if positions[code] < 0 or position < positions[code]:
+            positions[code] = position
+            self.sequence[code] = self.count
+            self.count += 1
+
+    def get(self, code):
+        """(позиция, порядковый номер) первого появления кода или None"""
+        position = self.positions[code]
+        return None if position < 0 else (position, self.sequence[code])
+
+    def order(self):
+        """Коды, которые встречались, в порядке первого появления"""
+        positions = np.array(self.positions, dtype=np.int64)
+        sequence = np.array(self.sequence, dtype=np.int64)
+        seen = np.flatnonzero(positions >= 0)
+        return seen[np.lexsort((sequence[seen], positions[seen]))].tolist()
+
+
+class UniquePairs:
+    """
+    Уникальные пары кодов (строка, колонка) в порядке первого появления
+
+    Например, уникальные допродажи к каждому товару. Уникальные пары хранятся в
+    array('q') в порядке появления, а их номера в порядке возрастания кода пары -
+    в массиве NumPy (индекс для двоичного поиска). Новые пары дописываются в
+    небольшой буфер без проверки; когда он заполнен, повторы в нем убираются
+    np.unique, а уже известные пары отсеиваются поиском по индексу. Память -
+    16 байт на уникальную пару плюс буфер, без словаря или множества на каждую
+    строку и без копий всех пар при очистке буфера.
+    """
+
+    def __init__(self, num_columns):
+        """
+        Args:
+            num_columns (int): Количество колонок (кодов второго элемента пары)
+        """
+        self.num_columns = num_columns
+        self.pairs = array('q')                     # уникальные коды пар строка * num_columns + колонка
+        self.index = np.zeros(0, dtype=np.int64)    # номера пар в pairs по возрастанию кода
+        self.buffer = array('q')                    # новые коды пар, еще не проверенные на повтор
+        self.compact_at = COMPACT_MIN               # при каком размере буфера его проверить
+
+    def add(self, row, columns):
+        """Добавляет пары строки с каждой из колонок"""
+        base = row * self.num_columns
+        self.buffer.extend([base + column for column in columns])
+        if len(self.buffer) >= self.compact_at:
+            self.compact()
+
+    def compact(self):
+        """Переносит новые пары из буфера в уникальные, сохраняя порядок первого появления"""
+        if not self.buffer:
+            return
+        codes = np.array(self.buffer, dtype=np.int64)
+        self.buffer = array('q')
+        _, first = np.unique(codes, return_index=True)
+        codes = codes[np.sort(first)]
+
+        # Пары, которые уже встречались раньше, отбрасываются
+        known = np.frombuffer(self.pairs, dtype=np.int64)
+        slots = np.searchsorted(known, codes, sorter=self.index)
+        seen = np.zeros(len(codes), dtype=bool)
+        inside = slots < len(known)
+        seen[inside] = known[self.index[slots[inside]]] == codes[inside]
+        codes = codes[~seen]
+        slots = slots[~seen]
+        del known
+
+        # Номера новых пар встают в индекс на свои места по возрастанию кода
+        numbers = np.arange(len(self.pairs), len(self.pairs) + len(codes))
+        order = np.argsort(codes, kind='stable')
+        self.index = np.insert(self.index, slots[order], numbers[order])
+        self.pairs.frombytes(codes.tobytes())
+        # Буфер растет вместе с числом пар, чтобы проверок было не больше, чем нужно
+        self.compact_at = max(COMPACT_MIN, len(self.pairs) // 8)
+
+    def columns_by_row(self):
+        """
+        Словарь {строка: массив колонок NumPy} в порядке первого появления пар
+
+        Массивы - части одного массива, а не списки: списки строк создает вызывающий
+        код по одному, и в памяти не держатся объекты int на каждую пару.
+        """
+        self.compact()
+        if not self.pairs:
+            return {}
+        codes = np.frombuffer(self.pairs, dtype=np.int64)
+        # Строки и колонки помещаются в int32: временные массивы вдвое меньше кодов
+        rows = (codes // self.num_columns).astype(np.int32)
+        order = np.argsort(rows, kind='stable')
+        rows = rows[order]
+        columns = (codes % self.num_columns).astype(np.int32)[order]
+        del order
+        bounds = np.flatnonzero(np.diff(rows)) + 1
+        starts = [0] + bounds.tolist()
+        return dict(zip(rows[starts].tolist(), np.split(columns, bounds)))
+
+    def merge(self, other):
+        """Добавляет пары другого объекта (после своих)"""
+        self.compact()
+        self.buffer.extend(other.pairs)
+        self.buffer.extend(other.buffer)
+        self.compact()
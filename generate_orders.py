@@ -0,0 +1,136 @@
+import csv
+import random
+import sys
+from datetime import date, timedelta
+
+from order_loader import UPSELL_MARKER
+
+# Типы украшений для названий товаров (последний попадает в категорию 'Другое')
+PRODUCT_KINDS = ['Кольє', 'Сережки', 'Браслет', 'Каблучка', 'Кафф', 'Анклет', 'Чокер', 'Брошка']
+
+# Упаковка, которую анализы исключают
+PACKAGING_KINDS = ['Коробка', 'Пакет']
+
+# Сколько разных видов упаковки в каталоге
+PACKAGING_PRODUCTS = 10
+
+# Каналы продаж для колонки 'Канал'
+CHANNELS = ['Сайт', 'Маркетплейс', 'Магазин', 'Телефон']
+
+# Первый день заказов в колонке 'Дата'
+FIRST_DAY = date(2024, 1, 1)
+
+
+def _catalog(catalog_size, rng):
+    """Названия товаров и упаковки в формате выгрузки"""
+    products = [f'{rng.choice(PRODUCT_KINDS)} "Model {i}", {rng.randint(10, 50)} см' for i in range(catalog_size)]
+    packaging = [f'{PACKAGING_KINDS[i % len(PACKAGING_KINDS)]} Подарунковий {i}' for i in range(PACKAGING_PRODUCTS)]
+    return products, packaging
+
+
+def generate_orders(path, rows, items_per_order=3, upsell_rate=0.3, packaging_rate=0.1, catalog_size=500,
+                    seed=1, days=0, channels=0):
+    """
+    Создает синтетический файл заказов в формате products.csv
+
+    При одинаковых параметрах и seed файл получается одинаковым. Строки одного заказа
+    идут подряд, номера заказов возрастают, даты заказов (если есть) не убывают.
+
+    Args:
+        path (str): Путь к создаваемому CSV файлу
+        rows (int): Количество строк (последний заказ может быть короче)
+        items_per_order (int): Среднее количество товаров в заказе
+        upsell_rate (float): Доля допродаж среди товаров заказа (кроме первого)
+        packaging_rate (float): Доля упаковки ('Коробка', 'Пакет') среди товаров
+        catalog_size (int): Количество разных товаров в каталоге
+        seed (int): Начальное значение генератора случайных чисел
+        days (int): Количество дней для колонки 'Дата' (0 - без колонки)
+        channels (int): Количество каналов продаж для колонки 'Канал' (0 - без колонки)
+
+    Returns:
+        int: Количество созданных заказов
+    """
+    rng = random.Random(seed)
+    products, packaging = _catalog(catalog_size, rng)
+    max_items = max(1, 2 * items_per_order - 1)
+
+    orders = 0
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['№ заказа', 'Допродажа', 'Артикул', 'Товары'] + (['Дата'] if days else [])
+                        + (['Канал'] if channels else []))
+
+        while written < rows:
+            order_id = 100000 + orders
+            orders += 1
+            batch = []
+
+            # Дата и канал общие для всех строк заказа
+            extra = []
+            if days:
+                extra.append((FIRST_DAY + timedelta(days=written * days // rows)).isoformat())
+            if channels:
+                extra.append(CHANNELS[rng.randrange(min(channels, len(CHANNELS)))])
+
+            for item in range(min(rng.randint(1, max_items), rows - written)):
+                if rng.random() < packaging_rate:
+                    code = catalog_size + rng.randrange(len(packaging))
+                    name = packaging[code - catalog_size]
+                else:
+                    code = rng.randrange(catalog_size)
+                    name = products[code]
+                upsell = UPSELL_MARKER if item > 0 and rng.random() < upsell_rate else ''
+                batch.append((order_id, upsell, f'ART{code:06d}', name, *extra))
+            writer.writerows(batch)
+            written += len(batch)
+
+    return orders
+
+
+def _parse_options(args):
+    """Разбирает именованные параметры генератора"""
+    names = {
+        '--items': ('items_per_order', int),
+        '--upsell-rate': ('upsell_rate', float),
+        '--packaging-rate': ('packaging_rate', float),
+        '--catalog': ('catalog_size', int),
+        '--seed': ('seed', int),
+        '--days': ('days', int),
+        '--channels': ('channels', int),
+    }
+    options = {}
+    rest = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg not in names:
+            rest.append(arg)
+            continue
+        name, convert = names[arg]
+        try:
+            options[name] = convert(args.pop(0))
+        except (IndexError, ValueError):
+            print(f"Ошибка: после {arg} должно идти число")
+            sys.exit(1)
+    return options, rest
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    options, args = _parse_options(sys.argv[1:])
+
+    if not args:
+        print("Использование: python generate_orders.py СТРОК [ФАЙЛ] [--items N] [--upsell-rate ДОЛЯ] "
+              "[--packaging-rate ДОЛЯ] [--catalog N] [--seed N] [--days N] [--channels N]")
+        sys.exit(1)
+
+    try:
+        rows = int(args[0])
+    except ValueError:
+        print("Ошибка: первый аргумент должен быть числом (количество строк)")
+        sys.exit(1)
+
+    path = args[1] if len(args) > 1 else 'products.csv'
+    orders = generate_orders(path, rows, **options)
+    print(f"Создан файл '{path}': {rows} строк, {orders} заказов")
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from order_loader import DEFAULT_INPUT, load_orders
+from product_categories import default_classifier
+
+# Версия формата файла состояния; при изменении старые состояния пересчитываются
+STATE_VERSION = 1
+
+# Размер блока при подсчете контрольной суммы
+CHECKSUM_BLOCK = 1 << 20
+
+
+def state_path(path, name):
+    """Путь к файлу состояния анализа рядом с файлом заказов"""
+    return f'{path}.{name}.state'
+
+
+def prefix_checksum(path, length):
+    """Контрольная сумма первых length байт файла"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as data:
+        remaining = length
+        while remaining > 0:
+            block = data.read(min(CHECKSUM_BLOCK, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def _file_watermark(path):
+    """Смещение конца обработанных данных, если файл заканчивается переводом строки"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, 'rb') as data:
+        data.seek(size - 1)
+        # Без перевода строки дописанные данные продолжат последнюю строку
+        return size if data.read(1) == b'\n' else None
+
+
+def _order_hashes(order_keys):
+    """64-битные хэши номеров заказов (не зависят от PYTHONHASHSEED)"""
+    return pd.util.hash_array(np.array(order_keys, dtype=object))
+
+
+def _key_order(order_keys):
+    """Числовые ли все номера и наибольший номер в порядке сортировки (как groupby в pandas)"""
+    if not order_keys:
+        return True, None
+    try:
+        return True, max(int(key) for key in order_keys)
+    except ValueError:
+        return False, max(order_keys)
+
+
+def _config(params, classifier):
+    """Параметры, при изменении которых состояние нужно пересчитать"""
+    return json.dumps({'params': params, 'rules': classifier.fingerprint()}, sort_keys=True, ensure_ascii=False)
+
+
+def _load_state(path, name, config):
+    """Загружает состояние, если оно относится к началу текущего файла и тем же параметрам"""
+    saved = state_path(path, name)
+    if not os.path.exists(saved):
+        return None
+
+    with open(saved, 'rb') as state_file:
+        state = pickle.load(state_file)
+
+    if state.get('version') != STATE_VERSION or state['config'] != config or state['offset'] is None:
+        return None
+    if os.path.getsize(path) < state['offset']:
+        return None
+    if prefix_checksum(path, state['offset']) != state['checksum']:
+        return None
+    return state
+
+
+def _appends_only(state, store, ordered_by_key):
+    """
+    Проверяет, что новые строки - только новые заказы, идущие после уже обработанных
+
+    Если заказ из новых строк уже встречался, или (для анализов в порядке номеров)
+    новые номера не больше уже обработанных, частичный подсчет не совпадет с полным.
+    """
+    if np.isin(_order_hashes(store.order_keys), state['order_hashes']).any():
+        return False
+    if not ordered_by_key or not store.order_keys or state['max_key'] is None:
+        return True
+
+    numeric, _ = _key_order(store.order_keys)
+    if numeric != state['numeric_keys']:
+        return False
+    if numeric:
+        return min(int(key) for key in store.order_keys) > state['max_key']
+    return min(store.order_keys) > state['max_key']
+
+
+def update_incremental(name, count, merge, params=None, path=DEFAULT_INPUT, classifier=None, ordered_by_key=False):
+    """
+    Обновляет сохраненные агрегаты анализа по строкам, дописанным в файл с прошлого запуска
+
+    Состояние (агрегаты, смещение конца обработанных данных, контрольная сумма этой
+    части файла и хэши обработанных заказов) хранится в файле '<path>.<name>.state'.
+    Если начало файла изменилось, параметры другие или новые строки относятся к уже
+    обработанным заказам, агрегаты пересчитываются по всему файлу.
+
+    Args:
+        name (str): Имя анализа (часть имени файла состояния)
+        count (callable): Подсчет агрегатов по OrderStore
+        merge (callable): Объединение агрегатов (старые, новые) -> общие
+        params (dict): Параметры анализа, влияющие на агрегаты
+        path (str): Путь к CSV файлу (по умолчанию 'products.csv')
+        classifier (CategoryClassifier): Классификатор товаров
+        ordered_by_key (bool): Анализ перебирает заказы в порядке номеров
+
+    Returns:
+        dict: Агрегаты по всему файлу
+    """
+    if classifier is None:
+        classifier = default_classifier()
+    config = _config(params or {}, classifier)
+
+    size = os.path.getsize(path)
+    watermark = _file_watermark(path)
+    state = _load_state(path, name, config)
+
+    store = None
+    if state is not None:
+        store = load_orders(path, classifier, start=state['offset'])
+        if _appends_only(state, store, ordered_by_key):
+            print(f"Инкрементальный режим: обрабатываются {store.num_orders} новых заказов")
+        else:
+            state = None
+
+    if state is None:
+        print("Инкрементальный режим: полный пересчет")
+        store = load_orders(path, classifier)
+
+    stats = count(store)
+    if state is not None:
+        stats = merge(state['stats'], stats)
+        order_hashes = np.union1d(state['order_hashes'], _order_hashes(store.order_keys))
+    else:
+        order_hashes = np.unique(_order_hashes(store.order_keys))
+
+    # Если файл дописывался во время чтения, граница обработанных данных неизвестна
+    if os.path.getsize(path) != size:
+        watermark = None
+
+    numeric, max_key = _key_order(store.order_keys)
+    if state is not None and state['max_key'] is not None:
+        numeric = numeric and state['numeric_keys']
+        if max_key is None:
+            max_key = state['max_key']
+        elif numeric:
+            max_key = max(max_key, state['max_key'])
+        else:
+            # Порядок номеров нужен только анализам в порядке номеров, а для них
+            # смена числовых номеров на строковые уже привела к полному пересчету
+            max_key = max(str(max_key), str(state['max_key']))
+    new_state = {
+        'version': STATE_VERSION,
+        'config': config,
+        'offset': watermark,
+        'checksum': prefix_checksum(path, watermark) if watermark is not None else None,
+        'order_hashes': order_hashes,
+        'numeric_keys': numeric,
+        'max_key': max_key,
+        'stats': stats,
+    }
+
+    saved = state_path(path, name)
+    with open(saved + '.tmp', 'wb') as state_file:
+        pickle.dump(new_state, state_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(saved + '.tmp', saved)
+
+    return stats
@@ -1,72 +1,230 @@
+import sys
+
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-import csv
 
-def analyze_upsells():
-    # Читаем CSV файл
-    df = pd.read_csv('products.csv')
-    
-    # Группируем по номеру заказа
-    orders = df.groupby('№ заказа')
-    
-    # Словарь для подсчета допродаж к каждому товару
-    upsell_stats = defaultdict(int)
-    
-    # Словарь для сбора детальной информации
-    detailed_stats = defaultdict(list)
-    
-    orders_with_upsells = 0
-    total_orders = 0
+from analysis_runner import run_analyzers
+from counters import IdCounter, UniquePairs
+from incremental import update_incremental
+from instrumentation import phase
+from input_options import default_options, open_orders, pop_input_options, report_memory
+from order_loader import load_orders
+from report_writer import write_table
+
+# Движки подсчета: построчный перебор заказов или векторные операции над всей таблицей
+ENGINES = ('loop', 'vectorized')
+
+# Сколько примеров допродаж показывать для товара (в CSV и в ответах сервера)
+EXAMPLES_LIMIT = 5
+
+class UpsellCounter:
+    """
+    Подсчет допродаж к основным товарам по одному заказу за раз
+
+    Заказы передаются в порядке номеров (sort_keys = True), как при groupby в pandas.
+    Счетчики хранятся в массивах по коду товара (counters.IdCounter), уникальные
+    допродажи к товарам - парами кодов (counters.UniquePairs), названия подставляются
+    только в result().
+    С verbose = True выводит строку на каждый основной товар заказа с допродажами.
+    """
     
-    print("Анализирую заказы...")
+    sort_keys = True
     
-    for order_id, order_data in orders:
-        total_orders += 1
+    def __init__(self, store, verbose=False):
+        self.names = store.product_names
+        self.verbose = verbose
+        self.packaging = store.product_is_packaging.tolist()
         
-        # Разделяем товары на основные (без допродажи) и допродажи
-        main_products = order_data[order_data['Допродажа'].isna() | (order_data['Допродажа'] == '')]
-        upsell_products = order_data[order_data['Допродажа'] == 'Допродажа']
+        # Количество допродаж к каждому товару (по коду товара, в порядке первой допродажи)
+        self.upsell_counts = IdCounter(len(self.names))
+        
+        # Уникальные пары (товар, допродажа) в порядке первого появления: число примеров
+        # у товара не ограничено - по одной паре на каждую его уникальную допродажу
+        self.upsell_examples = UniquePairs(len(self.names))
+        
+        self.orders_with_upsells = 0
+        self.total_orders = 0
+    
+    def add(self, order_id, position, main_products, upsell_products):
+        """Учитывает один заказ"""
+        names = self.names
+        packaging = self.packaging
+        upsell_counts, products = self.upsell_counts.counts, self.upsell_counts.order
+        upsell_examples = self.upsell_examples
+        self.total_orders += 1
         
         # Фильтруем допродажи, исключая коробки и пакеты
-        real_upsells = upsell_products[~upsell_products['Товары'].str.contains('Коробка|Пакет', na=False)]
+        real_upsells = [product for product in upsell_products if not packaging[product]]
                 
         # Если в заказе есть допродажи (не считая коробки и пакеты)
-        if not real_upsells.empty:
-            orders_with_upsells += 1
+        if real_upsells:
+            self.orders_with_upsells += 1
             
             # Для каждого основного товара увеличиваем счетчик допродаж
-            for _, main_product in main_products.iterrows():
-                main_product_name = main_product['Товары']
-                
+            for main_product in main_products:
                 # Пропускаем коробки и упаковки
-                if 'Коробка' in main_product_name or 'Пакет' in main_product_name:
+                if packaging[main_product]:
                     continue
                 
-                upsell_stats[main_product_name] += 1
+                if not upsell_counts[main_product]:
+                    products.append(main_product)
+                upsell_counts[main_product] += 1
                 
                 # Сохраняем детальную информацию, исключая коробки и пакеты
-                upsell_items = [item['Товары'] for _, item in real_upsells.iterrows()]
-                detailed_stats[main_product_name].extend(upsell_items)
+                upsell_examples.add(main_product, real_upsells)
                 
-                print(f"Заказ {order_id}: к '{main_product_name}' добавили {len(real_upsells)} допродаж")
+                if self.verbose:
+                    print(f"Заказ {order_id}: к '{names[main_product]}' добавили {len(real_upsells)} допродаж")
+    
+    def result(self):
+        """Агрегаты в виде count_upsells()"""
+        names = self.names
+        
+        # Разные коды с одним названием (варианты артикулов) объединяются
+        upsell_examples = self.upsell_examples.columns_by_row()
+        upsell_stats = {}
+        detailed_stats = {}
+        for product, count in self.upsell_counts.items():
+            name = names[product]
+            upsell_stats[name] = upsell_stats.get(name, 0) + count
+            examples = detailed_stats.setdefault(name, {})
+            examples.update(dict.fromkeys(names[upsell] for upsell in upsell_examples[product].tolist()))
+        
+        # Уникальные допродажи в порядке первого появления: первые из них - примеры в отчете
+        return {
+            'total_orders': self.total_orders,
+            'orders_with_upsells': self.orders_with_upsells,
+            'upsell_stats': upsell_stats,
+            'detailed_stats': {name: list(examples) for name, examples in detailed_stats.items()},
+        }
+
+def _count_upsells_vectorized(store):
+    """
+    Подсчитывает допродажи векторными операциями над всей таблицей строк
+
+    Возвращает те же структуры, что и построчный перебор: товары в upsell_stats
+    идут в порядке первого появления, а в detailed_stats для каждого товара
+    хранятся уникальные допродажи в порядке первого появления, поэтому
+    примеры в отчете те же.
+    """
+    names = np.array(store.product_names, dtype=object)
     
-    print(f"\nВсего заказов: {total_orders}")
-    print(f"Заказов с допродажами: {orders_with_upsells}")
+    # Одна маска упаковки на всю таблицу
+    packaging = store.product_is_packaging[store.product_ids]
+    real_upsell = store.is_upsell & ~packaging
+    main = ~store.is_upsell & ~packaging
+    
+    # Заказы, в которых есть допродажи (не считая коробки и пакеты)
+    has_upsells = np.zeros(store.num_orders, dtype=bool)
+    has_upsells[store.order_ids[real_upsell]] = True
+    
+    rows = pd.DataFrame({
+        'order': store.order_ids,
+        'product': store.product_ids,
+        'position': store.order_positions(sort_keys=True)[store.order_ids],
+        'row': np.arange(store.num_rows),
+    })
+    
+    # Основные товары заказов с допродажами в порядке перебора заказов
+    mains = rows[main & has_upsells[store.order_ids]].sort_values(['position', 'row'], kind='stable')
+    upsell_counts = mains.groupby('product', sort=False).size()
+    
+    # Пары "основной товар - допродажа" внутри заказа, по одной на уникальную пару
+    main_orders = mains.drop_duplicates(['order', 'product'])[['order', 'product', 'position']]
+    upsells = rows[real_upsell].drop_duplicates(['order', 'product'])[['order', 'product', 'row']]
+    pairs = main_orders.merge(upsells, on='order', suffixes=('', '_upsell'))
+    pairs = pairs.sort_values(['position', 'row'], kind='stable').drop_duplicates(['product', 'product_upsell'])
+    pairs['upsell_name'] = names[pairs['product_upsell'].to_numpy()]
+    upsell_examples = pairs.groupby('product', sort=False)['upsell_name'].agg(list)
+    
+    # Разные коды с одним названием (варианты артикулов) объединяются
+    upsell_stats = {}
+    detailed_stats = {}
+    for product, count in zip(upsell_counts.index.tolist(), upsell_counts.tolist()):
+        name = names[product]
+        upsell_stats[name] = upsell_stats.get(name, 0) + count
+        detailed_stats[name] = detailed_stats.get(name, []) + upsell_examples[product]
+    
+    total_orders = store.num_orders
+    orders_with_upsells = int(has_upsells.sum())
+    return total_orders, orders_with_upsells, upsell_stats, detailed_stats
+
+def count_upsells(store, engine='loop', verbose=False):
+    """
+    Подсчитывает агрегаты анализа допродаж
+    
+    Args:
+        store (OrderStore): Загруженные заказы
+        engine (str): Движок подсчета: 'loop' (по умолчанию) или 'vectorized'
+        verbose (bool): Выводить строку на каждый основной товар заказа с допродажами
+    
+    Returns:
+        dict: Всего заказов, заказов с допродажами, число допродаж к каждому товару
+            и уникальные допродажи к нему в порядке первого появления
+    """
+    if engine != 'vectorized':
+        return run_analyzers(store, [UpsellCounter(store, verbose)])[0]
+    
+    with phase('aggregate'):
+        total_orders, orders_with_upsells, upsell_stats, detailed_stats = _count_upsells_vectorized(store)
+    
+    # Уникальные допродажи в порядке первого появления: первые из них - примеры в отчете
+    return {
+        'total_orders': total_orders,
+        'orders_with_upsells': orders_with_upsells,
+        'upsell_stats': dict(upsell_stats),
+        'detailed_stats': {product: list(dict.fromkeys(items)) for product, items in detailed_stats.items()},
+    }
+
+def merge_upsell_stats(old, new):
+    """Объединяет агрегаты двух частей файла (новая часть идет после старой)"""
+    upsell_stats = dict(old['upsell_stats'])
+    for product, count in new['upsell_stats'].items():
+        upsell_stats[product] = upsell_stats.get(product, 0) + count
+    
+    detailed_stats = dict(old['detailed_stats'])
+    for product, items in new['detailed_stats'].items():
+        detailed_stats[product] = list(dict.fromkeys(detailed_stats.get(product, []) + items))
+    
+    return {
+        'total_orders': old['total_orders'] + new['total_orders'],
+        'orders_with_upsells': old['orders_with_upsells'] + new['orders_with_upsells'],
+        'upsell_stats': upsell_stats,
+        'detailed_stats': detailed_stats,
+    }
+
+def upsell_examples(examples, limit=EXAMPLES_LIMIT):
+    """
+    Примеры допродаж к товару для отчета и сервера запросов
+
+    Args:
+        examples (list): Уникальные допродажи к товару в порядке первого появления
+            (detailed_stats[товар])
+        limit (int): Сколько примеров вернуть
+
+    Returns:
+        list: Первые limit допродаж - одни и те же при каждом запуске
+    """
+    return examples[:limit]
+
+def write_upsell_report(stats):
+    """Выводит итоги в консоль и сохраняет 'upsell_analysis.csv'"""
+    upsell_stats = stats['upsell_stats']
+    detailed_stats = stats['detailed_stats']
+    
+    print(f"\nВсего заказов: {stats['total_orders']}")
+    print(f"Заказов с допродажами: {stats['orders_with_upsells']}")
     
     # Сортируем по количеству допродаж
     sorted_stats = sorted(upsell_stats.items(), key=lambda x: x[1], reverse=True)
+    products = [product for product, _ in sorted_stats]
+    
+    # Первые уникальные примеры в порядке появления (так же отвечает сервер запросов)
+    examples = ['; '.join(upsell_examples(detailed_stats[product])) for product in products]
     
     # Создаем результирующий CSV
-    with open('upsell_analysis.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Основной товар', 'Количество допродаж', 'Примеры допродаж'])
-        
-        for product, count in sorted_stats:
-            # Берем уникальные примеры допродаж для этого товара
-            examples = list(set(detailed_stats[product]))[:5]  # Первые 5 уникальных примеров
-            examples_str = '; '.join(examples)
-            
-            writer.writerow([product, count, examples_str])
+    write_table('upsell_analysis.csv', ['Основной товар', 'Количество допродаж', 'Примеры допродаж'],
+                [products, [count for _, count in sorted_stats], examples])
     
     print(f"\nТоп-10 товаров с наибольшим количеством допродаж:")
     for i, (product, count) in enumerate(sorted_stats[:10], 1):
@@ -74,5 +232,51 @@ def analyze_upsells():
     
     print(f"\nРезультаты сохранены в файл 'upsell_analysis.csv'")
 
+def analyze_upsells(store=None, engine='loop', incremental=False, verbose=False, options=None):
+    """
+    Анализирует, к каким основным товарам чаще всего добавляют допродажи
+
+    Args:
+        store (OrderStore): Загруженные заказы (по умолчанию читается 'products.csv')
+        engine (str): Движок подсчета: 'loop' (по умолчанию) или 'vectorized'
+        incremental (bool): Обработать только строки, дописанные в 'products.csv'
+            с прошлого запуска, и объединить их с сохраненными агрегатами
+        verbose (bool): Выводить строку на каждый основной товар заказа с допродажами
+        options (dict): Параметры чтения заказов (файл для инкрементального режима)
+    """
+    print("Анализирую заказы...")
+    
+    if incremental:
+        stats = update_incremental('upsell_analysis', lambda store: count_upsells(store, engine, verbose),
+                                   merge_upsell_stats, path=(options or default_options())['path'],
+                                   ordered_by_key=True)
+    else:
+        # Читаем CSV файл
+        if store is None:
+            store = load_orders()
+        stats = count_upsells(store, engine, verbose)
+    
+    with phase('write'):
+        write_upsell_report(stats)
+
 if __name__ == "__main__":
-    analyze_upsells()
\ No newline at end of file
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    engine = 'loop'
+    
+    if args:
+        if len(args) != 2 or args[0] != '--engine' or args[1] not in ENGINES:
+            print(f"Ошибка: допустимый аргумент --engine {{{'|'.join(ENGINES)}}}")
+            sys.exit(1)
+        engine = args[1]
+    
+    # Векторному движку нужна вся таблица строк в памяти
+    if engine == 'vectorized' and options['stream']:
+        print("Ошибка: --engine vectorized нельзя использовать вместе с --stream")
+        sys.exit(1)
+    
+    if options['incremental']:
+        analyze_upsells(engine=engine, incremental=True, verbose=options['verbose'], options=options)
+    else:
+        analyze_upsells(store=open_orders(options), engine=engine, verbose=options['verbose'])
+    report_memory(options)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import glob
+import gzip
+import io
+import os
+
+# Расширения файлов заказов, которые берутся из каталога
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst', '.csv.zstd')
+
+# Расширения сжатых файлов и способ сжатия
+COMPRESSED_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+
+# Размер буфера чтения распакованных данных (байт)
+READ_BUFFER = 1 << 20
+
+
+def compression(path):
+    """Способ сжатия файла по расширению ('gzip', 'zstd') или None"""
+    return COMPRESSED_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def _zstandard():
+    """
+    Модуль zstandard (необязательная зависимость)
+
+    Raises:
+        ValueError: Пакет не установлен
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Для файлов .zst нужен пакет zstandard: pip install zstandard")
+    return zstandard
+
+
+def open_binary(path):
+    """Открывает файл заказов на чтение в двоичном режиме, распаковывая gzip и zstd на лету"""
+    method = compression(path)
+    if method == 'gzip':
+        return gzip.open(path, 'rb')
+    if method == 'zstd':
+        reader = _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.BufferedReader(reader, READ_BUFFER)
+    return open(path, 'rb')
+
+
+def open_text(path):
+    """Открывает файл заказов как текст UTF-8 для csv.reader (со сжатием, как open_binary)"""
+    return io.TextIOWrapper(open_binary(path), encoding='utf-8', newline='')
+
+
+def _expand(spec):
+    """Файлы одного элемента спецификации: каталог, шаблон или путь к файлу"""
+    if os.path.isdir(spec):
+        names = sorted(name for name in os.listdir(spec) if name.lower().endswith(INPUT_SUFFIXES))
+        return [os.path.join(spec, name) for name in names]
+    if glob.has_magic(spec):
+        return sorted(path for path in glob.glob(spec) if os.path.isfile(path))
+    if not os.path.isfile(spec):
+        raise ValueError(f"Файл '{spec}' не найден")
+    return [spec]
+
+
+def resolve_inputs(specs):
+    """
+    Список файлов заказов по спецификациям из командной строки
+
+    Каждая спецификация - путь к файлу, каталог (все файлы .csv, .csv.gz и .csv.zst
+    в нем), шаблон ('exports/products-2024-03-*.csv.gz') или несколько таких
+    элементов через запятую. Файлы каталога и шаблона идут по имени, поэтому
+    ежедневные выгрузки читаются по порядку дат. Повторы убираются.
+
+    Args:
+        specs (list): Спецификации в порядке указания
+
+    Returns:
+        list: Пути к файлам
+
+    Raises:
+        ValueError: Файл не найден, шаблону ничего не соответствует или для
+            сжатых zstd файлов нет пакета zstandard
+    """
+    paths = []
+    seen = set()
+    for spec in specs:
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            matched = _expand(item)
+            if not matched:
+                raise ValueError(f"По '{item}' не найдено файлов заказов")
+            for path in matched:
+                key = os.path.abspath(path)
+                if key not in seen:
+                    seen.add(key)
+                    paths.append(path)
+
+    if not paths:
+        raise ValueError("Не указаны файлы заказов")
+    if any(compression(path) == 'zstd' for path in paths):
+        _zstandard()
+    return paths
+
+
+def describe_inputs(path):
+    """Файл или список файлов заказов в виде текста для консоли"""
+    if isinstance(path, str):
+        return path
+    if len(path) <= 3:
+        return ', '.join(path)
+    return f"{path[0]} ... {path[-1]} ({len(path)} файлов)"
+
@@ -0,0 +1,201 @@
+import sys
+
+from input_files import compression, resolve_inputs
+from instrumentation import configure, peak_memory_mb
+from order_loader import DEFAULT_INPUT, load_order_files, load_orders
+from order_stream import DEFAULT_MEMORY_LIMIT_MB, OrderStream
+from product_index import load_catalog
+from report_writer import configure as configure_reports
+
+
+def default_options():
+    """Параметры чтения заказов по умолчанию (как без флагов командной строки)"""
+    return {
+        'path': DEFAULT_INPUT,
+        'inputs': None,
+        'read_workers': None,
+        'stream': False,
+        'sorted': False,
+        'memory_limit_mb': DEFAULT_MEMORY_LIMIT_MB,
+        'incremental': False,
+        'use_cache': True,
+        'by_article': False,
+        'catalog': None,
+        'verbose': False,
+        'progress': False,
+        'timings': None,
+        'profile': False,
+        'parquet': False,
+    }
+
+
+def pop_input_options(args):
+    """
+    Извлекает из аргументов командной строки общие параметры чтения заказов
+
+    Поддерживаются флаги:
+        --input ФАЙЛЫ         файл, каталог, шаблон или список через запятую (можно повторять);
+                              .gz и .zst распаковываются на лету, несколько файлов читаются как один
+        --read-workers N      сколько файлов разбирать параллельно (по умолчанию по числу ядер)
+        --stream              потоковое чтение блоками (для файлов больше памяти)
+        --sorted              файл отсортирован по номеру заказа (без внешней сортировки)
+        --memory-limit МБ     лимит памяти под буферы строк в потоковом режиме
+        --incremental         обработать только строки, дописанные с прошлого запуска
+        --no-cache            не использовать бинарный кэш разобранного файла
+        --by-article          различать товары по артикулу, а не по названию
+        --catalog ФАЙЛ        справочник 'Артикул,Товары' с каноническими названиями (включает --by-article)
+        --verbose             подробный вывод по каждому заказу (по умолчанию только итоги)
+        --progress            прогресс перебора заказов в stderr (заказов/с, оставшееся время, память)
+        --timings ФАЙЛ        время этапов (load, classify, group, aggregate, write) в JSON ('-' - stderr)
+        --profile             профиль cProfile в 'profile.prof' и сводка cProfile/tracemalloc в stderr
+        --parquet             сохранять отчеты также в Parquet рядом с CSV (нужен пакет pyarrow)
+
+    Флаги инструментирования включаются сразу при разборе аргументов.
+
+    Args:
+        args (list): Аргументы командной строки без имени скрипта
+
+    Returns:
+        tuple: (словарь параметров, оставшиеся аргументы)
+    """
+    options = default_options()
+    rest = []
+    memory_limit_given = False
+
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == '--input':
+            try:
+                options['inputs'] = (options['inputs'] or []) + [args.pop(0)]
+            except IndexError:
+                print("Ошибка: после --input должен идти файл, каталог или шаблон (например, 'exports/*.csv.gz')")
+                sys.exit(1)
+        elif arg == '--read-workers':
+            try:
+                options['read_workers'] = int(args.pop(0))
+            except (IndexError, ValueError):
+                print("Ошибка: после --read-workers должно идти число процессов")
+                sys.exit(1)
+            if options['read_workers'] < 1:
+                print("Ошибка: число процессов должно быть больше 0")
+                sys.exit(1)
+        elif arg == '--stream':
+            options['stream'] = True
+        elif arg == '--sorted':
+            options['sorted'] = True
+        elif arg == '--incremental':
+            options['incremental'] = True
+        elif arg == '--no-cache':
+            options['use_cache'] = False
+        elif arg == '--by-article':
+            options['by_article'] = True
+        elif arg == '--catalog':
+            options['by_article'] = True
+            try:
+                catalog_path = args.pop(0)
+            except IndexError:
+                print("Ошибка: после --catalog должен идти путь к файлу справочника")
+                sys.exit(1)
+            try:
+                options['catalog'] = load_catalog(catalog_path)
+            except (OSError, ValueError) as error:
+                print(f"Ошибка: {error}")
+                sys.exit(1)
+        elif arg == '--verbose':
+            options['verbose'] = True
+        elif arg == '--progress':
+            options['progress'] = True
+        elif arg == '--profile':
+            options['profile'] = True
+        elif arg == '--parquet':
+            options['parquet'] = True
+        elif arg == '--timings':
+            try:
+                options['timings'] = args.pop(0)
+            except IndexError:
+                print("Ошибка: после --timings должен идти путь к файлу JSON ('-' - вывод в stderr)")
+                sys.exit(1)
+        elif arg == '--memory-limit':
+            memory_limit_given = True
+            try:
+                options['memory_limit_mb'] = int(args.pop(0))
+            except (IndexError, ValueError):
+                print("Ошибка: после --memory-limit должно идти число (лимит памяти в МБ)")
+                sys.exit(1)
+            if options['memory_limit_mb'] < 1:
+                print("Ошибка: лимит памяти должен быть больше 0")
+                sys.exit(1)
+        else:
+            rest.append(arg)
+
+    # Один файл передается путем, несколько - списком путей
+    if options['inputs'] is not None:
+        try:
+            paths = resolve_inputs(options['inputs'])
+        except ValueError as error:
+            print(f"Ошибка: {error}")
+            sys.exit(1)
+        options['path'] = paths[0] if len(paths) == 1 else paths
+
+    # Смещение дописанных строк имеет смысл только для одного несжатого файла
+    if options['incremental'] and (not isinstance(options['path'], str) or compression(options['path'])):
+        print("Ошибка: --incremental работает только с одним несжатым файлом")
+        sys.exit(1)
+
+    if (options['sorted'] or memory_limit_given) and not options['stream']:
+        print("Ошибка: --sorted и --memory-limit используются только вместе с --stream")
+        sys.exit(1)
+
+    if options['incremental'] and options['stream']:
+        print("Ошибка: --incremental нельзя использовать вместе с --stream")
+        sys.exit(1)
+
+    # Коды и канонические названия товаров по артикулу строятся по всему файлу
+    if options['incremental'] and options['by_article']:
+        print("Ошибка: --incremental нельзя использовать вместе с --by-article и --catalog")
+        sys.exit(1)
+
+    # Без pyarrow ошибка выводится сразу, а не после долгого подсчета
+    try:
+        configure_reports(parquet=options['parquet'])
+    except ImportError as error:
+        print(f"Ошибка: {error}")
+        sys.exit(1)
+
+    configure(progress=options['progress'], timings=options['timings'], profile=options['profile'])
+    return options, rest
+
+
+def read_orders(options):
+    """
+    Загружает заказы целиком или открывает потоковое чтение по параметрам командной строки
+
+    Raises:
+        ValueError: В файле нет нужных колонок
+    """
+    if options['stream']:
+        return OrderStream(options['path'], sorted_input=options['sorted'],
+                           memory_limit_mb=options['memory_limit_mb'],
+                           by_article=options['by_article'], catalog=options['catalog'])
+    if not isinstance(options['path'], str):
+        return load_order_files(options['path'], use_cache=options['use_cache'], by_article=options['by_article'],
+                                catalog=options['catalog'], workers=options['read_workers'])
+    return load_orders(options['path'], use_cache=options['use_cache'],
+                       by_article=options['by_article'], catalog=options['catalog'])
+
+
+def open_orders(options):
+    """То же, что read_orders(), но при ошибке выводит ее и завершает программу"""
+    try:
+        return read_orders(options)
+    except ValueError as error:
+        print(f"Ошибка: {error}")
+        sys.exit(1)
+
+
+def report_memory(options):
+    """Выводит пиковое потребление памяти в потоковом режиме"""
+    if options['stream']:
+        print(f"\nПиковое потребление памяти: {peak_memory_mb():.1f} МБ "
+              f"(лимит буферов: {options['memory_limit_mb']} МБ)")
@@ -0,0 +1,236 @@
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Этапы обработки в порядке вывода
+PHASES = ('load', 'classify', 'group', 'aggregate', 'write')
+
+# Как часто выводить прогресс (секунд)
+PROGRESS_INTERVAL = 2.0
+
+# Через сколько заказов проверять время (чтобы не вызывать часы на каждый заказ)
+PROGRESS_CHECK_EVERY = 4096
+
+# Файл со статистикой cProfile (открывается через pstats или snakeviz)
+PROFILE_OUTPUT = 'profile.prof'
+
+# Сколько строк профиля и мест выделения памяти выводить
+PROFILE_TOP = 20
+
+# Время этапов (секунд) или None, если замеры выключены
+_timings = None
+
+# Открытые этапы: [имя, время начала, время вложенных этапов]
+_stack = []
+
+# Счетчики обработанных объектов (например, заказов) для итогов замеров
+_counts = {}
+
+_progress = False
+_profiler = None
+_started = None
+
+# Снимок tracemalloc на границе этапов с наибольшей памятью и ее объем (байт)
+_snapshot = None
+_snapshot_size = -1
+
+
+def peak_memory_mb():
+    """Пиковое потребление памяти процессом (МБ); где нет модуля resource (Windows) - 0.0"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_memory_mb():
+    """Текущее потребление памяти процессом (МБ); где /proc недоступен - пиковое"""
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return peak_memory_mb()
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def configure(progress=False, timings=None, profile=False):
+    """
+    Включает инструментирование запуска; итоги выводятся при завершении процесса
+
+    По умолчанию все выключено, и обработка идет без накладных расходов.
+
+    Args:
+        progress (bool): Выводить прогресс перебора заказов в stderr
+        timings (str): Файл для времени этапов в JSON ('-' - stderr)
+        profile (bool): Профилировать запуск через cProfile и tracemalloc
+    """
+    global _timings, _progress, _profiler, _started
+
+    _started = time.perf_counter()
+    _progress = progress
+    if timings is not None:
+        _timings = dict.fromkeys(PHASES, 0.0)
+        atexit.register(_write_timings, timings)
+    if profile:
+        tracemalloc.start()
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        atexit.register(_write_profile)
+
+
+def timings_enabled():
+    """Включены ли замеры этапов"""
+    return _timings is not None
+
+
+@contextmanager
+def phase(name):
+    """
+    Замеряет этап обработки
+
+    Время вложенных этапов вычитается из внешнего (например, классификация товаров
+    внутри загрузки), поэтому сумма этапов равна общему времени замеренной работы.
+    При профилировании в конце этапа запоминается снимок памяти, если она выросла.
+    """
+    if _timings is None and _profiler is None:
+        yield
+        return
+
+    entry = [name, time.perf_counter(), 0.0]
+    _stack.append(entry)
+    try:
+        yield
+    finally:
+        _stack.pop()
+        add_time(name, time.perf_counter() - entry[1], entry[2])
+        if _profiler is not None:
+            _snapshot_memory()
+
+
+def _snapshot_memory():
+    """Снимает tracemalloc, если памяти занято больше, чем в прошлом снимке"""
+    global _snapshot, _snapshot_size
+    current = tracemalloc.get_traced_memory()[0]
+    if current > _snapshot_size:
+        _snapshot = tracemalloc.take_snapshot()
+        _snapshot_size = current
+
+
+def add_time(name, seconds, nested=0.0):
+    """Добавляет к этапу время, замеренное вручную (nested - время вложенных этапов)"""
+    if _timings is None:
+        return
+    _timings[name] = _timings.get(name, 0.0) + seconds - nested
+    if _stack:
+        _stack[-1][2] += seconds
+
+
+def add_count(name, count):
+    """Добавляет к счетчику обработанных объектов"""
+    _counts[name] = _counts.get(name, 0) + count
+
+
+def timings_report():
+    """Время этапов, общее время и пиковая память в виде словаря для JSON"""
+    report = {'phases': {name: round(seconds, 6) for name, seconds in (_timings or {}).items()}}
+    report['total_seconds'] = round(time.perf_counter() - _started, 6) if _started is not None else None
+    report['peak_rss_mb'] = round(peak_memory_mb(), 1)
+    report.update(_counts)
+    return report
+
+
+def _write_timings(output):
+    """Сохраняет время этапов в JSON (одной строкой в stderr или в файл)"""
+    if output == '-':
+        print(json.dumps(timings_report(), ensure_ascii=False), file=sys.stderr)
+        return
+    with open(output, 'w', encoding='utf-8') as json_file:
+        json.dump(timings_report(), json_file, ensure_ascii=False, indent=2)
+
+
+def _write_profile():
+    """Сохраняет статистику cProfile и выводит в stderr самые затратные функции и места выделения памяти"""
+    _profiler.disable()
+    _snapshot_memory()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    _profiler.dump_stats(PROFILE_OUTPUT)
+    output = io.StringIO()
+    pstats.Stats(_profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+    print(f"\nПрофиль сохранен в файл '{PROFILE_OUTPUT}'; топ-{PROFILE_TOP} функций по общему времени:",
+          file=sys.stderr)
+    print(output.getvalue().strip(), file=sys.stderr)
+    print(f"\nПамять Python (tracemalloc): пик {peak / 1024 / 1024:.1f} МБ; топ-{PROFILE_TOP} мест выделения "
+          f"в момент наибольшей памяти на границе этапов ({_snapshot_size / 1024 / 1024:.1f} МБ):", file=sys.stderr)
+    for stat in _snapshot.statistics('lineno')[:PROFILE_TOP]:
+        print(f"  {stat}", file=sys.stderr)
+
+
+class ProgressReporter:
+    """
+    Прогресс перебора в stderr не чаще раза в PROGRESS_INTERVAL секунд
+
+    Время проверяется только раз в PROGRESS_CHECK_EVERY объектов, поэтому
+    учет одного объекта - это сложение и сравнение.
+    """
+
+    def __init__(self, total=None, unit='заказов', interval=PROGRESS_INTERVAL):
+        """
+        Args:
+            total (int): Всего объектов, если известно (для оценки оставшегося времени)
+            unit (str): Название объектов в выводе
+            interval (float): Минимальный интервал между выводами (секунд)
+        """
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.count = 0
+        self._next_check = PROGRESS_CHECK_EVERY
+        self._started = self._reported = time.perf_counter()
+
+    def update(self, count=1):
+        """Учитывает обработанные объекты"""
+        self.count += count
+        if self.count >= self._next_check:
+            self._next_check = self.count + PROGRESS_CHECK_EVERY
+            now = time.perf_counter()
+            if now - self._reported >= self.interval:
+                self._reported = now
+                self._report(now)
+
+    def finish(self):
+        """Выводит итоговую строку, если перебор шел дольше интервала вывода"""
+        now = time.perf_counter()
+        if now - self._started >= self.interval:
+            self._report(now)
+
+    def _report(self, now):
+        elapsed = now - self._started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        line = f"Обработано {self.count}"
+        if self.total:
+            line += f" из {self.total} {self.unit} ({self.count / self.total * 100:.1f}%)"
+        else:
+            line += f" {self.unit}"
+        line += f", {rate:,.0f} {self.unit}/с"
+        if self.total and rate > 0 and self.count < self.total:
+            line += f", осталось ~{(self.total - self.count) / rate:.0f} с"
+        line += f", память {current_memory_mb():.0f} МБ"
+        print(line, file=sys.stderr, flush=True)
+
+
+def progress(total=None, unit='заказов'):
+    """Возвращает ProgressReporter, если прогресс включен, иначе None"""
+    return ProgressReporter(total, unit) if _progress else None
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Версия формата кэша; при изменении старые кэши перестраиваются
+CACHE_VERSION = 1
+
+# Сколько байт в начале и в конце файла входит в контрольную сумму
+SAMPLE_BYTES = 1 << 20
+
+# Разделитель строк в словарях названий и номеров заказов
+SEPARATOR = '\x00'
+
+
+def cache_path(path):
+    """Каталог кэша рядом с файлом заказов"""
+    return f'{path}.cache'
+
+
+def file_key(path):
+    """
+    Ключ файла: размер, время изменения и контрольная сумма начала и конца файла
+
+    Полная контрольная сумма многогигабайтного файла заняла бы секунды, поэтому
+    хэшируются только первый и последний мегабайт.
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as data:
+        digest.update(data.read(SAMPLE_BYTES))
+        if stat.st_size > SAMPLE_BYTES:
+            data.seek(max(SAMPLE_BYTES, stat.st_size - SAMPLE_BYTES))
+            digest.update(data.read(SAMPLE_BYTES))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sample': digest.hexdigest()}
+
+
+def _read_strings(path, count):
+    with open(path, 'rb') as data:
+        text = data.read().decode('utf-8')
+    return text.split(SEPARATOR) if count else []
+
+
+def _write_strings(path, strings):
+    text = SEPARATOR.join(strings)
+    if text.count(SEPARATOR) != max(len(strings) - 1, 0):
+        raise ValueError('Строка содержит разделитель словаря')
+    with open(path, 'wb') as data:
+        data.write(text.encode('utf-8'))
+
+
+def read_cache(path, fingerprint, variant='name'):
+    """
+    Загружает разобранные заказы из кэша, если он построен для текущей версии файла
+
+    Колонки строк открываются через mmap без копирования в память.
+
+    Args:
+        path (str): Путь к CSV файлу
+        fingerprint (str): Отпечаток правил классификатора
+        variant (str): Способ кодирования товаров (по названию или по артикулу)
+
+    Returns:
+        dict: Колонки и словари для OrderStore или None, если кэша нет или он устарел
+    """
+    directory = cache_path(path)
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_VERSION or meta.get('products') != variant:
+        return None
+    if meta.get('file') != file_key(path):
+        return None
+
+    columns = {
+        'order_keys': _read_strings(os.path.join(directory, 'order_keys.txt'), meta['num_orders']),
+        'product_names': _read_strings(os.path.join(directory, 'product_names.txt'), meta['num_products']),
+        'order_ids': np.load(os.path.join(directory, 'order_ids.npy'), mmap_mode='r'),
+        'product_ids': np.load(os.path.join(directory, 'product_ids.npy'), mmap_mode='r'),
+        'is_upsell': np.load(os.path.join(directory, 'is_upsell.npy'), mmap_mode='r'),
+    }
+
+    # Категории в кэше годятся, только если правила классификатора не менялись
+    if meta.get('fingerprint') == fingerprint:
+        columns['product_categories'] = np.load(os.path.join(directory, 'product_categories.npy'))
+        columns['product_is_packaging'] = np.load(os.path.join(directory, 'product_is_packaging.npy'))
+    return columns
+
+
+def write_cache(path, store, fingerprint, variant='name'):
+    """
+    Сохраняет разобранные заказы в кэш рядом с файлом
+
+    Ошибки записи (например, каталог только для чтения) не прерывают анализ,
+    кэш просто не создается.
+
+    Args:
+        path (str): Путь к CSV файлу
+        store (OrderStore): Заказы, прочитанные из этого файла
+        fingerprint (str): Отпечаток правил классификатора
+        variant (str): Способ кодирования товаров (по названию или по артикулу)
+    """
+    directory = cache_path(path)
+    try:
+        meta = {
+            'version': CACHE_VERSION,
+            'file': file_key(path),
+            'fingerprint': fingerprint,
+            'products': variant,
+            'num_orders': len(store.order_keys),
+            'num_products': len(store.product_names),
+        }
+        staging = tempfile.mkdtemp(prefix='.cache-', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            _write_strings(os.path.join(staging, 'order_keys.txt'), store.order_keys)
+            _write_strings(os.path.join(staging, 'product_names.txt'), store.product_names)
+            np.save(os.path.join(staging, 'order_ids.npy'), store.order_ids)
+            np.save(os.path.join(staging, 'product_ids.npy'), store.product_ids)
+            np.save(os.path.join(staging, 'is_upsell.npy'), store.is_upsell)
+            np.save(os.path.join(staging, 'product_categories.npy'), store.product_categories)
+            np.save(os.path.join(staging, 'product_is_packaging.npy'), store.product_is_packaging)
+            with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as meta_file:
+                json.dump(meta, meta_file)
+
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    except (OSError, ValueError):
+        pass
@@ -0,0 +1,413 @@
+import csv
+import io
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from input_files import open_binary
+from instrumentation import phase
+from order_cache import read_cache, write_cache
+from product_categories import default_classifier
+from product_index import ARTICLE_COLUMN, ProductIndex, products_variant
+
+# Файл с заказами по умолчанию
+DEFAULT_INPUT = 'products.csv'
+
+# Маркер допродажи в колонке 'Допродажа'
+UPSELL_MARKER = 'Допродажа'
+
+
+def _order_sort_key(order_keys):
+    """Ключ сортировки номеров заказов как в pandas: числовой, если все номера - числа"""
+    try:
+        numeric = [int(key) for key in order_keys]
+    except ValueError:
+        return lambda order_id: order_keys[order_id]
+    return lambda order_id: numeric[order_id]
+
+
+class OrderStore:
+    """
+    Колоночное хранилище строк заказов
+
+    Каждая строка файла хранится как три значения: целочисленный код заказа,
+    код товара (словарное кодирование названий) и флаг допродажи.
+    Категория и признак упаковки вычисляются один раз на уникальный товар.
+    Дополнительные колонки заказа (например, дата) хранятся по одному значению
+    на заказ, если их запросили при чтении (load_orders(order_columns=...)).
+    """
+
+    def __init__(self, order_keys, product_names, order_ids, product_ids, is_upsell, classifier=None,
+                 product_categories=None, product_is_packaging=None, order_values=None):
+        self.order_keys = order_keys            # код заказа -> исходный номер заказа
+        self.product_names = product_names      # код товара -> название
+        self.order_ids = order_ids              # строка -> код заказа
+        self.product_ids = product_ids          # строка -> код товара
+        self.is_upsell = is_upsell              # строка -> признак допродажи
+        self.order_values = order_values or {}  # колонка -> значение в первой строке каждого заказа
+
+        # Категории могут быть уже посчитаны (например, загружены из кэша)
+        if classifier is None:
+            classifier = default_classifier()
+        self.category_names = classifier.category_names
+        if product_categories is None or product_is_packaging is None:
+            with phase('classify'):
+                product_categories = classifier.category_codes(product_names)
+                product_is_packaging = classifier.packaging_flags(product_names)
+        self.product_categories = product_categories
+        self.product_is_packaging = product_is_packaging
+
+    @property
+    def num_orders(self):
+        return len(self.order_keys)
+
+    @property
+    def num_rows(self):
+        return len(self.order_ids)
+
+    def category_of(self, product_id):
+        """Возвращает название категории товара по его коду"""
+        return self.category_names[self.product_categories[product_id]]
+
+    def order_positions(self, sort_keys=False):
+        """
+        Возвращает позицию каждого заказа в порядке перебора
+
+        Args:
+            sort_keys (bool): Порядок номеров заказов (как groupby в pandas),
+                а не порядок первого появления в файле
+
+        Returns:
+            numpy.ndarray: код заказа -> позиция
+        """
+        # Коды заказов присвоены в порядке появления в файле
+        if not sort_keys:
+            return np.arange(self.num_orders)
+
+        ordered = sorted(range(self.num_orders), key=_order_sort_key(self.order_keys))
+        positions = np.empty(self.num_orders, dtype=np.int64)
+        positions[ordered] = np.arange(self.num_orders)
+        return positions
+
+    def iter_orders(self, sort_keys=False, positions=False):
+        """
+        Перебирает заказы, разделяя товары на основные и допродажи
+
+        Args:
+            sort_keys (bool): Перебирать заказы в порядке номеров (как groupby в pandas),
+                а не в порядке первого появления в файле
+            positions (bool): Добавлять позицию заказа в порядке первого появления в файле
+
+        Yields:
+            tuple: (номер заказа, коды основных товаров, коды допродаж) в порядке строк файла;
+                с positions=True - (номер заказа, позиция, коды основных товаров, коды допродаж)
+        """
+        order_sequence = np.argsort(self.order_positions(sort_keys)).tolist() if sort_keys else None
+        for order_id, main_ids, upsell_ids in group_rows(self.order_ids, self.product_ids, self.is_upsell,
+                                                         order_sequence):
+            # Код заказа совпадает с его позицией в порядке появления в файле
+            if positions:
+                yield self.order_keys[order_id], order_id, main_ids, upsell_ids
+            else:
+                yield self.order_keys[order_id], main_ids, upsell_ids
+
+    def partition(self, count):
+        """
+        Делит строки на части по хэшу заказа (все строки заказа попадают в одну часть)
+
+        Args:
+            count (int): Количество частей
+
+        Returns:
+            list: Кортежи (коды заказов, коды товаров, признаки допродажи) для каждой части
+        """
+        shards = self.order_ids % count
+        parts = []
+        for shard in range(count):
+            rows = shards == shard
+            parts.append((self.order_ids[rows], self.product_ids[rows], self.is_upsell[rows]))
+        return parts
+
+
+def group_rows(order_ids, product_ids, is_upsell, order_sequence=None):
+    """
+    Группирует строки по заказам, разделяя товары на основные и допродажи
+
+    Args:
+        order_ids (numpy.ndarray): Код заказа каждой строки
+        product_ids (numpy.ndarray): Код товара каждой строки
+        is_upsell (numpy.ndarray): Признак допродажи каждой строки
+        order_sequence (list): Порядок перебора кодов заказов (коды должны идти подряд с 0);
+            по умолчанию по возрастанию кода, то есть в порядке появления в файле
+
+    Yields:
+        tuple: (код заказа, коды основных товаров, коды допродаж) в порядке строк
+    """
+    if len(order_ids) == 0:
+        return
+
+    rows = np.argsort(order_ids, kind='stable')
+    sorted_orders = order_ids[rows]
+    bounds = np.flatnonzero(np.diff(sorted_orders)) + 1
+    starts = [0] + bounds.tolist()
+    ends = bounds.tolist() + [len(rows)]
+    codes = sorted_orders[starts].tolist()
+
+    products = product_ids[rows].tolist()
+    upsells = is_upsell[rows].tolist()
+
+    groups = range(len(starts)) if order_sequence is None else order_sequence
+    for group in groups:
+        main_ids = []
+        upsell_ids = []
+        for i in range(starts[group], ends[group]):
+            if upsells[i]:
+                upsell_ids.append(products[i])
+            else:
+                main_ids.append(products[i])
+        yield codes[group], main_ids, upsell_ids
+
+
+def load_orders(path=DEFAULT_INPUT, classifier=None, start=0, use_cache=True, by_article=False, catalog=None,
+                order_columns=()):
+    """
+    Читает CSV файл с заказами за один проход в колоночное хранилище
+
+    Разобранные колонки сохраняются в бинарный кэш рядом с файлом ('<path>.cache'),
+    и повторные запуски на том же файле открывают их через mmap без разбора CSV.
+
+    Args:
+        path (str): Путь к CSV файлу (по умолчанию 'products.csv'); файлы .gz и .zst
+            распаковываются на лету
+        classifier (CategoryClassifier): Классификатор товаров (по умолчанию правила из 'categories.json')
+        start (int): Смещение в байтах, с которого читать строки (начало строки; заголовок
+            всегда берется из начала файла); кэш при этом не используется
+        use_cache (bool): Использовать бинарный кэш (по умолчанию да)
+        by_article (bool): Различать товары по артикулу, а не по названию
+        catalog (dict): Артикул -> каноническое название (только вместе с by_article)
+        order_columns (tuple): Необязательные колонки заказа, которые нужно прочитать
+            в OrderStore.order_values (их нет в кэше, поэтому кэш при этом не используется)
+
+    Returns:
+        OrderStore: Хранилище строк заказов
+    """
+    if classifier is None:
+        classifier = default_classifier()
+
+    with phase('load'):
+        variant = products_variant(by_article, catalog)
+        use_cache = use_cache and not start and not order_columns
+        if use_cache:
+            columns = read_cache(path, classifier.fingerprint(), variant)
+            if columns is not None:
+                return OrderStore(classifier=classifier, **columns)
+
+        store = parse_orders(path, classifier, start, by_article, catalog, order_columns)
+        if use_cache:
+            write_cache(path, store, classifier.fingerprint(), variant)
+        return store
+
+
+def _load_part(path, classifier, use_cache, by_article, catalog):
+    """Читает один файл из нескольких (в процессе пула): колонки и ключи товаров"""
+    # Ключей товаров по артикулу нет в кэше, такие файлы разбираются заново
+    if by_article:
+        return parse_columns(path, by_article=True, catalog=catalog)
+    store = load_orders(path, classifier, use_cache=use_cache)
+    return {
+        'order_keys': store.order_keys,
+        'product_names': store.product_names,
+        'product_keys': store.product_names,
+        'order_ids': np.asarray(store.order_ids),
+        'product_ids': np.asarray(store.product_ids),
+        'is_upsell': np.asarray(store.is_upsell),
+    }
+
+
+def merge_parts(parts, classifier=None):
+    """
+    Объединяет колонки нескольких файлов в одно хранилище
+
+    Заказы и товары получают общие коды в порядке первого появления по всем файлам
+    подряд, поэтому заказ, строки которого есть в нескольких файлах, становится
+    одним заказом, а результат совпадает с разбором склеенного файла.
+
+    Args:
+        parts (list): Результаты parse_columns() в порядке файлов
+        classifier (CategoryClassifier): Классификатор товаров
+
+    Returns:
+        OrderStore: Хранилище строк всех файлов
+    """
+    order_index = {}
+    product_index = {}
+    product_names = []
+    order_ids = []
+    product_ids = []
+    for part in parts:
+        order_map = np.fromiter((order_index.setdefault(key, len(order_index)) for key in part['order_keys']),
+                                dtype=np.int32, count=len(part['order_keys']))
+        product_map = np.empty(len(part['product_keys']), dtype=np.int32)
+        for code, (key, name) in enumerate(zip(part['product_keys'], part['product_names'])):
+            product_id = product_index.get(key)
+            if product_id is None:
+                product_id = product_index[key] = len(product_names)
+                product_names.append(name)
+            product_map[code] = product_id
+        order_ids.append(order_map[part['order_ids']])
+        product_ids.append(product_map[part['product_ids']])
+
+    return OrderStore(
+        order_keys=list(order_index),
+        product_names=product_names,
+        order_ids=np.concatenate(order_ids) if parts else np.empty(0, dtype=np.int32),
+        product_ids=np.concatenate(product_ids) if parts else np.empty(0, dtype=np.int32),
+        is_upsell=np.concatenate([part['is_upsell'] for part in parts]) if parts else np.empty(0, dtype=bool),
+        classifier=classifier,
+    )
+
+
+def load_order_files(paths, classifier=None, use_cache=True, by_article=False, catalog=None, workers=None):
+    """
+    Читает несколько файлов заказов (например, ежедневные выгрузки) в одно хранилище
+
+    Файлы разбираются параллельно в пуле процессов, у каждого свой бинарный кэш,
+    а затем объединяются через merge_parts().
+
+    Args:
+        paths (list): Пути к CSV файлам (.gz и .zst распаковываются на лету)
+        classifier (CategoryClassifier): Классификатор товаров
+        use_cache (bool): Использовать бинарный кэш каждого файла
+        by_article (bool): Различать товары по артикулу, а не по названию
+        catalog (dict): Артикул -> каноническое название (только вместе с by_article)
+        workers (int): Число процессов (по умолчанию по числу ядер, не больше числа файлов)
+
+    Returns:
+        OrderStore: Хранилище строк всех файлов
+    """
+    if classifier is None:
+        classifier = default_classifier()
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+
+    with phase('load'):
+        args = (repeat(classifier), repeat(use_cache), repeat(by_article), repeat(catalog))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_load_part, paths, *args))
+        else:
+            parts = list(map(_load_part, paths, *args))
+        return merge_parts(parts, classifier)
+
+
+def parse_orders(path=DEFAULT_INPUT, classifier=None, start=0, by_article=False, catalog=None, order_columns=()):
+    """
+    Разбирает CSV файл с заказами в колоночное хранилище (без кэша)
+
+    Args:
+        path (str): Путь к CSV файлу (по умолчанию 'products.csv')
+        classifier (CategoryClassifier): Классификатор товаров
+        start (int): Смещение в байтах, с которого читать строки (только для несжатых файлов)
+        by_article (bool): Различать товары по артикулу, а не по названию
+        catalog (dict): Артикул -> каноническое название (только вместе с by_article)
+        order_columns (tuple): Необязательные колонки заказа для OrderStore.order_values
+
+    Returns:
+        OrderStore: Хранилище строк заказов
+    """
+    columns = parse_columns(path, start, by_article, catalog, order_columns)
+    del columns['product_keys']
+    return OrderStore(classifier=classifier, **columns)
+
+
+def row_width(header, by_article=False):
+    """Сколько полей должно быть в строке, чтобы в ней были все нужные колонки"""
+    columns = ['№ заказа', 'Допродажа', 'Товары'] + ([ARTICLE_COLUMN] if by_article else [])
+    return max(header.index(column) for column in columns) + 1
+
+
+def short_row_error(path, line, start=0):
+    """
+    Ошибка для неполной строки (например, недописанной последней строки файла)
+
+    Args:
+        path (str): Путь к файлу
+        line (int): Номер строки (при start - считая от start)
+        start (int): Смещение в байтах, с которого читался файл
+    """
+    where = f"строка {line}" if not start else f"строка {line} после смещения {start}"
+    return ValueError(f"В файле '{path}' неполная строка ({where}): нет нужных колонок")
+
+
+def parse_columns(path=DEFAULT_INPUT, start=0, by_article=False, catalog=None, order_columns=()):
+    """
+    Разбирает CSV файл с заказами в колонки (без классификации товаров)
+
+    Колонки из order_columns, которые есть в файле, читаются в том же проходе:
+    для каждого заказа сохраняется значение из его первой строки.
+
+    Returns:
+        dict: Колонки для OrderStore и 'product_keys' - ключ каждого товара
+            (название или, с by_article, артикул)
+    """
+    order_index = {}
+    product_index = {}
+    products = ProductIndex(catalog) if by_article else None
+    order_ids = array('i')
+    product_ids = array('i')
+    is_upsell = array('b')
+
+    with open_binary(path) as raw:
+        header = next(csv.reader([raw.readline().decode('utf-8')]), [])
+        order_col = header.index('№ заказа')
+        upsell_col = header.index('Допродажа')
+        product_col = header.index('Товары')
+        if products is not None:
+            if ARTICLE_COLUMN not in header:
+                raise ValueError(f"В файле '{path}' нет колонки '{ARTICLE_COLUMN}'")
+            article_col = header.index(ARTICLE_COLUMN)
+        width = row_width(header, by_article)
+        value_cols = [(column, header.index(column)) for column in order_columns if column in header]
+        order_values = {column: [] for column, _ in value_cols}
+
+        if start:
+            raw.seek(start)
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                raise short_row_error(path, reader.line_num + (0 if start else 1), start)
+
+            order_key = row[order_col]
+            order_id = order_index.get(order_key)
+            if order_id is None:
+                order_id = order_index[order_key] = len(order_index)
+                for column, col in value_cols:
+                    order_values[column].append(row[col] if col < len(row) else '')
+
+            product_name = row[product_col]
+            if products is not None:
+                product_id = products.code(row[article_col], product_name)
+            else:
+                product_id = product_index.get(product_name)
+                if product_id is None:
+                    product_id = product_index[product_name] = len(product_index)
+
+            order_ids.append(order_id)
+            product_ids.append(product_id)
+            is_upsell.append(row[upsell_col] == UPSELL_MARKER)
+
+    product_names = products.names if products is not None else list(product_index)
+    return {
+        'order_keys': list(order_index),
+        'product_names': product_names,
+        'product_keys': list(products.codes) if products is not None else product_names,
+        'order_ids': np.frombuffer(order_ids, dtype=np.int32),
+        'product_ids': np.frombuffer(product_ids, dtype=np.int32),
+        'is_upsell': np.frombuffer(is_upsell, dtype=np.int8).astype(bool),
+        'order_values': order_values,
+    }
@@ -0,0 +1,273 @@
+import csv
+import heapq
+import os
+import pickle
+import tempfile
+
+from input_files import describe_inputs, open_text
+from instrumentation import phase
+from order_loader import DEFAULT_INPUT, UPSELL_MARKER, row_width, short_row_error
+from product_categories import default_classifier
+from product_index import ARTICLE_COLUMN, ProductIndex
+
+# Лимит памяти под буферы строк по умолчанию (МБ)
+DEFAULT_MEMORY_LIMIT_MB = 256
+
+# Оценка памяти на одну строку в буфере: кортеж, номер заказа, индексы
+ROW_BYTES = 256
+
+# Сколько записей сбрасывается на диск (и читается обратно) за один раз
+SPILL_BLOCK_ROWS = 1024
+
+
+def order_sort_value(order_key):
+    """Ключ сортировки номера заказа: числа по значению, остальные номера по строке"""
+    try:
+        return (0, int(order_key), '')
+    except ValueError:
+        return (1, 0, order_key)
+
+
+def _write_run(directory, records):
+    """Сбрасывает отсортированные записи во временный файл блоками"""
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.run')
+    with os.fdopen(fd, 'wb') as run_file:
+        for start in range(0, len(records), SPILL_BLOCK_ROWS):
+            pickle.dump(records[start:start + SPILL_BLOCK_ROWS], run_file, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    """Читает записи временного файла, держа в памяти только один блок"""
+    with open(path, 'rb') as run_file:
+        while True:
+            try:
+                block = pickle.load(run_file)
+            except EOFError:
+                return
+            yield from block
+
+
+class OrderStream:
+    """
+    Потоковое чтение заказов для файлов, не помещающихся в память
+
+    Повторяет интерфейс OrderStore, который используют анализы: словарь товаров
+    с категориями и признаком упаковки строится за первый проход, а заказы
+    выдаются по одному из iter_orders().
+
+    Если файл отсортирован по номеру заказа (sorted_input=True), он читается
+    блоками строк, и между блоками переносится только последний незавершенный
+    заказ. Иначе строки сортируются внешней сортировкой через временные файлы.
+    """
+
+    def __init__(self, path=DEFAULT_INPUT, sorted_input=False, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                 classifier=None, by_article=False, catalog=None):
+        """
+        Args:
+            path (str or list): Путь к CSV файлу (по умолчанию 'products.csv') или список
+                файлов, которые читаются подряд как один файл (.gz и .zst распаковываются на лету)
+            sorted_input (bool): Файл отсортирован по номеру заказа
+            memory_limit_mb (int): Лимит памяти под буферы строк (МБ)
+            classifier (CategoryClassifier): Классификатор товаров
+            by_article (bool): Различать товары по артикулу, а не по названию
+            catalog (dict): Артикул -> каноническое название (только вместе с by_article)
+        """
+        self.path = path
+        self.paths = [path] if isinstance(path, str) else list(path)
+        self.sorted_input = sorted_input
+        self.memory_limit_mb = memory_limit_mb
+        self.chunk_rows = max(SPILL_BLOCK_ROWS, memory_limit_mb * 1024 * 1024 // ROW_BYTES)
+
+        if classifier is None:
+            classifier = default_classifier()
+        self._classifier = classifier
+        self.category_names = classifier.category_names
+
+        self._product_index = {}
+        self._products = ProductIndex(catalog) if by_article else None
+        self._spill_dir = None
+        self._runs = []
+        self.num_orders = 0
+        self.num_rows = 0
+
+        with phase('load'):
+            self._scan()
+
+        self.product_names = self._products.names if self._products is not None else list(self._product_index)
+        with phase('classify'):
+            self.product_categories = classifier.category_codes(self.product_names)
+            self.product_is_packaging = classifier.packaging_flags(self.product_names)
+
+    def _read_chunks(self):
+        """Читает файлы подряд блоками строк: (номер заказа, номер строки, код товара, допродажа)"""
+        products = self._products
+        product_index = self._product_index
+        chunk = []
+        row_index = 0
+        for path in self.paths:
+            with open_text(path) as csvfile:
+                reader = csv.reader(csvfile)
+                header = next(reader, None) or []
+                order_col = header.index('№ заказа')
+                upsell_col = header.index('Допродажа')
+                product_col = header.index('Товары')
+                if products is not None:
+                    if ARTICLE_COLUMN not in header:
+                        raise ValueError(f"В файле '{path}' нет колонки '{ARTICLE_COLUMN}'")
+                    article_col = header.index(ARTICLE_COLUMN)
+                width = row_width(header, products is not None)
+
+                for row in reader:
+                    if not row:
+                        continue
+                    if len(row) < width:
+                        raise short_row_error(path, reader.line_num)
+
+                    product_name = row[product_col]
+                    if products is not None:
+                        product_id = products.code(row[article_col], product_name)
+                    else:
+                        product_id = product_index.get(product_name)
+                        if product_id is None:
+                            product_id = product_index[product_name] = len(product_index)
+
+                    chunk.append((row[order_col], row_index, product_id, row[upsell_col] == UPSELL_MARKER))
+                    row_index += 1
+                    if len(chunk) >= self.chunk_rows:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+
+    def _scan(self):
+        """Первый проход: словарь товаров, число заказов и, если нужно, отсортированные блоки на диске"""
+        if self.sorted_input:
+            for order in self._iter_sorted_file():
+                self.num_orders += 1
+                self.num_rows += len(order[2])
+            return
+
+        self._spill_dir = tempfile.TemporaryDirectory(prefix='upsell-stream-')
+        all_numeric = True
+        for chunk in self._read_chunks():
+            self.num_rows += len(chunk)
+            chunk.sort(key=lambda record: (order_sort_value(record[0]), record[0], record[1]))
+            # Нечисловые номера сортируются после числовых, достаточно проверить последний
+            all_numeric = all_numeric and order_sort_value(chunk[-1][0])[0] == 0
+            self._runs.append(_write_run(self._spill_dir.name, chunk))
+
+        # Если номера заказов не все числовые, сортируем по строке (как pandas)
+        if not all_numeric:
+            for i, path in enumerate(self._runs):
+                records = list(_read_run(path))
+                os.remove(path)
+                records.sort(key=lambda record: (record[0], record[1]))
+                self._runs[i] = _write_run(self._spill_dir.name, records)
+        self._sort_value = order_sort_value if all_numeric else lambda order_key: order_key
+
+        for _ in self._iter_merged_orders():
+            self.num_orders += 1
+
+    def _iter_sorted_file(self):
+        """Группирует строки отсортированного файла, перенося незавершенный заказ между блоками"""
+        pending = None
+        previous_value = None
+        for chunk in self._read_chunks():
+            for order_key, row_index, product_id, is_upsell in chunk:
+                if pending is not None and pending[0] == order_key:
+                    pending[2].append((product_id, is_upsell))
+                    continue
+
+                if pending is not None:
+                    yield pending
+
+                # Номера должны возрастать, иначе заказ мог встретиться раньше
+                value = order_sort_value(order_key)
+                if previous_value is not None and value <= previous_value:
+                    raise ValueError(f"Файл '{describe_inputs(self.path)}' не отсортирован по номеру заказа: "
+                                     f"заказ {order_key} (строка {row_index + 2})")
+                previous_value = value
+                pending = (order_key, row_index, [(product_id, is_upsell)])
+
+        if pending is not None:
+            yield pending
+
+    def _iter_merged_orders(self):
+        """Слияние отсортированных блоков с диска в заказы в порядке номеров"""
+        sort_value = self._sort_value
+        merged = heapq.merge(*(_read_run(path) for path in self._runs),
+                             key=lambda record: (sort_value(record[0]), record[0], record[1]))
+        pending = None
+        for order_key, row_index, product_id, is_upsell in merged:
+            if pending is not None and pending[0] == order_key:
+                pending[2].append((product_id, is_upsell))
+                continue
+            if pending is not None:
+                yield pending
+            pending = (order_key, row_index, [(product_id, is_upsell)])
+
+        if pending is not None:
+            yield pending
+
+    def _iter_first_seen_orders(self):
+        """Заказы в порядке первого появления в файле: повторная внешняя сортировка по первой строке"""
+        runs = []
+        buffer = []
+        buffered_rows = 0
+        for order in self._iter_merged_orders():
+            buffer.append(order)
+            buffered_rows += len(order[2])
+            if buffered_rows >= self.chunk_rows:
+                buffer.sort(key=lambda order: order[1])
+                runs.append(_write_run(self._spill_dir.name, buffer))
+                buffer = []
+                buffered_rows = 0
+
+        buffer.sort(key=lambda order: order[1])
+        try:
+            yield from heapq.merge(buffer, *(_read_run(path) for path in runs), key=lambda order: order[1])
+        finally:
+            for path in runs:
+                os.remove(path)
+
+    def iter_orders(self, sort_keys=False, positions=False):
+        """
+        Перебирает заказы, разделяя товары на основные и допродажи
+
+        Args:
+            sort_keys (bool): Перебирать заказы в порядке номеров (как groupby в pandas),
+                а не в порядке первого появления в файле
+            positions (bool): Добавлять позицию заказа в порядке первого появления в файле
+                (номер его первой строки)
+
+        Yields:
+            tuple: (номер заказа, коды основных товаров, коды допродаж) в порядке строк файла;
+                с positions=True - (номер заказа, позиция, коды основных товаров, коды допродаж)
+        """
+        if self.sorted_input:
+            # В отсортированном файле порядок появления совпадает с порядком номеров
+            orders = self._iter_sorted_file()
+        elif sort_keys:
+            orders = self._iter_merged_orders()
+        else:
+            orders = self._iter_first_seen_orders()
+
+        for order_key, first_row, items in orders:
+            main_ids = []
+            upsell_ids = []
+            for product_id, is_upsell in items:
+                if is_upsell:
+                    upsell_ids.append(product_id)
+                else:
+                    main_ids.append(product_id)
+            if positions:
+                yield order_key, first_row, main_ids, upsell_ids
+            else:
+                yield order_key, main_ids, upsell_ids
+
+    def close(self):
+        """Удаляет временные файлы внешней сортировки"""
+        if self._spill_dir is not None:
+            self._spill_dir.cleanup()
+            self._spill_dir = None
@@ -0,0 +1,245 @@
+import csv
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import phase
+from input_options import open_orders, pop_input_options, report_memory
+
+
+class CooccurrenceMatrix:
+    """
+    Разреженная матрица совместных покупок "основной товар x допродажа" в формате CSR
+
+    Строка - код основного товара, столбец - код товара-допродажи, значение - число
+    заказов, где они встретились вместе. Внутри строки допродажи отсортированы по
+    убыванию числа заказов, поэтому топ-K допродаж к товару - срез строки без сортировки.
+
+    Примеры допродаж в отчете index.py из матрицы не берутся: там это первые уникальные
+    допродажи в порядке появления в файле, а порядок появления матрица не хранит. Поэтому
+    index.py копит уникальные пары кодов (counters.UniquePairs) - по одной на пару, а не
+    по одной на заказ, - и матрица их не заменяет.
+    """
+
+    def __init__(self, num_orders, indptr, indices, data, main_orders, upsell_orders):
+        """
+        Args:
+            num_orders (int): Всего заказов
+            indptr (numpy.ndarray): Границы строк в indices и data (длина - число товаров + 1)
+            indices (numpy.ndarray): Код допродажи каждого ненулевого элемента
+            data (numpy.ndarray): Число заказов каждого ненулевого элемента
+            main_orders (numpy.ndarray): Код товара -> число заказов, где он основной товар
+            upsell_orders (numpy.ndarray): Код товара -> число заказов, где он допродажа
+        """
+        self.num_orders = num_orders
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.main_orders = main_orders
+        self.upsell_orders = upsell_orders
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def rows(self):
+        """Код основного товара для каждого ненулевого элемента"""
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+    def metrics(self, mains, upsells, counts):
+        """
+        Поддержка, уверенность и лифт для пар (основной товар, допродажа)
+
+        Returns:
+            tuple: (поддержка, уверенность, лифт) - массивы той же длины, что и counts
+        """
+        support = counts / self.num_orders
+        confidence = counts / self.main_orders[mains]
+        lift = confidence / (self.upsell_orders[upsells] / self.num_orders)
+        return support, confidence, lift
+
+    def top_upsells(self, product, k=10):
+        """
+        Топ-K допродаж к основному товару по числу совместных заказов
+
+        Args:
+            product (int): Код основного товара
+            k (int): Сколько допродаж вернуть
+
+        Returns:
+            list: Кортежи (код допродажи, заказов, поддержка, уверенность, лифт)
+        """
+        start = self.indptr[product]
+        end = min(self.indptr[product + 1], start + k)
+        upsells = self.indices[start:end]
+        counts = self.data[start:end]
+        support, confidence, lift = self.metrics(np.full(len(upsells), product), upsells, counts)
+        return list(zip(upsells.tolist(), counts.tolist(), support.tolist(), confidence.tolist(), lift.tolist()))
+
+    def to_scipy(self):
+        """Та же матрица как scipy.sparse.csr_matrix (нужен пакет scipy)"""
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            raise ImportError("Для to_scipy() нужен пакет scipy: pip install scipy")
+        size = len(self.indptr) - 1
+        return csr_matrix((self.data, self.indices, self.indptr), shape=(size, size))
+
+
+def _unique_pairs(order_ids, product_ids, num_products):
+    """Уникальные пары (заказ, товар)"""
+    keys = np.unique(order_ids.astype(np.int64) * num_products + product_ids)
+    return keys // num_products, keys % num_products
+
+
+def build_cooccurrence(store):
+    """
+    Строит матрицу совместных покупок за один векторный проход по таблице строк
+
+    Каждая пара считается не больше одного раза на заказ; упаковка (коробки и пакеты)
+    исключается и из основных товаров, и из допродаж.
+
+    Args:
+        store (OrderStore): Загруженные заказы
+
+    Returns:
+        CooccurrenceMatrix: Матрица совместных покупок
+    """
+    num_products = len(store.product_names)
+    packaging = store.product_is_packaging[store.product_ids]
+    main = ~store.is_upsell & ~packaging
+    real_upsell = store.is_upsell & ~packaging
+
+    main_order, main_product = _unique_pairs(store.order_ids[main], store.product_ids[main], num_products)
+    upsell_order, upsell_product = _unique_pairs(store.order_ids[real_upsell], store.product_ids[real_upsell],
+                                                 num_products)
+
+    # Все пары "основной товар - допродажа" внутри заказов
+    pairs = pd.DataFrame({'order': main_order, 'main': main_product}).merge(
+        pd.DataFrame({'order': upsell_order, 'upsell': upsell_product}), on='order')
+    keys, counts = np.unique(pairs['main'].to_numpy() * num_products + pairs['upsell'].to_numpy(),
+                             return_counts=True)
+    mains = keys // num_products
+    upsells = keys % num_products
+
+    # Внутри строки - по убыванию числа заказов, при равенстве - по коду допродажи
+    order = np.lexsort((upsells, -counts, mains))
+    indptr = np.zeros(num_products + 1, dtype=np.int64)
+    np.cumsum(np.bincount(mains, minlength=num_products), out=indptr[1:])
+
+    return CooccurrenceMatrix(
+        num_orders=store.num_orders,
+        indptr=indptr,
+        indices=upsells[order],
+        data=counts[order],
+        main_orders=np.bincount(main_product, minlength=num_products),
+        upsell_orders=np.bincount(upsell_product, minlength=num_products),
+    )
+
+
+def write_affinity_report(store, matrix, min_count=1, top_n=10):
+    """Выводит итоги в консоль и сохраняет 'product_affinity.csv'"""
+    names = store.product_names
+    mains = matrix.rows()
+    upsells = matrix.indices
+    counts = matrix.data
+    support, confidence, lift = matrix.metrics(mains, upsells, counts)
+
+    # Пары по убыванию числа заказов, при равенстве - по убыванию лифта
+    keep = np.flatnonzero(counts >= min_count)
+    keep = keep[np.lexsort((-lift[keep], -counts[keep]))]
+
+    with open('product_affinity.csv', 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Основной товар', 'Допродажа', 'Заказов', 'Поддержка (%)', 'Уверенность (%)', 'Лифт'])
+        for i in keep.tolist():
+            writer.writerow([names[mains[i]], names[upsells[i]], int(counts[i]),
+                             f"{round(support[i] * 100, 2)}%", f"{round(confidence[i] * 100, 1)}%",
+                             round(float(lift[i]), 2)])
+
+    print(f"\nВсего заказов: {matrix.num_orders}")
+    print(f"Пар 'основной товар - допродажа': {matrix.nnz} (в отчете: {len(keep)})")
+
+    print(f"\nТоп-{top_n} пар по числу заказов:")
+    for rank, i in enumerate(keep[:top_n].tolist(), 1):
+        print(f"{rank}. {names[mains[i]]} -> {names[upsells[i]]}: {int(counts[i])} заказов "
+              f"(уверенность {round(confidence[i] * 100, 1)}%, лифт {round(float(lift[i]), 2)})")
+
+    print(f"\nРезультаты сохранены в файл 'product_affinity.csv'")
+
+
+def print_top_upsells(store, matrix, product_name, k=10):
+    """Выводит топ-K допродаж к товару из готовой матрицы"""
+    names = store.product_names
+    products = [code for code, name in enumerate(names) if name == product_name]
+    if not products:
+        print(f"\nТовар '{product_name}' не найден")
+        return
+
+    for product in products:
+        started = time.perf_counter()
+        top = matrix.top_upsells(product, k)
+        elapsed = (time.perf_counter() - started) * 1e6
+
+        print(f"\nТоп-{k} допродаж к '{product_name}' (основной товар в {int(matrix.main_orders[product])} заказах, "
+              f"запрос {elapsed:.0f} мкс):")
+        for rank, (upsell, count, support, confidence, lift) in enumerate(top, 1):
+            print(f"{rank}. {names[upsell]}: {count} заказов "
+                  f"(уверенность {round(confidence * 100, 1)}%, лифт {round(lift, 2)})")
+
+
+def analyze_product_affinity(store, min_count=1, top_n=10, product_name=None):
+    """
+    Анализирует совместные покупки основных товаров и допродаж
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_count (int): Минимальное число заказов для пары в отчете (по умолчанию 1)
+        top_n (int): Сколько пар (и допродаж к товару) выводить в консоль (по умолчанию 10)
+        product_name (str): Товар, для которого вывести топ допродаж (необязательно)
+    """
+    print("Строю матрицу совместных покупок...")
+    with phase('aggregate'):
+        matrix = build_cooccurrence(store)
+    with phase('write'):
+        write_affinity_report(store, matrix, min_count, top_n)
+    if product_name is not None:
+        print_top_upsells(store, matrix, product_name, top_n)
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    min_count = 1
+    top_n = 10
+    product_name = None
+
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--min-count':
+                min_count = int(args.pop(0))
+            elif arg == '--top':
+                top_n = int(args.pop(0))
+            elif arg == '--product':
+                product_name = args.pop(0)
+            else:
+                print(f"Ошибка: неизвестный аргумент '{arg}'")
+                sys.exit(1)
+    except (IndexError, ValueError):
+        print("Использование: python product_affinity.py [--min-count N] [--top K] [--product НАЗВАНИЕ]")
+        sys.exit(1)
+
+    if min_count < 1 or top_n < 1:
+        print("Ошибка: --min-count и --top должны быть больше 0")
+        sys.exit(1)
+
+    # Матрица строится векторно по всей таблице строк
+    if options['stream'] or options['incremental']:
+        print("Ошибка: --stream и --incremental не поддерживаются в анализе совместных покупок")
+        sys.exit(1)
+
+    analyze_product_affinity(open_orders(options), min_count, top_n, product_name)
+    report_memory(options)
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Файл с правилами категоризации по умолчанию (лежит рядом со скриптами)
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'categories.json')
+
+# Максимальное число уникальных названий в кэше классификатора
+DEFAULT_CACHE_SIZE = 1 << 16
+
+
+class CategoryClassifier:
+    """
+    Классификатор товаров по ключевым словам в названии
+
+    Правила проверяются по порядку: товар относится к первой категории, ключевое
+    слово которой встречается в названии. Все ключевые слова собраны в одно
+    регулярное выражение, а результат для каждого названия кэшируется.
+    """
+
+    def __init__(self, categories, packaging, default='Другое', cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            categories (list): Пары (категория, список ключевых слов) в порядке приоритета
+            packaging (list): Ключевые слова упаковки (коробки, пакеты)
+            default (str): Категория для товаров без совпадений
+            cache_size (int): Размер кэша уникальных названий
+        """
+        self._args = (categories, packaging, default, cache_size)
+        self.category_names = [name for name, _ in categories] + [default]
+        self.default_code = len(self.category_names) - 1
+
+        # Ключевое слово -> код категории (первое правило имеет приоритет)
+        self._keyword_codes = {}
+        for code, (_, keywords) in enumerate(categories):
+            for keyword in keywords:
+                self._keyword_codes.setdefault(keyword, code)
+
+        # Просмотр вперед находит совпадения в каждой позиции, в том числе перекрывающиеся;
+        # в одной позиции альтернатива с более высоким приоритетом стоит раньше
+        alternatives = '|'.join(re.escape(keyword) for keyword in self._keyword_codes)
+        self._category_pattern = re.compile(f'(?=({alternatives}))') if alternatives else None
+        self._packaging_pattern = re.compile('|'.join(re.escape(keyword) for keyword in packaging)) if packaging else None
+
+        self.category_code = lru_cache(maxsize=cache_size)(self._category_code)
+        self.is_packaging = lru_cache(maxsize=cache_size)(self._is_packaging)
+
+    def __reduce__(self):
+        # Кэши не сериализуются, классификатор пересобирается из правил
+        return CategoryClassifier, self._args
+
+    def fingerprint(self):
+        """Отпечаток правил: меняется при изменении категорий, ключевых слов или упаковки"""
+        categories, packaging, default, _ = self._args
+        rules = json.dumps([categories, packaging, default], ensure_ascii=False)
+        return hashlib.blake2b(rules.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _category_code(self, product_name):
+        if self._category_pattern is None:
+            return self.default_code
+        codes = [self._keyword_codes[keyword] for keyword in self._category_pattern.findall(product_name)]
+        return min(codes) if codes else self.default_code
+
+    def _is_packaging(self, product_name):
+        return self._packaging_pattern is not None and self._packaging_pattern.search(product_name) is not None
+
+    def classify(self, product_name):
+        """Определяет категорию товара по его названию"""
+        return self.category_names[self.category_code(product_name)]
+
+    def category_codes(self, product_names):
+        """
+        Сопоставляет колонке названий коды категорий за один вызов
+
+        Каждое уникальное название классифицируется один раз.
+
+        Args:
+            product_names: Последовательность или pandas.Series названий товаров
+
+        Returns:
+            numpy.ndarray: Коды категорий (индексы в category_names)
+        """
+        inverse, uniques = pd.factorize(pd.Series(product_names, dtype=object))
+        table = np.array([self.category_code(name) for name in uniques], dtype=np.int16)
+        return table[inverse]
+
+    def packaging_flags(self, product_names):
+        """
+        Сопоставляет колонке названий признаки упаковки за один вызов
+
+        Args:
+            product_names: Последовательность или pandas.Series названий товаров
+
+        Returns:
+            numpy.ndarray: Булев массив, True для коробок и пакетов
+        """
+        inverse, uniques = pd.factorize(pd.Series(product_names, dtype=object))
+        table = np.array([self.is_packaging(name) for name in uniques], dtype=bool)
+        return table[inverse]
+
+
+def load_classifier(path=DEFAULT_RULES, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Загружает правила категоризации из JSON файла
+
+    Args:
+        path (str): Путь к файлу правил (по умолчанию 'categories.json')
+        cache_size (int): Размер кэша уникальных названий
+
+    Returns:
+        CategoryClassifier: Скомпилированный классификатор
+    """
+    with open(path, 'r', encoding='utf-8') as rules_file:
+        rules = json.load(rules_file)
+
+    categories = [(rule['name'], rule['keywords']) for rule in rules['categories']]
+    return CategoryClassifier(
+        categories,
+        rules.get('packaging', []),
+        default=rules.get('default', 'Другое'),
+        cache_size=cache_size,
+    )
+
+
+@lru_cache(maxsize=None)
+def default_classifier():
+    """Классификатор с правилами из 'categories.json'"""
+    return load_classifier()
+
+
+def get_product_category(product_name):
+    """Определяет категорию товара по его названию"""
+    return default_classifier().classify(product_name)
@@ -0,0 +1,280 @@
+import csv
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import phase
+from input_options import open_orders, pop_input_options, report_memory
+
+# Минимальная поддержка по умолчанию: доля заказов с набором товаров
+DEFAULT_MIN_SUPPORT = 0.001
+
+# Сколько допродаж показывать для каждого набора
+DEFAULT_TOP_UPSELLS = 5
+
+
+def _grouped(groups, values, num_groups, num_values):
+    """
+    Уникальные значения каждой группы в формате CSR (например, товары каждого заказа)
+
+    Returns:
+        tuple: (границы групп длиной num_groups + 1, значения по группам по возрастанию)
+    """
+    keys = np.unique(groups.astype(np.int64) * num_values + values)
+    indptr = np.zeros(num_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // num_values, minlength=num_groups), out=indptr[1:])
+    return indptr, keys % num_values
+
+
+def _frequent_pairs(order_ids, ranks, num_orders, num_items, min_support_count):
+    """
+    Частые пары товаров, подсчитанные векторно по всем заказам сразу
+
+    Returns:
+        list: Для каждого товара (по рангу) множество рангов старших товаров, с которыми
+            он образует частую пару
+    """
+    indptr, items = _grouped(order_ids, ranks, num_orders, num_items)
+
+    # Все пары (младший, старший) внутри каждого заказа
+    frame = pd.DataFrame({'order': np.repeat(np.arange(num_orders), np.diff(indptr)), 'item': items})
+    pairs = frame.merge(frame, on='order')
+    first = pairs['item_x'].to_numpy()
+    second = pairs['item_y'].to_numpy()
+    keys, counts = np.unique((first * num_items + second)[first < second], return_counts=True)
+    keys = keys[counts >= min_support_count]
+
+    partners = [set() for _ in range(num_items)]
+    for item, other in zip((keys // num_items).tolist(), (keys % num_items).tolist()):
+        partners[item].add(other)
+    return partners
+
+
+def mine_frequent_itemsets(store, min_support_count, min_size=2, max_size=3):
+    """
+    Находит частые наборы основных товаров (поиск в глубину по спискам заказов, как в Eclat)
+
+    Для каждого частого товара хранится отсортированный список заказов с ним; список
+    заказов набора - пересечение списков его товаров. Частые пары считаются сразу
+    по всем заказам, а набор расширяется только товарами, образующими частую пару
+    с его последним товаром. Редкие наборы не расширяются (их надмножества тоже
+    редкие), поэтому перебираются только частые наборы, а не все сочетания товаров.
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_support_count (int): Минимальное число заказов с набором
+        min_size (int): Минимальный размер набора в результате
+        max_size (int): Максимальный размер набора
+
+    Returns:
+        list: Кортежи (коды товаров набора, массив кодов заказов с набором)
+    """
+    num_products = len(store.product_names)
+    packaging = store.product_is_packaging[store.product_ids]
+    main = ~store.is_upsell & ~packaging
+
+    # Заказы каждого товара (товары упорядочены по коду, заказы - по возрастанию)
+    indptr, orders = _grouped(store.product_ids[main], store.order_ids[main], num_products, store.num_orders)
+    supports = np.diff(indptr)
+
+    # Частые товары получают ранг по возрастанию поддержки: пересечения начинаются с коротких списков
+    frequent = np.flatnonzero(supports >= min_support_count)
+    frequent = frequent[np.argsort(supports[frequent], kind='stable')]
+    tidsets = [orders[indptr[product]:indptr[product + 1]] for product in frequent.tolist()]
+
+    ranks = np.full(num_products, -1, dtype=np.int64)
+    ranks[frequent] = np.arange(len(frequent))
+    rows = main & (ranks[store.product_ids] >= 0)
+    partners = []
+    if max_size >= 2:
+        partners = _frequent_pairs(store.order_ids[rows], ranks[store.product_ids[rows]], store.num_orders,
+                                   len(frequent), min_support_count)
+
+    itemsets = []
+    for item, tids in enumerate(tidsets):
+        if min_size <= 1:
+            itemsets.append(((item,), tids))
+        if max_size < 2:
+            continue
+
+        stack = [[((item, other), np.intersect1d(tids, tidsets[other], assume_unique=True))
+                  for other in sorted(partners[item])]]
+        while stack:
+            level = stack.pop()
+            for i, (itemset, itemset_tids) in enumerate(level):
+                if len(itemset) >= min_size:
+                    itemsets.append((itemset, itemset_tids))
+                if len(itemset) >= max_size:
+                    continue
+
+                # Расширяем товарами, которые образуют частую пару с последним товаром набора
+                extensions = []
+                last_partners = partners[itemset[-1]]
+                for other, other_tids in level[i + 1:]:
+                    if other[-1] not in last_partners:
+                        continue
+                    common = np.intersect1d(itemset_tids, other_tids, assume_unique=True)
+                    if len(common) >= min_support_count:
+                        extensions.append((itemset + other[-1:], common))
+                if extensions:
+                    stack.append(extensions)
+
+    # Ранги обратно в коды товаров
+    codes = frequent.tolist()
+    return [(tuple(codes[item] for item in itemset), tids) for itemset, tids in itemsets]
+
+
+def count_combo_upsells(store, itemsets, top_upsells=DEFAULT_TOP_UPSELLS):
+    """
+    Подсчитывает допродажи в заказах с каждым частым набором товаров
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        itemsets (list): Результат mine_frequent_itemsets()
+        top_upsells (int): Сколько самых частых допродаж сохранить для набора
+
+    Returns:
+        list: Словари с ключами 'products', 'orders', 'orders_with_upsells', 'top_upsells'
+            (список пар (код допродажи, заказов))
+    """
+    num_products = len(store.product_names)
+    packaging = store.product_is_packaging[store.product_ids]
+    real_upsell = store.is_upsell & ~packaging
+    indptr, upsells = _grouped(store.order_ids[real_upsell], store.product_ids[real_upsell],
+                               store.num_orders, num_products)
+
+    results = []
+    for itemset, tids in itemsets:
+        starts = indptr[tids]
+        lengths = indptr[tids + 1] - starts
+
+        # Допродажи всех заказов набора одним массивом
+        rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        counts = np.bincount(upsells[rows], minlength=num_products)
+        top = np.argsort(-counts, kind='stable')[:top_upsells]
+
+        results.append({
+            'products': itemset,
+            'orders': len(tids),
+            'orders_with_upsells': int(np.count_nonzero(lengths)),
+            'top_upsells': [(int(product), int(counts[product])) for product in top if counts[product] > 0],
+        })
+    return results
+
+
+def write_product_combo_report(store, results):
+    """Выводит итоги в консоль и сохраняет 'product_combo_analysis.csv'"""
+    names = store.product_names
+
+    # Товары набора по названию, наборы - по убыванию числа заказов
+    rows = []
+    for result in results:
+        products = tuple(sorted(names[product] for product in result['products']))
+        rows.append((products, result))
+    rows.sort(key=lambda row: (-row[1]['orders'], row[0]))
+
+    with open('product_combo_analysis.csv', 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Комбинация товаров', 'Размер', 'Количество заказов', 'Поддержка (%)',
+                         'Заказов с допродажами', 'Доля с допродажами (%)', 'Частые допродажи'])
+        for products, result in rows:
+            support = round(result['orders'] / store.num_orders * 100, 2) if store.num_orders else 0
+            upsell_share = round(result['orders_with_upsells'] / result['orders'] * 100, 1)
+            top = '; '.join(f"{names[product]} ({count})" for product, count in result['top_upsells'])
+            writer.writerow([" + ".join(products), len(products), result['orders'], f"{support}%",
+                             result['orders_with_upsells'], f"{upsell_share}%", top])
+
+    sizes = defaultdict(int)
+    for products, _ in rows:
+        sizes[len(products)] += 1
+
+    print(f"\nНайдено {len(rows)} частых комбинаций товаров")
+    print(f"\nРаспределение по размерам комбинаций:")
+    for size in sorted(sizes):
+        print(f"  - {size} товара: {sizes[size]} комбинаций")
+
+    print(f"\nТоп-10 комбинаций по числу заказов:")
+    for rank, (products, result) in enumerate(rows[:10], 1):
+        print(f"\n{rank}. {' + '.join(products)} (заказов: {result['orders']}, "
+              f"с допродажами: {result['orders_with_upsells']})")
+        for product, count in result['top_upsells']:
+            print(f"   - {names[product]}: {count}")
+
+    print(f"\nРезультаты сохранены в файл 'product_combo_analysis.csv'")
+
+
+def analyze_product_combos(store, min_support=DEFAULT_MIN_SUPPORT, min_size=2, max_size=3,
+                           top_upsells=DEFAULT_TOP_UPSELLS):
+    """
+    Анализирует частые наборы основных товаров и допродажи к ним
+
+    Args:
+        store (OrderStore): Загруженные заказы
+        min_support (float): Минимальная поддержка: доля заказов (меньше 1) или число заказов
+            (дробное число заказов округляется вверх)
+        min_size (int): Минимальный размер набора (по умолчанию 2)
+        max_size (int): Максимальный размер набора (по умолчанию 3)
+        top_upsells (int): Сколько самых частых допродаж показывать для набора
+    """
+    if min_support < 1:
+        min_support_count = max(1, int(np.ceil(min_support * store.num_orders)))
+    else:
+        min_support_count = int(np.ceil(min_support))
+    print(f"Ищу комбинации товаров, встречающиеся не менее чем в {min_support_count} заказах...")
+
+    with phase('aggregate'):
+        itemsets = mine_frequent_itemsets(store, min_support_count, min_size, max_size)
+        results = count_combo_upsells(store, itemsets, top_upsells)
+    with phase('write'):
+        write_product_combo_report(store, results)
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    min_support = DEFAULT_MIN_SUPPORT
+    min_size = 2
+    max_size = 3
+    top_upsells = DEFAULT_TOP_UPSELLS
+
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--min-support':
+                min_support = float(args.pop(0))
+            elif arg == '--min-size':
+                min_size = int(args.pop(0))
+            elif arg == '--max-size':
+                max_size = int(args.pop(0))
+            elif arg == '--top-upsells':
+                top_upsells = int(args.pop(0))
+            else:
+                print(f"Ошибка: неизвестный аргумент '{arg}'")
+                sys.exit(1)
+    except (IndexError, ValueError):
+        print("Использование: python product_combos.py [--min-support ДОЛЯ|ЗАКАЗОВ] [--min-size N] "
+              "[--max-size N] [--top-upsells K]")
+        sys.exit(1)
+
+    if min_support <= 0:
+        print("Ошибка: минимальная поддержка должна быть больше 0")
+        sys.exit(1)
+
+    # Значение от 1 - число заказов, поэтому оно должно быть целым (2.5 - не 2 и не 3 заказа)
+    if min_support >= 1 and not min_support.is_integer():
+        print("Ошибка: --min-support - доля заказов меньше 1 или целое число заказов")
+        sys.exit(1)
+
+    if min_size < 1 or max_size < min_size:
+        print("Ошибка: размеры комбинаций должны быть больше 0, а максимальный - не меньше минимального")
+        sys.exit(1)
+
+    # Списки заказов строятся векторно по всей таблице строк
+    if options['stream'] or options['incremental']:
+        print("Ошибка: --stream и --incremental не поддерживаются в анализе комбинаций товаров")
+        sys.exit(1)
+
+    analyze_product_combos(open_orders(options), min_support, min_size, max_size, top_upsells)
+    report_memory(options)
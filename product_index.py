@@ -0,0 +1,66 @@
+import csv
+import hashlib
+import json
+
+# Колонка с артикулом товара
+ARTICLE_COLUMN = 'Артикул'
+
+# Колонка с названием товара
+NAME_COLUMN = 'Товары'
+
+# Префикс ключа строк без артикула (такие строки различаются по названию)
+NAME_KEY_PREFIX = '\x00'
+
+
+def load_catalog(path):
+    """
+    Загружает справочник товаров: CSV файл с колонками 'Артикул' и 'Товары'
+
+    Args:
+        path (str): Путь к файлу справочника
+
+    Returns:
+        dict: Артикул -> каноническое название товара
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if not reader.fieldnames or ARTICLE_COLUMN not in reader.fieldnames or NAME_COLUMN not in reader.fieldnames:
+            raise ValueError(f"В справочнике '{path}' нужны колонки '{ARTICLE_COLUMN}' и '{NAME_COLUMN}'")
+        return {row[ARTICLE_COLUMN]: row[NAME_COLUMN] for row in reader if row[ARTICLE_COLUMN]}
+
+
+def products_variant(by_article=False, catalog=None):
+    """Описание способа кодирования товаров (для проверки кэша разобранного файла)"""
+    if not by_article:
+        return 'name'
+    digest = hashlib.blake2b(json.dumps(catalog or {}, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+                             digest_size=16)
+    return f'article:{digest.hexdigest()}'
+
+
+class ProductIndex:
+    """
+    Справочник товаров по артикулу: артикул -> целочисленный код и каноническое название
+
+    Разные варианты названия одного артикула получают один код. Каноническое
+    название берется из справочника, а если артикула в нем нет - первое
+    встретившееся в файле. Строки без артикула различаются по названию.
+    """
+
+    def __init__(self, catalog=None):
+        """
+        Args:
+            catalog (dict): Артикул -> каноническое название (необязательно)
+        """
+        self.catalog = catalog or {}
+        self.codes = {}
+        self.names = []
+
+    def code(self, article, name):
+        """Возвращает код товара, добавляя его в справочник при первом появлении"""
+        key = article if article else NAME_KEY_PREFIX + name
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.names)
+            self.names.append(self.catalog.get(article, name) if article else name)
+        return code
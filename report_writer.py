@@ -0,0 +1,141 @@
+import csv
+import os
+
+import numpy as np
+
+# Размер буфера записи файла отчета (байт): строки уходят на диск блоками
+WRITE_BUFFER = 1 << 20
+
+# Сохранять ли рядом с CSV копию отчета в Parquet
+_parquet = False
+
+
+def parquet_available():
+    """Установлен ли pyarrow, нужный pandas для записи Parquet"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def configure(parquet=False):
+    """
+    Включает сохранение отчетов в Parquet ('<имя>.parquet' рядом с '<имя>.csv')
+
+    Raises:
+        ImportError: Не установлен pyarrow
+    """
+    global _parquet
+    if parquet and not parquet_available():
+        raise ImportError("Для --parquet нужен пакет pyarrow: pip install pyarrow")
+    _parquet = parquet
+
+
+class Percentages:
+    """
+    Колонка долей count / total в процентах
+
+    Доли считаются одним векторным делением, а в CSV записываются так же, как
+    f"{round(доля, 1)}%": формат '%.1f' округляет двоичное значение до десятых
+    тем же корректным округлением, что и round(). При total == 0 доля равна '0%'.
+    """
+
+    def __init__(self, counts, totals):
+        """
+        Args:
+            counts (sequence): Количества
+            totals (sequence or int): Знаменатели (одно число на всю колонку или по строкам)
+        """
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.totals = np.broadcast_to(np.asarray(totals, dtype=np.float64), self.counts.shape)
+
+    def values(self):
+        """Доли в процентах (без округления); при total == 0 - 0.0"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = self.counts / self.totals * 100
+        return np.where(self.totals > 0, values, 0.0)
+
+    def text(self):
+        """Доли в виде строк '12.3%' для CSV"""
+        positive = (self.totals > 0).tolist()
+        return ['%.1f%%' % value if ok else '0%' for value, ok in zip(self.values().tolist(), positive)]
+
+
+class Numbers:
+    """Колонка чисел, которые в CSV записываются по формату (например, '%.2f'); NaN - пустая ячейка"""
+
+    def __init__(self, values, fmt):
+        """
+        Args:
+            values (sequence): Числа
+            fmt (str): Формат для оператора % (например, '%.1f%%' для процентов)
+        """
+        self._values = np.asarray(values, dtype=np.float64)
+        self.fmt = fmt
+
+    def values(self):
+        """Числа без округления (для Parquet)"""
+        return self._values
+
+    def text(self):
+        """Числа в виде строк для CSV"""
+        fmt = self.fmt
+        return [fmt % value if value == value else '' for value in self._values.tolist()]
+
+
+def count_matrix(stats, rows, columns):
+    """
+    Матрица счетчиков из вложенных словарей stats[строка][колонка] (нет ключа - 0)
+
+    Returns:
+        numpy.ndarray: Массив int64 размера len(rows) x len(columns)
+    """
+    counts = np.array([[stats[row].get(column, 0) for column in columns] for row in rows], dtype=np.int64)
+    return counts.reshape(len(rows), len(columns))
+
+
+def _csv_column(column):
+    """Значения колонки для csv.writer"""
+    if isinstance(column, (Percentages, Numbers)):
+        return column.text()
+    if isinstance(column, np.ndarray):
+        return column.tolist()
+    return column
+
+
+def write_table(path, header, columns):
+    """
+    Сохраняет отчет в CSV по колонкам (и в Parquet, если он включен)
+
+    Строки собираются из колонок через zip прямо в csv.writer.writerows, без
+    списка на каждую строку, а файл пишется на диск блоками по WRITE_BUFFER байт.
+
+    Args:
+        path (str): Путь к CSV файлу
+        header (list): Заголовки колонок
+        columns (list): Колонки одинаковой длины: списки, массивы numpy, Percentages или Numbers
+    """
+    values = [_csv_column(column) for column in columns]
+
+    with open(path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(zip(*values))
+
+    if _parquet:
+        _write_parquet(os.path.splitext(path)[0] + '.parquet', header, columns)
+
+
+def _write_parquet(path, header, columns):
+    """Сохраняет отчет в Parquet; доли - числами (проценты, округленные до десятых)"""
+    import pandas as pd
+
+    data = {}
+    for name, column in zip(header, columns):
+        if isinstance(column, Percentages):
+            column = np.round(column.values(), 1)
+        elif isinstance(column, Numbers):
+            column = column.values()
+        data[name] = column
+    pd.DataFrame(data).to_parquet(path, index=False)
@@ -0,0 +1,333 @@
+import copy
+import json
+import os
+import pickle
+import re
+import sys
+from datetime import date
+
+import numpy as np
+
+from input_options import default_options
+from order_cache import file_key
+from order_loader import OrderStore, load_orders
+from product_categories import default_classifier
+from product_index import products_variant
+
+# Колонка с датой заказа (необязательная): 'ГГГГ-ММ-ДД' или 'ДД.ММ.ГГГГ', время после даты отбрасывается
+DATE_COLUMN = 'Дата'
+
+# Колонки сегментов заказа (необязательные): канал продаж и магазин
+SEGMENT_COLUMNS = ('Канал', 'Магазин')
+
+# Колонки заказа, которые читаются для агрегатов по дням и сегментам
+ORDER_COLUMNS = (DATE_COLUMN,) + SEGMENT_COLUMNS
+
+# Версия формата файла агрегатов; при изменении старые агрегаты перестраиваются
+ROLLUP_VERSION = 1
+
+_ISO_DAY = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+_DOTTED_DAY = re.compile(r'(\d{2})\.(\d{2})\.(\d{4})')
+
+
+def parse_day(text):
+    """
+    День заказа в формате 'ГГГГ-ММ-ДД'
+
+    Raises:
+        ValueError: Дата не в формате 'ГГГГ-ММ-ДД' или 'ДД.ММ.ГГГГ'
+    """
+    text = text.strip()
+    match = _ISO_DAY.match(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = _DOTTED_DAY.match(text)
+        if not match:
+            raise ValueError(f"неизвестный формат даты '{text}' (нужен ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)")
+        day, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        raise ValueError(f"несуществующая дата '{text}'")
+
+
+def rollup_path(path, name):
+    """Путь к файлу дневных агрегатов анализа рядом с файлом заказов"""
+    return f'{path}.{name}.rollup'
+
+
+def pop_rollup_options(args):
+    """
+    Извлекает из аргументов командной строки отбор по датам и сегментам
+
+    Поддерживаются флаги:
+        --from ДАТА                  заказы начиная с этого дня (включительно)
+        --to ДАТА                    заказы по этот день (включительно)
+        --segment КОЛОНКА=ЗНАЧЕНИЕ   только заказы сегмента; значения одной колонки
+                                     объединяются, разных колонок - пересекаются
+
+    Args:
+        args (list): Аргументы командной строки
+
+    Returns:
+        tuple: (отбор или None, если флагов нет, оставшиеся аргументы)
+    """
+    filters = {'from': None, 'to': None, 'segments': {}}
+    given = False
+    rest = []
+
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in ('--from', '--to'):
+            given = True
+            try:
+                filters[arg[2:]] = parse_day(args.pop(0))
+            except IndexError:
+                print(f"Ошибка: после {arg} должна идти дата (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)")
+                sys.exit(1)
+            except ValueError as error:
+                print(f"Ошибка: {error}")
+                sys.exit(1)
+        elif arg == '--segment':
+            given = True
+            try:
+                column, value = args.pop(0).split('=', 1)
+            except (IndexError, ValueError):
+                print("Ошибка: после --segment должно идти КОЛОНКА=ЗНАЧЕНИЕ (например, Канал=Сайт)")
+                sys.exit(1)
+            filters['segments'].setdefault(column, set()).add(value)
+        else:
+            rest.append(arg)
+
+    if filters['from'] and filters['to'] and filters['from'] > filters['to']:
+        print("Ошибка: дата --from не может быть позже даты --to")
+        sys.exit(1)
+
+    return (filters if given else None), rest
+
+
+def describe_filters(filters):
+    """Отбор в виде текста для консоли"""
+    parts = []
+    if filters['from'] or filters['to']:
+        parts.append(f"период {filters['from'] or '...'} - {filters['to'] or '...'}")
+    for column, values in filters['segments'].items():
+        parts.append(f"{column}: {', '.join(sorted(values))}")
+    return '; '.join(parts)
+
+
+def order_buckets(store):
+    """
+    Группы заказов по дню и сегменту (по первой строке заказа)
+
+    Args:
+        store (OrderStore): Заказы, прочитанные с колонками даты и сегментов
+            (load_orders(order_columns=ORDER_COLUMNS))
+
+    Returns:
+        tuple: (колонки сегментов, есть ли дата, группы (день, значения сегментов)
+            по возрастанию, массив код заказа -> номер группы)
+    """
+    values = store.order_values
+    has_date = DATE_COLUMN in values
+    segment_columns = [column for column in SEGMENT_COLUMNS if column in values]
+    if not has_date and not segment_columns:
+        raise ValueError(f"В файле нет колонки '{DATE_COLUMN}' и колонок сегментов ({', '.join(SEGMENT_COLUMNS)})")
+
+    # Даты разбираются один раз на уникальное значение; заказы без даты получают пустой день
+    days = [''] * store.num_orders
+    if has_date:
+        parsed = {value: parse_day(value) if value.strip() else '' for value in set(values[DATE_COLUMN])}
+        days = [parsed[value] for value in values[DATE_COLUMN]]
+    keys = list(zip(days, *(values[column] for column in segment_columns)))
+
+    groups = sorted(set(keys))
+    group_index = {key: index for index, key in enumerate(groups)}
+    buckets = [(key[0], key[1:]) for key in groups]
+    order_bucket = np.fromiter((group_index[key] for key in keys), dtype=np.int64, count=len(keys))
+    return segment_columns, has_date, buckets, order_bucket
+
+
+def bucket_stores(store, order_bucket, num_buckets):
+    """
+    Делит заказы на хранилища по группам
+
+    Строки каждой группы идут в порядке файла, а коды заказов перенумерованы
+    в порядке их появления, поэтому анализ группы совпадает с анализом файла,
+    в котором есть только заказы этой группы.
+
+    Yields:
+        OrderStore: Заказы очередной группы
+    """
+    row_buckets = order_bucket[store.order_ids]
+    rows = np.argsort(row_buckets, kind='stable')
+    bounds = np.searchsorted(row_buckets[rows], np.arange(num_buckets + 1))
+    for bucket in range(num_buckets):
+        part = rows[bounds[bucket]:bounds[bucket + 1]]
+        order_ids = store.order_ids[part]
+        codes = np.unique(order_ids)
+        yield OrderStore(
+            order_keys=[store.order_keys[code] for code in codes.tolist()],
+            product_names=store.product_names,
+            order_ids=np.searchsorted(codes, order_ids).astype(np.int32),
+            product_ids=store.product_ids[part],
+            is_upsell=store.is_upsell[part],
+            product_categories=store.product_categories,
+            product_is_packaging=store.product_is_packaging,
+        )
+
+
+def build_rollups(store, count):
+    """
+    Считает агрегаты анализа отдельно для каждого дня и сегмента
+
+    Args:
+        store (OrderStore): Заказы, прочитанные с колонками даты и сегментов
+        count (callable): Подсчет агрегатов анализа по OrderStore
+
+    Returns:
+        dict: Колонки сегментов, группы (день, сегмент), число заказов и агрегаты каждой
+            группы и агрегаты пустого набора заказов
+    """
+    segment_columns, has_date, buckets, order_bucket = order_buckets(store)
+    print(f"Строю агрегаты по дням и сегментам: {len(buckets)} групп заказов...")
+
+    parts = [(bucket_store.num_orders, count(bucket_store))
+             for bucket_store in bucket_stores(store, order_bucket, len(buckets))]
+    empty = OrderStore([], store.product_names, store.order_ids[:0], store.product_ids[:0], store.is_upsell[:0],
+                       product_categories=store.product_categories,
+                       product_is_packaging=store.product_is_packaging)
+    return {
+        'segment_columns': segment_columns,
+        'has_date': has_date,
+        'num_orders': store.num_orders,
+        'buckets': buckets,
+        'parts': parts,
+        'empty': count(empty),
+    }
+
+
+def load_rollups(name, count, options=None, params=None):
+    """
+    Загружает дневные агрегаты анализа или строит их, если файл заказов изменился
+
+    Агрегаты хранятся в файле '<path>.<name>.rollup' и перестраиваются, когда
+    меняется файл заказов, правила классификатора, способ кодирования товаров
+    или параметры анализа.
+
+    Args:
+        name (str): Имя анализа (часть имени файла агрегатов)
+        count (callable): Подсчет агрегатов анализа по OrderStore
+        options (dict): Параметры чтения заказов (по умолчанию 'products.csv')
+        params (dict): Параметры анализа, влияющие на агрегаты
+
+    Returns:
+        dict: Результат build_rollups()
+
+    Raises:
+        ValueError: Заказы читаются из нескольких файлов
+    """
+    options = options or default_options()
+    path = options['path']
+    if not isinstance(path, str):
+        raise ValueError("Отчеты за период и по сегментам строятся по одному файлу заказов")
+    config = json.dumps({
+        'params': params or {},
+        'rules': default_classifier().fingerprint(),
+        'products': products_variant(options['by_article'], options['catalog']),
+    }, sort_keys=True, ensure_ascii=False)
+    key = file_key(path)
+
+    saved = rollup_path(path, name)
+    try:
+        with open(saved, 'rb') as rollup_file:
+            rollup = pickle.load(rollup_file)
+        if rollup.get('version') == ROLLUP_VERSION and rollup['config'] == config and rollup['file'] == key:
+            return rollup
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    # Дата и сегменты читаются в том же проходе по файлу, что и строки заказов
+    store = load_orders(path, by_article=options['by_article'], catalog=options['catalog'],
+                        order_columns=ORDER_COLUMNS)
+    rollup = build_rollups(store, count)
+    rollup.update(version=ROLLUP_VERSION, config=config, file=key)
+
+    # Без сохранения (например, каталог только для чтения) агрегаты просто строятся заново
+    try:
+        with open(saved + '.tmp', 'wb') as rollup_file:
+            pickle.dump(rollup, rollup_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(saved + '.tmp', saved)
+    except OSError:
+        pass
+    return rollup
+
+
+def _add_stats(total, part):
+    """Прибавляет счетчики part к total (вложенные словари складываются по ключам)"""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_stats(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def select_rollups(rollup, filters):
+    """
+    Складывает агрегаты групп, подходящих под отбор
+
+    Заказы без даты не попадают в отбор по периоду.
+
+    Args:
+        rollup (dict): Результат load_rollups()
+        filters (dict): Отбор из pop_rollup_options()
+
+    Returns:
+        tuple: (агрегаты, число отобранных заказов)
+
+    Raises:
+        ValueError: В файле нет колонки, по которой задан отбор
+    """
+    columns = rollup['segment_columns']
+    if (filters['from'] or filters['to']) and not rollup['has_date']:
+        raise ValueError(f"В файле нет колонки '{DATE_COLUMN}'")
+    for column in filters['segments']:
+        if column not in columns:
+            available = f" (есть: {', '.join(columns)})" if columns else ""
+            raise ValueError(f"В файле нет колонки сегмента '{column}'{available}")
+
+    segment_filters = [(columns.index(column), values) for column, values in filters['segments'].items()]
+    stats = copy.deepcopy(rollup['empty'])
+    orders = 0
+    for (day, segment), (bucket_orders, part) in zip(rollup['buckets'], rollup['parts']):
+        if filters['from'] and (not day or day < filters['from']):
+            continue
+        if filters['to'] and (not day or day > filters['to']):
+            continue
+        if any(segment[index] not in values for index, values in segment_filters):
+            continue
+        _add_stats(stats, part)
+        orders += bucket_orders
+    return stats, orders
+
+
+def rollup_stats(name, count, filters, options=None, params=None):
+    """
+    Агрегаты анализа за период и сегмент, сложенные из дневных агрегатов без перебора заказов
+
+    Args:
+        name (str): Имя анализа
+        count (callable): Подсчет агрегатов анализа по OrderStore (для построения агрегатов)
+        filters (dict): Отбор из pop_rollup_options()
+        options (dict): Параметры чтения заказов
+        params (dict): Параметры анализа, влияющие на агрегаты
+
+    Returns:
+        dict: Агрегаты в том же виде, что и у count
+    """
+    rollup = load_rollups(name, count, options, params)
+    stats, orders = select_rollups(rollup, filters)
+    print(f"Отбор ({describe_filters(filters)}): {orders} из {rollup['num_orders']} заказов")
+    return stats
@@ -0,0 +1,189 @@
+import numpy as np
+
+from report_writer import Numbers
+
+# Квантиль нормального распределения для 95% доверительного интервала
+Z_95 = 1.959963984540054
+
+# Уровень значимости для флага "значимо"
+SIGNIFICANCE_LEVEL = 0.05
+
+# При меньшем ожидаемом числе допродаж хи-квадрат неточен и используется точный тест
+MIN_EXPECTED = 5
+
+# Сколько значений за границей max(наблюдаемое, ожидаемое) учитывать в точном тесте:
+# при ожидаемом меньше MIN_EXPECTED вероятности дальше пренебрежимо малы
+EXACT_TAIL = 50
+
+# Сколько значений вероятности держать в памяти за раз в точном тесте
+EXACT_BLOCK = 1 << 22
+
+
+def _erfc(x):
+    """Дополнительная функция ошибок для x >= 0 (Numerical Recipes, относительная погрешность < 1.2e-7)"""
+    t = 1.0 / (1.0 + 0.5 * x)
+    poly = -1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277))))))))
+    return t * np.exp(-x * x + poly)
+
+
+def poisson_score_interval(counts, totals, z=Z_95):
+    """
+    Score-интервал для пуассоновской частоты counts / totals
+
+    К одной продаже может быть несколько допродаж, поэтому частота может быть
+    больше 1, и интервал Уилсона для доли (биномиальной вероятности) не подходит.
+    Частота считается пуассоновской: границы - решения (k - n*r)^2 = z^2 * n*r,
+    то есть (k + z^2/2 -+ z * sqrt(k + z^2/4)) / n. В отличие от k/n +- z*sqrt(k)/n
+    интервал не схлопывается в ноль при малых k.
+
+    Returns:
+        tuple: (нижние границы, верхние границы) - массивы формы counts; при totals == 0 - NaN
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    half = z * np.sqrt(counts + z * z / 4)
+    center = counts + z * z / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = np.where(totals > 0, (center - half) / totals, np.nan)
+        high = np.where(totals > 0, (center + half) / totals, np.nan)
+    return low, high
+
+
+def lift(counts, totals):
+    """
+    Лифт частоты ячейки относительно базовой частоты колонки
+
+    Базовая частота колонки - сумма колонки, деленная на сумму totals по всем строкам.
+
+    Args:
+        counts (numpy.ndarray): Матрица счетчиков (строки x колонки)
+        totals (numpy.ndarray): Знаменатель каждой строки
+
+    Returns:
+        numpy.ndarray: Лифт каждой ячейки; NaN, если частоту не с чем сравнить
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    baseline = counts.sum(axis=0) / totals.sum() if totals.sum() > 0 else np.zeros(counts.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = counts / totals[:, None]
+        result = rates / baseline[None, :]
+    return np.where(np.isfinite(result), result, np.nan)
+
+
+def _log_factorials(n):
+    """log(k!) для k = 0..n"""
+    table = np.zeros(n + 1)
+    np.cumsum(np.log(np.arange(1, n + 1, dtype=np.float64)), out=table[1:])
+    return table
+
+
+def _exact_pvalues(counts, column_totals, shares):
+    """
+    Двусторонний точный тест для ячеек с малым ожидаемым числом допродаж
+
+    При условии суммы колонки K число допродаж строки при нулевой гипотезе
+    распределено биномиально с вероятностью доли строки в знаменателе. p-значение -
+    сумма вероятностей всех исходов не вероятнее наблюдаемого (как в точном тесте Фишера).
+    Все ячейки считаются вместе блоками матрицы "ячейка x исход".
+    """
+    pvalues = np.empty(len(counts))
+    if not len(counts):
+        return pvalues
+
+    expected = column_totals * shares
+    limits = np.minimum(column_totals, np.ceil(np.maximum(counts, expected)) + EXACT_TAIL).astype(np.int64)
+    log_factorials = _log_factorials(int(column_totals.max()))
+    width = int(limits.max()) + 1
+    outcomes = np.arange(width)
+    block = max(1, EXACT_BLOCK // width)
+
+    for start in range(0, len(counts), block):
+        part = slice(start, start + block)
+        k = counts[part, None].astype(np.int64)
+        total = column_totals[part, None].astype(np.int64)
+        share = shares[part, None]
+        valid = outcomes[None, :] <= limits[part, None]
+        j = np.where(valid, outcomes[None, :], 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_share = np.log(share)
+            log_rest = np.log1p(-share)
+            log_pmf = (log_factorials[total] - log_factorials[j] - log_factorials[total - j]
+                       + np.where(j > 0, j * log_share, 0.0) + np.where(total - j > 0, (total - j) * log_rest, 0.0))
+            observed = (log_factorials[total] - log_factorials[k] - log_factorials[total - k]
+                        + np.where(k > 0, k * log_share, 0.0) + np.where(total - k > 0, (total - k) * log_rest, 0.0))
+        pmf = np.where(valid, np.exp(log_pmf), 0.0)
+        # Относительный допуск: равновероятные исходы не должны теряться из-за округления
+        pvalues[part] = np.where(log_pmf <= observed + 1e-7, pmf, 0.0).sum(axis=1)
+    return np.minimum(pvalues, 1.0)
+
+
+def rate_pvalues(counts, totals):
+    """
+    p-значения проверки, отличается ли частота строки от частоты остальных строк колонки
+
+    Число допродаж строки сравнивается с ожидаемым при одинаковой частоте во всех
+    строках (сумма колонки, умноженная на долю строки в сумме totals): критерий
+    хи-квадрат с одной степенью свободы, а при ожидаемом числе меньше MIN_EXPECTED
+    в строке или в остальных строках - точный тест.
+
+    Args:
+        counts (numpy.ndarray): Матрица счетчиков (строки x колонки)
+        totals (numpy.ndarray): Знаменатель каждой строки
+
+    Returns:
+        numpy.ndarray: p-значение каждой ячейки; NaN, если сравнивать не с чем
+            (одна строка, пустая колонка или totals == 0)
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    grand_total = totals.sum()
+    column_totals = np.broadcast_to(counts.sum(axis=0)[None, :], counts.shape)
+    shares = np.broadcast_to((totals / grand_total if grand_total > 0 else totals * 0)[:, None], counts.shape)
+
+    expected = column_totals * shares
+    rest_expected = column_totals - expected
+    testable = (column_totals > 0) & (shares > 0) & (shares < 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi_square = (counts - expected) ** 2 * column_totals / (expected * rest_expected)
+    pvalues = np.where(testable, _erfc(np.sqrt(np.where(testable, chi_square, 0.0) / 2)), np.nan)
+
+    exact = testable & ((expected < MIN_EXPECTED) | (rest_expected < MIN_EXPECTED))
+    pvalues[exact] = _exact_pvalues(counts[exact], column_totals[exact], shares[exact])
+    return pvalues
+
+
+def significance_columns(counts, totals, categories):
+    """
+    Колонки отчета со статистикой каждой ячейки для report_writer.write_table()
+
+    Для каждой категории: 95% доверительный интервал пуассоновской частоты (%), лифт относительно
+    базовой частоты и p-значение с флагом значимости на уровне SIGNIFICANCE_LEVEL.
+
+    Args:
+        counts (numpy.ndarray): Матрица счетчиков (строки x категории)
+        totals (sequence): Знаменатель каждой строки
+        categories (list): Названия категорий (колонок)
+
+    Returns:
+        tuple: (заголовки, колонки, число значимых ячеек, число проверенных ячеек)
+    """
+    totals = np.asarray(totals, dtype=np.float64)
+    low, high = poisson_score_interval(counts, totals[:, None])
+    lifts = lift(counts, totals)
+    pvalues = rate_pvalues(counts, totals)
+    significant = pvalues < SIGNIFICANCE_LEVEL
+
+    headers = []
+    columns = []
+    for i, category in enumerate(categories):
+        headers += [f'{category} (ДИ Пуассона 95%, от)', f'{category} (ДИ Пуассона 95%, до)',
+                    f'{category} (лифт)', f'{category} (p)', f'{category} (значимо)']
+        columns += [Numbers(low[:, i] * 100, '%.1f%%'), Numbers(high[:, i] * 100, '%.1f%%'),
+                    Numbers(lifts[:, i], '%.2f'), Numbers(pvalues[:, i], '%.3g'),
+                    ['да' if flag else 'нет' for flag in significant[:, i].tolist()]]
+    return headers, columns, int(significant.sum()), int(np.isfinite(pvalues).sum())
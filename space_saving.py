@@ -0,0 +1,59 @@
+import heapq
+
+
+class SpaceSaving:
+    """
+    Приближенный подсчет самых частых элементов в фиксированной памяти (алгоритм Space-Saving)
+
+    Хранится не более capacity счетчиков. Когда приходит новый элемент, а места нет,
+    он заменяет элемент с наименьшим счетчиком и получает его значение + 1; это
+    значение запоминается как погрешность. Для каждого отслеживаемого элемента
+    истинное количество лежит в [count - error, count], а погрешность любого
+    элемента не больше total / capacity. Каждый элемент, встретившийся больше
+    total / capacity раз, гарантированно отслеживается.
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): Сколько счетчиков хранить
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # Куча (счетчик, элемент) с одной записью на элемент; счетчик в записи может
+        # отставать от настоящего и обновляется, только когда запись доходит до вершины
+        self._heap = []
+
+    def add(self, item):
+        """Учитывает одно появление элемента"""
+        self.total += 1
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+            return
+
+        if len(counts) < self.capacity:
+            counts[item] = 1
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (1, item))
+            return
+
+        # Вытесняем элемент с наименьшим счетчиком
+        heap = self._heap
+        while True:
+            count, victim = heap[0]
+            if counts[victim] == count:
+                break
+            heapq.heapreplace(heap, (counts[victim], victim))
+
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = count + 1
+        self.errors[item] = count
+        heapq.heapreplace(heap, (count + 1, item))
+
+    def error_bound(self):
+        """Наибольшая возможная погрешность счетчика любого элемента"""
+        return self.total // self.capacity
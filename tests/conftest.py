@@ -0,0 +1,54 @@
+import csv
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+# Модули проекта лежат в корне репозитория
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from generate_orders import generate_orders  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def make_orders(tmp_path_factory):
+    """
+    Создает синтетический файл заказов в новом временном каталоге
+
+    С shuffle = True строки перемешиваются: строки одного заказа идут не подряд,
+    а номера заказов - не в порядке файла.
+    """
+    def make(rows, seed=1, shuffle=True, name='products.csv', **options):
+        path = tmp_path_factory.mktemp('orders') / name
+        generate_orders(str(path), rows, seed=seed, **options)
+        if shuffle:
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                header, *lines = list(csv.reader(csvfile))
+            random.Random(seed).shuffle(lines)
+            with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(header)
+                writer.writerows(lines)
+        return path
+    return make
+
+
+@pytest.fixture(scope='session')
+def run_script(tmp_path_factory):
+    """
+    Запускает скрипт проекта и возвращает каталог, в котором он выполнялся
+
+    Отчеты CSV скрипт пишет в текущий каталог, поэтому по умолчанию каждый запуск
+    идет в новом каталоге; cwd - запустить в уже существующем. Вывод последнего
+    запуска сохраняется в 'stdout.txt' этого каталога.
+    """
+    def run(script, *args, cwd=None):
+        directory = cwd or tmp_path_factory.mktemp('run')
+        with open(directory / 'stdout.txt', 'w', encoding='utf-8') as output:
+            subprocess.run([sys.executable, os.path.join(REPO, script), *map(str, args)], cwd=directory,
+                           check=True, stdout=output, env=dict(os.environ, PYTHONHASHSEED='0'))
+        return directory
+    return run
@@ -0,0 +1,21 @@
+import filecmp
+
+import pytest
+
+REPORTS = ['upsell_analysis.csv', 'category_analysis.csv', 'combo_analysis.csv', 'top_upsells_by_category.csv']
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_run_all_matches_standalone_scripts(make_orders, run_script, seed):
+    # Строки перемешаны: номера заказов идут не в порядке файла, и общий перебор
+    # (в порядке номеров - его требуют index и category) отличается от перебора комбинаций
+    path = make_orders(1000, seed, catalog_size=40)
+
+    combined = run_script('upsell_analysis.py', 'run', '--all', '--combo', 2, 3, '--input', path)
+    standalone = run_script('index.py', '--input', path)
+    run_script('category_analysis.py', '--input', path, cwd=standalone)
+    run_script('combo_analysis.py', 2, 3, '--input', path, cwd=standalone)
+    run_script('top_upsells_by_category.py', 10, '--input', path, cwd=standalone)
+
+    for report in REPORTS:
+        assert filecmp.cmp(combined / report, standalone / report, shallow=False), report
@@ -0,0 +1,31 @@
+from counters import FirstSeen
+
+
+def test_first_seen_order_of_new_codes():
+    first_seen = FirstSeen(3)
+    first_seen.see(2, 0)
+    first_seen.see(0, 0)
+    first_seen.see(1, 4)
+    first_seen.see(0, 7)
+    assert first_seen.order() == [2, 0, 1]
+    assert first_seen.get(0) == (0, 1)
+
+
+def test_first_seen_reseen_codes_get_new_sequence():
+    # Оба кода впервые в заказе 10, затем в более раннем заказе 3 - в обратном порядке
+    first_seen = FirstSeen(2)
+    first_seen.see(0, 10)
+    first_seen.see(1, 10)
+    first_seen.see(1, 3)
+    first_seen.see(0, 3)
+    assert first_seen.order() == [1, 0]
+    assert first_seen.get(1) != first_seen.get(0)
+
+
+def test_first_seen_later_position_does_not_move_code():
+    first_seen = FirstSeen(2)
+    first_seen.see(0, 5)
+    first_seen.see(1, 2)
+    first_seen.see(0, 9)
+    assert first_seen.order() == [1, 0]
+    assert first_seen.get(0) == (5, 0)
@@ -0,0 +1,29 @@
+import filecmp
+import os
+import shutil
+
+import pytest
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+@pytest.fixture
+def fixture_orders(tmp_path):
+    """Копия tests/data/products.csv (кэш разбора пишется рядом с файлом, а не в репозиторий)"""
+    path = tmp_path / 'products.csv'
+    shutil.copy(os.path.join(DATA, 'products.csv'), path)
+    return path
+
+
+@pytest.mark.parametrize('script, args', [
+    ('index.py', []),
+    ('index.py', ['--engine', 'vectorized']),
+    ('index.py', ['--stream']),
+    ('upsell_analysis.py', ['run', 'index']),
+])
+def test_upsell_report_matches_golden(fixture_orders, run_script, script, args):
+    # tests/data/upsell_analysis.csv совпадает с отчетом исходной analyze_upsells (pandas)
+    # по товарам, их порядку и числу допродаж; примеры - все уникальные допродажи товара
+    # (их не больше 5) в порядке первого появления
+    directory = run_script(script, *args, '--input', fixture_orders)
+    assert filecmp.cmp(directory / 'upsell_analysis.csv', os.path.join(DATA, 'upsell_analysis.csv'), shallow=False)
@@ -0,0 +1,134 @@
+import filecmp
+import gzip
+
+import pytest
+
+# Скрипт -> (аргументы анализа, отчет CSV)
+SCRIPTS = {
+    'index.py': ([], 'upsell_analysis.csv'),
+    'category_analysis.py': ([], 'category_analysis.csv'),
+    'combo_analysis.py': ([2], 'combo_analysis.csv'),
+    'top_upsells_by_category.py': ([10], 'top_upsells_by_category.csv'),
+}
+
+
+@pytest.fixture(scope='module')
+def shuffled_orders(make_orders):
+    """Общий файл: 10 тыс. строк вперемешку (больше одного блока при --memory-limit 1)"""
+    return make_orders(10000, seed=7, catalog_size=60)
+
+
+@pytest.fixture(scope='module')
+def sorted_orders(make_orders):
+    """Строки каждого заказа подряд, номера заказов по возрастанию (для --sorted)"""
+    return make_orders(10000, seed=8, shuffle=False, catalog_size=60)
+
+
+@pytest.fixture(scope='module')
+def reference(run_script):
+    """Каталог с отчетами обычного запуска скрипта на файле (один запуск на файл и скрипт)"""
+    runs = {}
+
+    def get(path, script):
+        if (path, script) not in runs:
+            args, _ = SCRIPTS[script]
+            runs[path, script] = run_script(script, *args, '--input', path, '--no-cache')
+        return runs[path, script]
+    return get
+
+
+def assert_same_report(directory, reference_directory, script):
+    report = SCRIPTS[script][1]
+    assert filecmp.cmp(directory / report, reference_directory / report, shallow=False), report
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_stream_matches_default(shuffled_orders, reference, run_script, script):
+    # Лимит 1 МБ - блоки по 4096 строк: внешняя сортировка через несколько временных файлов
+    args, _ = SCRIPTS[script]
+    directory = run_script(script, *args, '--input', shuffled_orders, '--stream', '--memory-limit', 1)
+    assert_same_report(directory, reference(shuffled_orders, script), script)
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_stream_sorted_matches_default(sorted_orders, reference, run_script, script):
+    args, _ = SCRIPTS[script]
+    directory = run_script(script, *args, '--input', sorted_orders, '--stream', '--sorted', '--memory-limit', 1)
+    assert_same_report(directory, reference(sorted_orders, script), script)
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_combo_workers_match_default(shuffled_orders, reference, run_script, workers):
+    directory = run_script('combo_analysis.py', 2, '--input', shuffled_orders, '--workers', workers)
+    assert_same_report(directory, reference(shuffled_orders, 'combo_analysis.py'), 'combo_analysis.py')
+
+
+@pytest.mark.parametrize('sizes', [[2], [2, 2], [3]])
+def test_combo_bitmask_engine_matches_default(shuffled_orders, run_script, sizes):
+    default = run_script('combo_analysis.py', *sizes, '--input', shuffled_orders, '--no-cache')
+    directory = run_script('combo_analysis.py', *sizes, '--input', shuffled_orders, '--engine', 'bitmask')
+    assert_same_report(directory, default, 'combo_analysis.py')
+
+
+def _split_lines(path, at, order_boundary):
+    """Строки файла, разделенные примерно на строке at (с order_boundary - на границе заказов)"""
+    lines = path.read_bytes().splitlines(keepends=True)
+    if order_boundary:
+        while lines[at].split(b',')[0] == lines[at - 1].split(b',')[0]:
+            at += 1
+    return lines[:at], lines[at:]
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+@pytest.mark.parametrize('kind, message', [
+    # Дописаны только новые заказы: считаются только они, агрегаты объединяются
+    ('append', 'обрабатываются'),
+    # Дописанные строки относятся и к старым заказам: полный пересчет
+    ('mixed', 'полный пересчет'),
+])
+def test_incremental_matches_default(shuffled_orders, sorted_orders, reference, run_script, tmp_path, script,
+                                     kind, message):
+    source = sorted_orders if kind == 'append' else shuffled_orders
+    head, tail = _split_lines(source, 6000, order_boundary=kind == 'append')
+    path = tmp_path / 'products.csv'
+    path.write_bytes(b''.join(head))
+
+    args, _ = SCRIPTS[script]
+    directory = run_script(script, *args, '--input', path, '--incremental')
+    with open(path, 'ab') as csvfile:
+        csvfile.write(b''.join(tail))
+    run_script(script, *args, '--input', path, '--incremental', cwd=directory)
+
+    assert f"Инкрементальный режим: {message}" in (directory / 'stdout.txt').read_text(encoding='utf-8')
+    assert_same_report(directory, reference(source, script), script)
+
+
+@pytest.fixture(scope='module')
+def split_orders(shuffled_orders, tmp_path_factory):
+    """Общий файл, разрезанный на три части с заголовком в каждой (две последние сжаты gzip)"""
+    directory = tmp_path_factory.mktemp('parts')
+    header, *lines = shuffled_orders.read_bytes().splitlines(keepends=True)
+    # Строки заказов перемешаны, поэтому почти каждый заказ оказывается в нескольких частях
+    parts = [lines[:3000], lines[3000:7000], lines[7000:]]
+    paths = [directory / 'part1.csv', directory / 'part2.csv.gz', directory / 'part3.csv.gz']
+    for path, part in zip(paths, parts):
+        data = header + b''.join(part)
+        path.write_bytes(gzip.compress(data) if path.suffix == '.gz' else data)
+    return paths
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+@pytest.mark.parametrize('inputs', ['directory', 'list', 'repeated', 'glob', 'stream'])
+def test_multiple_inputs_match_default(shuffled_orders, split_orders, reference, run_script, script, inputs):
+    # Несколько файлов читаются как один файл из их строк подряд
+    directory = split_orders[0].parent
+    paths = [str(path) for path in split_orders]
+    args = {
+        'directory': ['--input', directory],
+        'list': ['--input', ','.join(paths)],
+        'repeated': ['--input', paths[0], '--input', ','.join(paths[1:])],
+        'glob': ['--input', directory / 'part*'],
+        'stream': ['--input', directory, '--stream', '--memory-limit', 1],
+    }[inputs]
+    directory = run_script(script, *SCRIPTS[script][0], *args, '--no-cache')
+    assert_same_report(directory, reference(shuffled_orders, script), script)
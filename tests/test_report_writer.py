@@ -0,0 +1,47 @@
+import csv
+import random
+
+import numpy as np
+
+from report_writer import Numbers, Percentages, write_table
+
+
+def _write_rows(path, header, rows):
+    """Запись построчно через csv.writer - как отчеты писались до write_table"""
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+
+
+def test_write_table_matches_csv_writer(tmp_path):
+    rng = random.Random(1)
+    names = ['Кольє "Silver Горлиця", 40 см', 'a,b', 'строка\nс переводом', '', "апостроф ' и ;", 'plain']
+    counts = [rng.randrange(0, 1000) for _ in range(2000)]
+    totals = [rng.randrange(0, 1000) for _ in range(2000)]
+    products = [rng.choice(names) for _ in range(2000)]
+    ranks = np.arange(1, 2001)
+
+    # Доли раньше записывались как f"{round(доля, 1)}%", а при нулевом знаменателе - 0%
+    old_rows = [[product, int(rank), count, f"{round(count / total * 100, 1) if total > 0 else 0}%"]
+                for product, rank, count, total in zip(products, ranks, counts, totals)]
+    _write_rows(tmp_path / 'old.csv', ['Товар', 'Ранг', 'Количество', 'Доля (%)'], old_rows)
+
+    write_table(str(tmp_path / 'new.csv'), ['Товар', 'Ранг', 'Количество', 'Доля (%)'],
+                [products, ranks, counts, Percentages(counts, totals)])
+
+    assert (tmp_path / 'new.csv').read_bytes() == (tmp_path / 'old.csv').read_bytes()
+
+
+def test_percentages_round_like_round():
+    # Значения на границе округления (x.x5) проверяются вместе со случайными
+    counts = list(range(0, 2001)) + [1, 3, 7, 15, 45, 105]
+    totals = [2000] * 2001 + [8, 16, 32, 64, 400, 1000]
+    expected = [f"{round(count / total * 100, 1)}%" for count, total in zip(counts, totals)]
+    assert Percentages(counts, totals).text() == expected
+    assert Percentages([0, 5], 0).text() == ['0%', '0%']
+
+
+def test_numbers_format_and_missing_values():
+    assert Numbers([1.234, float('nan'), 2], '%.2f').text() == ['1.23', '', '2.00']
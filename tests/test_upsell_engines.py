@@ -0,0 +1,28 @@
+import pytest
+
+from index import count_upsells
+from order_loader import load_orders
+
+
+@pytest.mark.parametrize('seed, options', [
+    (1, {}),
+    # Маленький каталог: одни и те же допродажи повторяются в разных заказах
+    (2, {'catalog_size': 20, 'upsell_rate': 0.6}),
+    # Много упаковки: заказы, где допродажи есть только среди упаковки
+    (3, {'catalog_size': 50, 'packaging_rate': 0.5, 'items_per_order': 5}),
+])
+def test_vectorized_engine_matches_loop(make_orders, seed, options):
+    path = make_orders(5000, seed, **options)
+    store = load_orders(str(path), use_cache=False)
+
+    loop = count_upsells(store, 'loop')
+    vectorized = count_upsells(store, 'vectorized')
+
+    assert vectorized['total_orders'] == loop['total_orders']
+    assert vectorized['orders_with_upsells'] == loop['orders_with_upsells']
+    assert vectorized['upsell_stats'] == loop['upsell_stats']
+    assert list(vectorized['upsell_stats']) == list(loop['upsell_stats'])
+    assert loop['orders_with_upsells'] > 0
+    # Примеры в отчете - первые уникальные допродажи, поэтому важен и их порядок
+    assert vectorized['detailed_stats'] == loop['detailed_stats']
+    assert all(list(examples) == list(dict.fromkeys(examples)) for examples in loop['detailed_stats'].values())
@@ -1,147 +1,318 @@
-import csv
+import heapq
 import sys
-from collections import defaultdict
+from array import array
 
-def get_product_category(product_name):
-    """Определяет категорию товара по его названию"""
-    if 'Кольє' in product_name:
-        return 'Колье'
-    elif 'Сережки' in product_name:
-        return 'Серьги'
-    elif 'Браслет' in product_name:
-        return 'Браслет'
-    elif 'Каблучка' in product_name:
-        return 'Кольцо'
-    elif 'Кафф' in product_name:
-        return 'Кафф'
-    elif 'Анклет' in product_name:
-        return 'Анклет'
-    elif 'Чокер' in product_name:
-        return 'Чокер'
-    else:
-        return 'Другое'
+from analysis_runner import run_analyzers
+from counters import FirstSeen
+from incremental import update_incremental
+from instrumentation import phase
+from input_options import default_options, open_orders, pop_input_options, report_memory
+from order_loader import load_orders
+from report_writer import Percentages, write_table
+from space_saving import SpaceSaving
 
-def analyze_top_upsells_by_category(top_n=10):
+class TopUpsellCounter:
     """
-    Анализирует топ допродаваемых товаров по категориям
-    
-    Args:
-        top_n (int): Количество топ товаров для показа в каждой категории (по умолчанию 10)
+    Подсчет допродаж товаров по категориям по одному заказу за раз
+
+    Счетчики хранятся в массиве array('q') по коду товара, названия и категории
+    подставляются только в result(). Заказы можно передавать в любом порядке: для
+    товаров запоминается (позиция заказа, порядковый номер) первого появления
+    (counters.FirstSeen), и result() восстанавливает порядок ключей, как при переборе
+    в порядке появления в файле.
+
+    С capacity товары каждой категории считаются приближенно (Space-Saving):
+    хранится не более capacity счетчиков на категорию независимо от размера каталога.
     """
-    # Читаем CSV файл
-    orders = {}
-    with open('products.csv', 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            order_id = row['№ заказа']
-            if order_id not in orders:
-                orders[order_id] = []
-            orders[order_id].append(row)
-    
-    # Словари для статистики
-    category_upsells = defaultdict(lambda: defaultdict(int))  # category -> {product: count}
-    total_category_upsells = defaultdict(int)  # category -> total_count
-    total_orders_with_upsells = 0
     
-    print("Анализирую топ допродаваемых товаров по категориям...")
-    print(f"Загружено {len(orders)} заказов")
+    sort_keys = False
     
-    # Анализируем каждый заказ
-    for order_id, order_data in orders.items():
-        # Разделяем товары на основные и допродажи
-        main_products = []
-        upsells = []
+    def __init__(self, store, capacity=None):
+        """
+        Args:
+            store (OrderStore): Загруженные заказы
+            capacity (int): Сколько счетчиков товаров хранить в каждой категории
+                (None - точный подсчет всех товаров)
+        """
+        self.capacity = capacity
+        self.names = store.product_names
+        self.packaging = store.product_is_packaging.tolist()
+        self.categories = store.product_categories.tolist()
+        self.category_names = store.category_names
+        self.total_orders = store.num_orders
+        self.total_orders_with_upsells = 0
         
-        for item in order_data:
-            doprodazha = item.get('Допродажа', '')
-            if doprodazha == 'Допродажа':
-                upsells.append(item)
-            else:
-                main_products.append(item)
+        if capacity:
+            # Код категории -> приближенные счетчики кодов товаров, и первое появление категорий
+            self.category_upsells = [SpaceSaving(capacity) for _ in self.category_names]
+            self.total_category_upsells = array('q', bytes(8 * len(self.category_names)))
+            self.first_seen = FirstSeen(len(self.category_names))
+        else:
+            # Количество допродаж и первое появление каждого товара (по коду товара)
+            self.upsell_counts = array('q', bytes(8 * len(self.names)))
+            self.first_seen = FirstSeen(len(self.names))
+        self._sequence = 0
+    
+    def add(self, order_id, position, main_products, upsells):
+        """Учитывает один заказ"""
+        packaging = self.packaging
+        first_positions = self.first_seen.positions
         
         # Если есть допродажи в заказе
         if upsells:
-            has_main_products = False
-            
             # Проверяем, есть ли основные товары (исключая упаковку)
-            for main_product in main_products:
-                main_product_name = main_product['Товары']
-                if not ('Коробка' in main_product_name or 'Пакет' in main_product_name):
-                    has_main_products = True
-                    break
+            has_main_products = not all(packaging[product] for product in main_products)
             
             # Если есть основные товары, считаем допродажи
             if has_main_products:
-                total_orders_with_upsells += 1
+                self.total_orders_with_upsells += 1
                 
                 for upsell_product in upsells:
-                    upsell_name = upsell_product['Товары']
-                    
                     # Пропускаем упаковку в допродажах
-                    if 'Коробка' in upsell_name or 'Пакет' in upsell_name:
+                    if packaging[upsell_product]:
                         continue
                     
-                    upsell_category = get_product_category(upsell_name)
-                    category_upsells[upsell_category][upsell_name] += 1
-                    total_category_upsells[upsell_category] += 1
+                    key = self.categories[upsell_product] if self.capacity else upsell_product
+                    seen = first_positions[key]
+                    if seen < 0 or position < seen:
+                        first_positions[key] = position
+                        self.first_seen.sequence[key] = self._sequence
+                        self._sequence += 1
+                    
+                    if self.capacity:
+                        self.category_upsells[key].add(upsell_product)
+                        self.total_category_upsells[key] += 1
+                    else:
+                        self.upsell_counts[upsell_product] += 1
     
-    # Создаем результирующий CSV
-    with open('top_upsells_by_category.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        
-        # Записываем заголовки
-        headers = ['Категория', 'Ранг', 'Товар', 'Количество допродаж', 'Доля в категории (%)', 'Доля от всех допродаж (%)']
-        writer.writerow(headers)
+    def result(self):
+        """Агрегаты в виде count_top_upsells()"""
+        if self.capacity:
+            return self._approximate_result()
         
-        # Подсчитываем общее количество допродаж
-        total_all_upsells = sum(total_category_upsells.values())
+        names = self.names
+        category_names = self.category_names
         
-        # Сортируем категории по общему количеству допродаж
-        sorted_categories = sorted(total_category_upsells.items(), key=lambda x: x[1], reverse=True)
+        # Категории и товары в порядке первого появления; разные коды с одним
+        # названием (варианты артикулов) объединяются
+        products = self.first_seen.order()
+        category_upsells = {}
+        total_category_upsells = {}
+        for product in products:
+            category = category_names[self.categories[product]]
+            count = self.upsell_counts[product]
+            category_products = category_upsells.setdefault(category, {})
+            category_products[names[product]] = category_products.get(names[product], 0) + count
+            total_category_upsells[category] = total_category_upsells.get(category, 0) + count
         
-        print(f"\nОбщая статистика:")
-        print(f"Заказов с допродажами: {total_orders_with_upsells}")
-        print(f"Всего допродаж: {total_all_upsells}")
+        return {
+            'total_orders': self.total_orders,
+            'total_orders_with_upsells': self.total_orders_with_upsells,
+            'category_upsells': category_upsells,
+            'total_category_upsells': total_category_upsells,
+        }
+    
+    def _approximate_result(self):
+        """Приближенные агрегаты: счетчики и их погрешности по категориям"""
+        names = self.names
+        category_upsells = {}
+        upsell_errors = {}
+        error_bounds = {}
+        total_category_upsells = {}
+        for code in self.first_seen.order():
+            category = self.category_names[code]
+            summary = self.category_upsells[code]
+            counts = category_upsells[category] = {}
+            errors = upsell_errors[category] = {}
+            for product, count in summary.counts.items():
+                counts[names[product]] = counts.get(names[product], 0) + count
+                errors[names[product]] = errors.get(names[product], 0) + summary.errors[product]
+            total_category_upsells[category] = self.total_category_upsells[code]
+            error_bounds[category] = summary.error_bound()
         
-        # Для каждой категории выводим топ товаров
-        for category, total_count in sorted_categories:
+        return {
+            'total_orders': self.total_orders,
+            'total_orders_with_upsells': self.total_orders_with_upsells,
+            'category_upsells': category_upsells,
+            'total_category_upsells': total_category_upsells,
+            'upsell_errors': upsell_errors,
+            'error_bounds': error_bounds,
+            'capacity': self.capacity,
+        }
+
+def count_top_upsells(store, capacity=None):
+    """
+    Подсчитывает агрегаты анализа топ допродаж по категориям
+    
+    Args:
+        store (OrderStore): Загруженные заказы
+        capacity (int): Сколько счетчиков товаров хранить в каждой категории
+            (None - точный подсчет всех товаров)
+    
+    Returns:
+        dict: Всего заказов, заказов с допродажами, число допродаж каждого товара
+            по категориям и общее число допродаж в каждой категории; в приближенном
+            режиме также погрешности счетчиков ('upsell_errors'), наибольшая возможная
+            погрешность в каждой категории ('error_bounds') и 'capacity'
+    """
+    return run_analyzers(store, [TopUpsellCounter(store, capacity)])[0]
+
+def merge_top_upsells(old, new):
+    """Объединяет агрегаты двух частей файла (новая часть идет после старой)"""
+    category_upsells = {category: dict(products) for category, products in old['category_upsells'].items()}
+    for category, products in new['category_upsells'].items():
+        merged = category_upsells.setdefault(category, {})
+        for product_name, count in products.items():
+            merged[product_name] = merged.get(product_name, 0) + count
+    
+    total_category_upsells = dict(old['total_category_upsells'])
+    for category, count in new['total_category_upsells'].items():
+        total_category_upsells[category] = total_category_upsells.get(category, 0) + count
+    
+    return {
+        'total_orders': old['total_orders'] + new['total_orders'],
+        'total_orders_with_upsells': old['total_orders_with_upsells'] + new['total_orders_with_upsells'],
+        'category_upsells': category_upsells,
+        'total_category_upsells': total_category_upsells,
+    }
+
+def write_top_upsells_report(stats, top_n=10):
+    """
+    Выводит итоги в консоль и сохраняет 'top_upsells_by_category.csv'
+    
+    Топ товаров каждой категории выбирается кучей (heapq.nlargest) без полной сортировки.
+    Для приближенных агрегатов в CSV добавляется колонка с погрешностью: истинное
+    количество допродаж товара не больше указанного и не меньше его минус погрешность.
+    """
+    category_upsells = stats['category_upsells']
+    total_category_upsells = stats['total_category_upsells']
+    total_orders_with_upsells = stats['total_orders_with_upsells']
+    upsell_errors = stats.get('upsell_errors')
+    
+    print(f"Загружено {stats['total_orders']} заказов")
+    if upsell_errors is not None:
+        print(f"Приближенный подсчет: не более {stats['capacity']} счетчиков товаров на категорию")
+    
+    # Подсчитываем общее количество допродаж
+    total_all_upsells = sum(total_category_upsells.values())
+    
+    # Сортируем категории по общему количеству допродаж
+    sorted_categories = sorted(total_category_upsells.items(), key=lambda x: x[1], reverse=True)
+    
+    print(f"\nОбщая статистика:")
+    print(f"Заказов с допродажами: {total_orders_with_upsells}")
+    print(f"Всего допродаж: {total_all_upsells}")
+    
+    # Колонки CSV: строки всех категорий подряд
+    columns = {'category': [], 'rank': [], 'product': [], 'count': [], 'category_total': [], 'error': []}
+    
+    # Для каждой категории выводим топ товаров
+    for category, total_count in sorted_categories:
+        if upsell_errors is not None:
+            print(f"\n📦 Категория: {category} (всего допродаж: {total_count}, "
+                  f"погрешность любого счетчика не более {stats['error_bounds'][category]})")
+        else:
             print(f"\n📦 Категория: {category} (всего допродаж: {total_count})")
+        
+        # Выбираем топ N товаров по количеству допродаж (при равенстве - в порядке появления)
+        products = category_upsells[category]
+        top_products = heapq.nlargest(top_n, products.items(), key=lambda x: x[1])
+        
+        for rank, (product_name, count) in enumerate(top_products, 1):
+            columns['category'].append(category)
+            columns['rank'].append(rank)
+            columns['product'].append(product_name)
+            columns['count'].append(count)
+            columns['category_total'].append(total_count)
+            if upsell_errors is not None:
+                columns['error'].append(upsell_errors[category][product_name])
             
-            # Сортируем товары в категории по количеству допродаж
-            sorted_products = sorted(category_upsells[category].items(), key=lambda x: x[1], reverse=True)
-            
-            # Выводим топ N товаров
-            for rank, (product_name, count) in enumerate(sorted_products[:top_n], 1):
+            # Выводим в консоль (только топ-5 для читаемости)
+            if rank <= 5:
                 category_percentage = round((count / total_count) * 100, 1) if total_count > 0 else 0
-                total_percentage = round((count / total_all_upsells) * 100, 1) if total_all_upsells > 0 else 0
-                
-                # Записываем в CSV
-                writer.writerow([category, rank, product_name, count, f"{category_percentage}%", f"{total_percentage}%"])
-                
-                # Выводим в консоль (только топ-5 для читаемости)
-                if rank <= 5:
-                    print(f"  {rank}. {product_name}: {count} допродаж ({category_percentage}% в категории)")
-            
-            # Если товаров больше 5, показываем это
-            if len(sorted_products) > 5:
-                print(f"  ... и ещё {len(sorted_products) - 5} товаров")
+                error = f", погрешность до {upsell_errors[category][product_name]}" if upsell_errors is not None else ""
+                print(f"  {rank}. {product_name}: {count} допродаж ({category_percentage}% в категории{error})")
+        
+        # Если товаров больше 5, показываем это
+        if len(products) > 5:
+            tracked = " отслеживаемых" if upsell_errors is not None else ""
+            print(f"  ... и ещё {len(products) - 5}{tracked} товаров")
+    
+    # Создаем результирующий CSV
+    headers = ['Категория', 'Ранг', 'Товар', 'Количество допродаж', 'Доля в категории (%)', 'Доля от всех допродаж (%)']
+    table = [columns['category'], columns['rank'], columns['product'], columns['count'],
+             Percentages(columns['count'], columns['category_total']),
+             Percentages(columns['count'], total_all_upsells)]
+    if upsell_errors is not None:
+        headers.append('Погрешность (не более)')
+        table.append(columns['error'])
+    write_table('top_upsells_by_category.csv', headers, table)
     
     # Выводим общую статистику по категориям
     print(f"\n📊 Рейтинг категорий по количеству допродаж:")
     for rank, (category, count) in enumerate(sorted_categories, 1):
         percentage = round((count / total_all_upsells) * 100, 1) if total_all_upsells > 0 else 0
         unique_products = len(category_upsells[category])
-        print(f"  {rank}. {category}: {count} допродаж ({percentage}%, {unique_products} уникальных товаров)")
+        if upsell_errors is not None:
+            print(f"  {rank}. {category}: {count} допродаж ({percentage}%, {unique_products} отслеживаемых товаров)")
+        else:
+            print(f"  {rank}. {category}: {count} допродаж ({percentage}%, {unique_products} уникальных товаров)")
     
     print(f"\nРезультаты сохранены в файл 'top_upsells_by_category.csv'")
 
+def analyze_top_upsells_by_category(top_n=10, store=None, incremental=False, capacity=None, options=None):
+    """
+    Анализирует топ допродаваемых товаров по категориям
+    
+    Args:
+        top_n (int): Количество топ товаров для показа в каждой категории (по умолчанию 10)
+        store (OrderStore): Загруженные заказы (по умолчанию читается 'products.csv')
+        incremental (bool): Обработать только строки, дописанные в 'products.csv'
+            с прошлого запуска, и объединить их с сохраненными агрегатами
+        capacity (int): Приближенный подсчет с не более чем capacity счетчиками товаров
+            на категорию (по умолчанию точный подсчет)
+        options (dict): Параметры чтения заказов (файл для инкрементального режима)
+    """
+    print("Анализирую топ допродаваемых товаров по категориям...")
+    
+    if incremental:
+        stats = update_incremental('top_upsells_by_category', count_top_upsells, merge_top_upsells,
+                                   path=(options or default_options())['path'])
+    else:
+        # Читаем CSV файл
+        if store is None:
+            store = load_orders()
+        stats = count_top_upsells(store, capacity)
+    
+    with phase('write'):
+        write_top_upsells_report(stats, top_n)
+
 if __name__ == "__main__":
     # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
     top_n = 10
+    capacity = None
     
-    if len(sys.argv) > 1:
+    if '--approx' in args:
+        index = args.index('--approx')
         try:
-            top_n = int(sys.argv[1])
+            capacity = int(args[index + 1])
+        except (IndexError, ValueError):
+            print("Ошибка: после --approx должно идти число (счетчиков товаров на категорию)")
+            sys.exit(1)
+        if capacity < 1:
+            print("Ошибка: количество счетчиков должно быть больше 0")
+            sys.exit(1)
+        del args[index:index + 2]
+    
+    # Сохраненные агрегаты инкрементального режима точные
+    if capacity and options['incremental']:
+        print("Ошибка: --approx нельзя использовать вместе с --incremental")
+        sys.exit(1)
+    
+    if len(args) > 0:
+        try:
+            top_n = int(args[0])
             if top_n < 1:
                 print("Ошибка: количество товаров должно быть больше 0")
                 sys.exit(1)
@@ -149,5 +320,13 @@ if __name__ == "__main__":
             print("Ошибка: аргумент должен быть числом (количество топ товаров в каждой категории)")
             sys.exit(1)
     
+    if capacity and capacity < top_n:
+        print("Ошибка: счетчиков на категорию (--approx) должно быть не меньше количества топ товаров")
+        sys.exit(1)
+    
     print(f"Анализируются топ-{top_n} товаров в каждой категории")
-    analyze_top_upsells_by_category(top_n)
+    if options['incremental']:
+        analyze_top_upsells_by_category(top_n, incremental=True, options=options)
+    else:
+        analyze_top_upsells_by_category(top_n, store=open_orders(options), capacity=capacity)
+    report_memory(options)
@@ -0,0 +1,176 @@
+import sys
+
+from analysis_runner import run_analyzers
+from category_analysis import CategoryCounter, write_category_report
+from combo_analysis import ComboCounter, filter_min_support, write_combo_report
+from index import UpsellCounter, write_upsell_report
+from instrumentation import phase
+from input_options import open_orders, pop_input_options, report_memory
+from top_upsells_by_category import TopUpsellCounter, write_top_upsells_report
+
+# Анализы в порядке запуска: имя -> заголовок
+ANALYSES = {
+    'index': 'Анализ допродаж по товарам',
+    'category': 'Анализ допродаж по категориям',
+    'combo': 'Анализ комбинаций категорий',
+    'top': 'Топ допродаваемых товаров по категориям',
+}
+
+USAGE = ("Использование: python upsell_analysis.py run (--all | index category combo top) "
+         "[--combo МИН [МАКС]] [--top N] [--min-support N] [--significance] [--input ФАЙЛЫ] [--read-workers N] "
+         "[--stream [--sorted] [--memory-limit МБ]] [--no-cache] [--by-article [--catalog ФАЙЛ]] "
+         "[--verbose] [--progress] [--timings ФАЙЛ] [--profile] [--parquet]")
+
+
+def count_all(store, selected=tuple(ANALYSES), min_combo_size=2, max_combo_size=None, verbose=False):
+    """
+    Подсчитывает агрегаты выбранных анализов за один перебор заказов
+
+    Args:
+        store (OrderStore): Загруженные заказы (или OrderStream)
+        selected (tuple): Имена анализов из ANALYSES (по умолчанию все)
+        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
+        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+        verbose (bool): Выводить строку на каждый основной товар заказа с допродажами
+
+    Returns:
+        dict: Имя анализа -> агрегаты (как у count_*() соответствующего скрипта,
+            у комбинаций - без общего числа заказов)
+    """
+    packaging = store.product_is_packaging.tolist()
+    categories = [store.category_names[code] for code in store.product_categories]
+    counters = {
+        'index': lambda: UpsellCounter(store, verbose),
+        'category': lambda: CategoryCounter(store),
+        'combo': lambda: ComboCounter(packaging, categories, min_combo_size, max_combo_size),
+        'top': lambda: TopUpsellCounter(store),
+    }
+    names = [name for name in ANALYSES if name in selected]
+    return dict(zip(names, run_analyzers(store, [counters[name]() for name in names])))
+
+
+def run_all(store, selected=tuple(ANALYSES), min_combo_size=2, max_combo_size=None, top_n=10, verbose=False,
+            min_support=1, significance=False):
+    """
+    Выполняет выбранные анализы за один перебор заказов и сохраняет их CSV файлы
+
+    Args:
+        store (OrderStore): Загруженные заказы (или OrderStream)
+        selected (tuple): Имена анализов из ANALYSES (по умолчанию все)
+        min_combo_size (int): Минимальный размер комбинации (по умолчанию 2)
+        max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+        top_n (int): Количество топ товаров в каждой категории (по умолчанию 10)
+        verbose (bool): Выводить строку на каждый основной товар заказа с допродажами
+        min_support (int): Минимальное число заказов с комбинацией категорий в отчете
+        significance (bool): Добавить в отчеты по категориям и комбинациям доверительные
+            интервалы, лифт и значимость
+    """
+    names = [name for name in ANALYSES if name in selected]
+
+    print(f"Анализирую заказы: {', '.join(names)}...")
+    results = count_all(store, names, min_combo_size, max_combo_size, verbose)
+
+    for name in names:
+        print(f"\n=== {ANALYSES[name]} ===")
+        stats = results[name]
+        with phase('write'):
+            if name == 'index':
+                write_upsell_report(stats)
+            elif name == 'category':
+                write_category_report(stats, significance)
+            elif name == 'combo':
+                stats = filter_min_support(dict(stats, total_orders=store.num_orders), min_support)
+                write_combo_report(stats, significance)
+            else:
+                write_top_upsells_report(stats, top_n)
+
+
+def _parse_run_args(args):
+    """
+    Разбирает аргументы команды run
+
+    Returns:
+        tuple: (выбранные анализы, мин. и макс. размер комбинации, top_n,
+            минимум заказов с комбинацией, добавлять ли статистическую значимость)
+    """
+    selected = []
+    min_size = 2
+    max_size = None
+    top_n = 10
+    min_support = 1
+    significance = False
+
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == '--all':
+            selected.extend(ANALYSES)
+        elif arg in ANALYSES:
+            selected.append(arg)
+        elif arg == '--combo':
+            try:
+                min_size = int(args.pop(0))
+                if args and args[0].isdigit():
+                    max_size = int(args.pop(0))
+            except (IndexError, ValueError):
+                print("Ошибка: после --combo должен идти минимальный (и, если нужно, максимальный) размер комбинации")
+                sys.exit(1)
+        elif arg == '--top':
+            try:
+                top_n = int(args.pop(0))
+            except (IndexError, ValueError):
+                print("Ошибка: после --top должно идти число (количество топ товаров в каждой категории)")
+                sys.exit(1)
+        elif arg == '--min-support':
+            try:
+                min_support = int(args.pop(0))
+            except (IndexError, ValueError):
+                print("Ошибка: после --min-support должно идти число (минимум заказов с комбинацией)")
+                sys.exit(1)
+        elif arg == '--significance':
+            significance = True
+        else:
+            print(f"Ошибка: неизвестный аргумент '{arg}'")
+            print(USAGE)
+            sys.exit(1)
+
+    if not selected:
+        print("Ошибка: укажите --all или хотя бы один анализ")
+        print(USAGE)
+        sys.exit(1)
+
+    if min_size < 2:
+        print("Ошибка: минимальный размер комбинации должен быть не менее 2")
+        sys.exit(1)
+
+    if max_size and max_size < min_size:
+        print("Ошибка: максимальный размер не может быть меньше минимального")
+        sys.exit(1)
+
+    if top_n < 1:
+        print("Ошибка: количество товаров должно быть больше 0")
+        sys.exit(1)
+
+    if min_support < 1:
+        print("Ошибка: минимум заказов с комбинацией должен быть больше 0")
+        sys.exit(1)
+
+    return selected, min_size, max_size, top_n, min_support, significance
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    if len(sys.argv) < 2 or sys.argv[1] != 'run':
+        print(USAGE)
+        sys.exit(1)
+
+    options, args = pop_input_options(sys.argv[2:])
+
+    # Агрегаты инкрементального режима хранятся отдельно для каждого анализа
+    if options['incremental']:
+        print("Ошибка: --incremental поддерживается только в отдельных скриптах анализа")
+        sys.exit(1)
+
+    selected, min_size, max_size, top_n, min_support, significance = _parse_run_args(args)
+    run_all(open_orders(options), selected, min_size, max_size, top_n, options['verbose'], min_support, significance)
+    report_memory(options)
@@ -0,0 +1,436 @@
+import asyncio
+import heapq
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from input_files import describe_inputs, resolve_inputs
+from index import upsell_examples
+from input_options import pop_input_options, read_orders
+from upsell_analysis import count_all
+
+# Адрес сервера по умолчанию (только локальные подключения)
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Как часто проверять, изменился ли файл заказов (секунд)
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+# Текст статусов HTTP, которые возвращает сервер
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+USAGE = ("Использование: python upsell_server.py [--host АДРЕС] [--port ПОРТ | --socket ПУТЬ] "
+         "[--max-combo-size N] [--reload-interval СЕКУНД] [--stream [--sorted] [--memory-limit МБ]] "
+         "[--no-cache] [--by-article] [--catalog ФАЙЛ]")
+
+
+class QueryError(Exception):
+    """Некорректный запрос: текст ошибки и HTTP статус ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def input_signature(options):
+    """
+    Файлы заказов с размером и временем изменения: по ним определяется, что заказы нужно перечитать
+
+    Каталоги и шаблоны из --input раскрываются заново, поэтому новый файл
+    (например, очередная ежедневная выгрузка) тоже вызывает перезагрузку.
+
+    Returns:
+        tuple: (пути к файлам, размер и время изменения каждого файла)
+    """
+    paths = resolve_inputs(options['inputs']) if options['inputs'] is not None else [options['path']]
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(paths), tuple(signature)
+
+
+def _utf8(text):
+    """
+    Текст из строки запроса в UTF-8
+
+    Строка запроса декодируется и раскодируется из %XX как latin-1 (байт в байт),
+    поэтому и %D0%9A, и неэкранированные байты UTF-8 дают одни и те же байты.
+    """
+    return text.encode('latin-1').decode('utf-8', errors='replace')
+
+
+def _percent(count, total):
+    """Доля в процентах с тем же округлением, что и в CSV отчетах"""
+    return round(count / total * 100, 1) if total > 0 else 0
+
+
+def _int_param(params, name, default, minimum=1):
+    """Целочисленный параметр запроса"""
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise QueryError(f"параметр '{name}' должен быть числом")
+    if value < minimum:
+        raise QueryError(f"параметр '{name}' должен быть не меньше {minimum}")
+    return value
+
+
+def _str_param(params, name):
+    """Строковый параметр запроса (None, если не задан)"""
+    values = params.get(name)
+    return values[-1] if values else None
+
+
+class ReportSnapshot:
+    """
+    Агрегаты четырех анализов по одной версии файла заказов
+
+    Снимок не изменяется после создания: при перезагрузке файла сервер строит
+    новый снимок и заменяет ссылку, поэтому запросы не ждут пересчета.
+    """
+
+    def __init__(self, stats, total_orders, signature, max_combo_size, load_seconds):
+        """
+        Args:
+            stats (dict): Результат count_all() по всем анализам
+            total_orders (int): Всего заказов
+            signature (tuple): input_signature() файлов, по которым посчитаны агрегаты
+            max_combo_size (int): Максимальный посчитанный размер комбинации (None - все)
+            load_seconds (float): Время загрузки и подсчета (секунд)
+        """
+        self.stats = stats
+        self.total_orders = total_orders
+        self.signature = signature
+        self.max_combo_size = max_combo_size
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+        # Сортировки, не зависящие от параметров запроса, делаются один раз:
+        # по убыванию количества, при равенстве - в порядке первого появления
+        self.sorted_upsells = sorted(stats['index']['upsell_stats'].items(), key=lambda item: item[1], reverse=True)
+        self.sorted_combos = sorted(stats['combo']['combo_counts'].items(), key=lambda item: item[1], reverse=True)
+        self.sorted_categories = sorted(stats['top']['total_category_upsells'].items(),
+                                        key=lambda item: item[1], reverse=True)
+
+    def upsells(self, params):
+        """Товары, к которым чаще всего добавляют допродажи: ?top=N"""
+        top = _int_param(params, 'top', 10)
+        stats = self.stats['index']
+        detailed_stats = stats['detailed_stats']
+        return {
+            'total_orders': stats['total_orders'],
+            'orders_with_upsells': stats['orders_with_upsells'],
+            'products': [
+                {'product': product, 'upsells': count, 'examples': upsell_examples(detailed_stats[product])}
+                for product, count in self.sorted_upsells[:top]
+            ],
+        }
+
+    def categories(self, params):
+        """Продажи основных категорий и доля допродаж каждой категории: ?category=НАЗВАНИЕ"""
+        stats = self.stats['category']
+        main_category_counts = stats['main_category_counts']
+        category_stats = stats['category_stats']
+
+        selected = _str_param(params, 'category')
+        if selected is not None and selected not in main_category_counts:
+            raise QueryError(f"категория '{selected}' не найдена", 404)
+
+        categories = []
+        for category in sorted(main_category_counts):
+            if selected is not None and category != selected:
+                continue
+            sales = main_category_counts[category]
+            upsell_stats = sorted(category_stats.get(category, {}).items(), key=lambda item: item[1], reverse=True)
+            categories.append({
+                'category': category,
+                'sales': sales,
+                'upsells': [{'category': upsell_category, 'count': count, 'percent': _percent(count, sales)}
+                            for upsell_category, count in upsell_stats],
+            })
+        return {'categories': categories}
+
+    def combos(self, params):
+        """Комбинации категорий заданных размеров: ?min=2&max=3&top=N&category=НАЗВАНИЕ"""
+        min_size = _int_param(params, 'min', 2, minimum=2)
+        max_size = _int_param(params, 'max', None, minimum=min_size)
+        top = _int_param(params, 'top', 10)
+        category = _str_param(params, 'category')
+
+        # Комбинации каждого размера считаются независимо, поэтому диапазон - это фильтр по размеру
+        if self.max_combo_size and (max_size is None or max_size > self.max_combo_size):
+            raise QueryError(f"сервер считает комбинации не больше {self.max_combo_size} категорий")
+
+        combo_stats = self.stats['combo']['combo_stats']
+        found = 0
+        combos = []
+        for combo, count in self.sorted_combos:
+            if len(combo) < min_size or (max_size and len(combo) > max_size):
+                continue
+            if category is not None and category not in combo:
+                continue
+            found += 1
+            if len(combos) < top:
+                upsell_stats = sorted(combo_stats.get(combo, {}).items(), key=lambda item: item[1], reverse=True)
+                combos.append({
+                    'categories': list(combo),
+                    'orders': count,
+                    'upsells': [{'category': upsell_category, 'count': upsell_count,
+                                 'percent': _percent(upsell_count, count)}
+                                for upsell_category, upsell_count in upsell_stats],
+                })
+        return {'total_orders': self.total_orders, 'found': found, 'combos': combos}
+
+    def top(self, params):
+        """Топ допродаваемых товаров по категориям: ?category=НАЗВАНИЕ&n=N"""
+        top_n = _int_param(params, 'n', 10)
+        selected = _str_param(params, 'category')
+        stats = self.stats['top']
+        category_upsells = stats['category_upsells']
+        total_category_upsells = stats['total_category_upsells']
+        total_all_upsells = sum(total_category_upsells.values())
+
+        if selected is not None and selected not in category_upsells:
+            raise QueryError(f"в категории '{selected}' нет допродаж", 404)
+
+        categories = []
+        for category, total_count in self.sorted_categories:
+            if selected is not None and category != selected:
+                continue
+            # При равенстве - в порядке появления, как в CSV отчете
+            top_products = heapq.nlargest(top_n, category_upsells[category].items(), key=lambda item: item[1])
+            categories.append({
+                'category': category,
+                'upsells': total_count,
+                'percent': _percent(total_count, total_all_upsells),
+                'unique_products': len(category_upsells[category]),
+                'products': [
+                    {'rank': rank, 'product': product, 'count': count,
+                     'category_percent': _percent(count, total_count),
+                     'total_percent': _percent(count, total_all_upsells)}
+                    for rank, (product, count) in enumerate(top_products, 1)
+                ],
+            })
+        return {
+            'total_orders_with_upsells': stats['total_orders_with_upsells'],
+            'total_upsells': total_all_upsells,
+            'categories': categories,
+        }
+
+
+class QueryServer:
+    """
+    Сервер запросов к агрегатам: загружает заказы один раз, держит снимок агрегатов
+    в памяти и перестраивает его в фоне, когда файл заказов изменился
+    """
+
+    def __init__(self, options, max_combo_size=None, reload_interval=DEFAULT_RELOAD_INTERVAL):
+        """
+        Args:
+            options (dict): Параметры чтения заказов из pop_input_options()
+            max_combo_size (int): Максимальный размер комбинации (по умолчанию без ограничений)
+            reload_interval (float): Как часто проверять изменение файла (секунд)
+        """
+        self.options = options
+        self.max_combo_size = max_combo_size
+        self.reload_interval = reload_interval
+        self.snapshot = None
+        self.reloads = 0
+        # Подпись файлов, перезагрузка с которой не удалась: повтор - только после их изменения
+        self.failed_signature = None
+        self.routes = {
+            '/upsells': ReportSnapshot.upsells,
+            '/categories': ReportSnapshot.categories,
+            '/combos': ReportSnapshot.combos,
+            '/top': ReportSnapshot.top,
+        }
+
+    def load(self, signature=None):
+        """
+        Загружает заказы и считает агрегаты всех анализов за один перебор
+
+        Args:
+            signature (tuple): Подпись файлов, снятая до чтения (по умолчанию снимается здесь)
+
+        Raises:
+            OSError: Файл не читается
+            ValueError: В файле нет нужных колонок
+        """
+        started = time.perf_counter()
+        # Подпись снимается до чтения: изменение во время загрузки вызовет еще одну перезагрузку
+        if signature is None:
+            signature = input_signature(self.options)
+        paths = signature[0]
+        store = read_orders(dict(self.options, path=paths[0] if len(paths) == 1 else list(paths)))
+        stats = count_all(store, max_combo_size=self.max_combo_size)
+        return ReportSnapshot(stats, store.num_orders, signature, self.max_combo_size,
+                              time.perf_counter() - started)
+
+    async def watch(self):
+        """Перестраивает снимок, когда файл заказов изменился (старый снимок отвечает до замены)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            signature = None
+            try:
+                signature = input_signature(self.options)
+                if signature in (self.snapshot.signature, self.failed_signature):
+                    continue
+                snapshot = await loop.run_in_executor(None, self.load, signature)
+            except Exception as error:
+                # Любая ошибка (например, недописанная строка) не останавливает слежение:
+                # перезагрузка повторится, когда изменятся размер или время изменения файлов
+                self.failed_signature = signature
+                print(f"Ошибка перезагрузки, остаются прежние агрегаты: {type(error).__name__}: {error}")
+                continue
+            self.failed_signature = None
+            self.snapshot = snapshot
+            self.reloads += 1
+            print(f"Файлы заказов изменились: агрегаты пересчитаны "
+                  f"({snapshot.total_orders} заказов, {snapshot.load_seconds:.2f} с)")
+
+    def status(self):
+        """Состояние сервера и загруженного снимка"""
+        snapshot = self.snapshot
+        paths = snapshot.signature[0]
+        return {
+            'path': paths[0] if len(paths) == 1 else list(paths),
+            'total_orders': snapshot.total_orders,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(snapshot.loaded_at)),
+            'load_seconds': round(snapshot.load_seconds, 3),
+            'max_combo_size': snapshot.max_combo_size,
+            'reloads': self.reloads,
+        }
+
+    def respond(self, request_line):
+        """
+        Отвечает на строку запроса HTTP
+
+        Returns:
+            tuple: (HTTP статус, данные ответа для JSON)
+        """
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            return 400, {'error': 'некорректный запрос'}
+        method, target, _ = parts
+        if method != 'GET':
+            return 405, {'error': 'поддерживается только GET'}
+
+        url = urlsplit(target)
+        path = _utf8(unquote(url.path, encoding='latin-1'))
+        if path == '/status':
+            return 200, self.status()
+        query = self.routes.get(path)
+        if query is None:
+            return 404, {'error': f"неизвестный запрос '{path}'",
+                         'queries': ['/status'] + list(self.routes)}
+
+        params = {_utf8(name): [_utf8(value) for value in values]
+                  for name, values in parse_qs(url.query, encoding='latin-1').items()}
+        try:
+            return 200, query(self.snapshot, params)
+        except QueryError as error:
+            return error.status, {'error': str(error)}
+
+    async def handle(self, reader, writer):
+        """Обрабатывает одно подключение: один запрос, ответ в JSON, соединение закрывается"""
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не используются, но их нужно дочитать
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            status, payload = self.respond(request_line)
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n")
+            writer.write(head.encode('ascii') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        """Принимает запросы по TCP (host:port) или через Unix сокет (socket_path)"""
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+            print(f"Сервер принимает запросы через сокет '{socket_path}'")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"Сервер принимает запросы на http://{host}:{port}/")
+
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+if __name__ == "__main__":
+    # Обработка аргументов командной строки
+    options, args = pop_input_options(sys.argv[1:])
+    host = DEFAULT_HOST
+    port = DEFAULT_PORT
+    socket_path = None
+    max_combo_size = None
+    reload_interval = DEFAULT_RELOAD_INTERVAL
+
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--host':
+                host = args.pop(0)
+            elif arg == '--port':
+                port = int(args.pop(0))
+            elif arg == '--socket':
+                socket_path = args.pop(0)
+            elif arg == '--max-combo-size':
+                max_combo_size = int(args.pop(0))
+            elif arg == '--reload-interval':
+                reload_interval = float(args.pop(0))
+            else:
+                print(f"Ошибка: неизвестный аргумент '{arg}'")
+                print(USAGE)
+                sys.exit(1)
+    except (IndexError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    # Агрегаты пересчитываются по всему файлу при каждом его изменении
+    if options['incremental']:
+        print("Ошибка: --incremental не поддерживается сервером запросов")
+        sys.exit(1)
+
+    if max_combo_size is not None and max_combo_size < 2:
+        print("Ошибка: максимальный размер комбинации должен быть не менее 2")
+        sys.exit(1)
+
+    if reload_interval <= 0:
+        print("Ошибка: интервал проверки файла должен быть больше 0")
+        sys.exit(1)
+
+    server = QueryServer(options, max_combo_size, reload_interval)
+    print(f"Загружаю заказы из '{describe_inputs(options['path'])}'...")
+    try:
+        server.snapshot = server.load()
+    except (OSError, ValueError) as error:
+        print(f"Ошибка: {error}")
+        sys.exit(1)
+    print(f"Загружено {server.snapshot.total_orders} заказов за {server.snapshot.load_seconds:.2f} с")
+
+    try:
+        asyncio.run(server.serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        print("\nСервер остановлен")